@@ -0,0 +1,136 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+import metrics
+from broadcast import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits: ~30 msg/s overall, ~1 msg/s per private chat, 20 msg/min per group
+GLOBAL_RATE = 30.0
+PRIVATE_CHAT_RATE = 1.0
+GROUP_CHAT_RATE = 20 / 60
+CHAT_BURST = 3
+MAX_CHAT_BUCKETS = 10000
+# Methods that change something already sent: only the global bucket paces
+# them, so a group's queue of new posts cannot delay a decision
+CHAT_UNPACED_METHODS = frozenset({
+    'editMessageText',
+    'editMessageCaption',
+    'editMessageMedia',
+    'editMessageReplyMarkup',
+    'deleteMessage',
+    'deleteMessages',
+})
+# Methods safe to repeat when a network error leaves their outcome unknown;
+# a timed-out send may have been delivered, so sends are not retried then
+IDEMPOTENT_PREFIXES = ('get', 'edit', 'set', 'delete')
+IDEMPOTENT_METHODS = frozenset({'answerCallbackQuery'})
+
+api_duration = metrics.registry.histogram(
+    "bot_api_request_duration_seconds", "Bot API call latency, by method.", ("method",)
+)
+api_errors = metrics.registry.counter("bot_api_errors_total", "Failed Bot API calls, by method and error.", ("method", "error"))
+api_flood_waits = metrics.registry.counter("bot_api_retry_after_total", "429 responses from the Bot API, by method.", ("method",))
+api_retries = metrics.registry.counter("bot_api_retries_total", "Retried Bot API calls, by method.", ("method",))
+
+
+class ApiCallMiddleware(BaseRequestMiddleware):
+    """Session middleware shared by every outgoing Bot API call.
+
+    - records latency, errors and 429s per API method
+    - retries 429s after `retry_after` and 5xx errors with jittered
+      exponential backoff, and network errors (timeouts included) only for
+      idempotent methods
+    - paces calls that target a chat through one global token bucket and a
+      token bucket per chat, so bursts queue up instead of failing; edits
+      only wait for the global bucket
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        global_rate: float = GLOBAL_RATE,
+        rate_limit: bool = True,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.rate_limit = rate_limit
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                # Forget the oldest chats; a new bucket starts full anyway
+                for key in list(self._chat_buckets)[:MAX_CHAT_BUCKETS // 10]:
+                    del self._chat_buckets[key]
+            rate = GROUP_CHAT_RATE if chat_id < 0 else PRIVATE_CHAT_RATE
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, capacity=CHAT_BURST)
+        return bucket
+
+    @staticmethod
+    def _target_chat(method: TelegramMethod) -> Optional[int]:
+        chat_id = getattr(method, 'chat_id', None)
+        return chat_id if isinstance(chat_id, int) else None
+
+    async def _backoff(self, attempt: int) -> None:
+        delay = self.base_delay * (2 ** attempt)
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        chat_id = self._target_chat(method)
+        paced = chat_id is not None and name not in CHAT_UNPACED_METHODS
+        idempotent = name.startswith(IDEMPOTENT_PREFIXES) or name in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            if self.rate_limit and paced:
+                await self._chat_bucket(chat_id).acquire()
+            if self.rate_limit and chat_id is not None:
+                await self.global_bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = await make_request(bot, method)
+                api_duration.observe(time.perf_counter() - start, name)
+                return response
+            except TelegramRetryAfter as e:
+                api_duration.observe(time.perf_counter() - start, name)
+                api_flood_waits.inc(name)
+                if attempt >= self.max_retries:
+                    api_errors.inc(name, type(e).__name__)
+                    raise
+                logger.warning(f"{name} hit flood limit, retrying in {e.retry_after}s")
+                # A 429 can be global: hold back every sender (broadcast pool included), not just this chat
+                self.global_bucket.pause(e.retry_after)
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(e.retry_after)
+                await asyncio.sleep(e.retry_after + random.uniform(0, 0.5))
+            except (TelegramNetworkError, TelegramServerError) as e:
+                api_duration.observe(time.perf_counter() - start, name)
+                if attempt >= self.max_retries or (isinstance(e, TelegramNetworkError) and not idempotent):
+                    api_errors.inc(name, type(e).__name__)
+                    raise
+                logger.warning(f"{name} failed ({e}), retrying")
+                await self._backoff(attempt)
+            except Exception as e:
+                api_duration.observe(time.perf_counter() - start, name)
+                api_errors.inc(name, type(e).__name__)
+                raise
+            attempt += 1
+            api_retries.inc(name)
@@ -0,0 +1,189 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Iterable, List, MutableMapping, Optional, Tuple
+
+REGULAR_SESSIONS = 2  # sessions attended before an unconfirmed name counts as a member
+SESSION_MEETING = 'meeting'
+SESSION_INITIATIVE = 'initiative'
+
+SESSION_LABELS = {
+    SESSION_MEETING: 'اجتماع',
+    SESSION_INITIATIVE: 'مبادرة',
+}
+
+
+def name_key(name: str) -> str:
+    """Key a typed volunteer name by its words, ignoring extra spaces."""
+    return " ".join(name.split())
+
+
+def parse_names(text: str) -> List[str]:
+    """Split a submitted list (comma, Arabic comma or one name per line) into names."""
+    for separator in ('،', '\n'):
+        text = text.replace(separator, ',')
+    names = []
+    for name in text.split(','):
+        name = name_key(name)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class AttendanceRegistry:
+    """Attendance sessions with a volunteer -> sessions index and running statistics.
+
+    `sessions` is any mapping of session_id -> record dict (normally a
+    PersistentDict). The index and counters are built from it on first use
+    and then updated as sessions are recorded, so statistics never rescan
+    history. `key` maps a submitted name to the volunteer it belongs to and
+    `label` gives the name to show for a volunteer (defaults to the first
+    spelling submitted). `allocate` gives new session ids (default: the
+    next number after the largest known id); ids must grow with time.
+    `everyone` lists the confirmed volunteers; with it, reports cover them
+    (absent ones included) plus anyone else who attended REGULAR_SESSIONS
+    sessions, so one-off guests and misspelled names are left out.
+    """
+
+    def __init__(
+        self,
+        sessions: MutableMapping[int, Dict],
+        key: Callable[[str], Hashable] = name_key,
+        label: Optional[Callable[[Hashable], str]] = None,
+        allocate: Optional[Callable[[], int]] = None,
+        everyone: Optional[Callable[[], Iterable[Hashable]]] = None,
+    ):
+        self._sessions = sessions
+        self.key = key
+        self.label = label
+        self.allocate = allocate
+        self.everyone = everyone
+        self.reload()
+
+    def reload(self) -> None:
+        """Drop the index and statistics; they are rebuilt from the sessions on next use."""
+        self._built = False
+        # volunteer -> session ids, oldest first
+        self._by_volunteer: Dict[Hashable, List[int]] = defaultdict(list)
+        # volunteer -> (month, session type) -> sessions attended
+        self._attended: Dict[Hashable, Dict[Tuple[str, str], int]] = defaultdict(lambda: defaultdict(int))
+        # volunteer -> session type -> last session id attended
+        self._last_seen: Dict[Hashable, Dict[str, int]] = defaultdict(dict)
+        # (month, session type) -> sessions held
+        self._held: Dict[Tuple[str, str], int] = defaultdict(int)
+        # session type -> session ids, oldest first
+        self._by_type: Dict[Hashable, List[int]] = defaultdict(list)
+        self._names: Dict[Hashable, str] = {}
+        self._last_id = 0
+
+    def _build(self) -> None:
+        # Built on first use so a cold start does not pay for it
+        if not self._built:
+            self._built = True
+            for session_id in sorted(self._sessions):
+                self._index(self._sessions[session_id])
+
+    def _index(self, session: Dict) -> None:
+        session_id, session_type, month = session['id'], session['type'], session['date'][:7]
+        self._last_id = max(self._last_id, session_id)
+        self._held[(month, session_type)] += 1
+        self._by_type[session_type].append(session_id)
+        for volunteer, name in zip(session['volunteers'], session['names']):
+            self._by_volunteer[volunteer].append(session_id)
+            self._attended[volunteer][(month, session_type)] += 1
+            self._last_seen[volunteer][session_type] = session_id
+            self._names.setdefault(volunteer, name)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def record(self, session_type: str, names: Iterable[str], by: Optional[int] = None,
+               when: Optional[datetime] = None) -> Dict:
+        self._build()
+        kept, volunteers = [], []
+        for name in names:
+            volunteer = self.key(name)
+            if volunteer not in volunteers:
+                kept.append(name)
+                volunteers.append(volunteer)
+        session = {
+            'id': self.allocate() if self.allocate is not None else self._last_id + 1,
+            'type': session_type,
+            'date': (when or datetime.now()).strftime('%Y-%m-%d %H:%M'),
+            'names': kept,
+            'volunteers': volunteers,
+            'by': by,
+        }
+        self._sessions[session['id']] = session
+        self._index(session)
+        return session
+
+    def get(self, session_id: int) -> Optional[Dict]:
+        return self._sessions.get(session_id)
+
+    def sessions_of(self, volunteer: Hashable) -> List[Dict]:
+        """Sessions the volunteer attended, newest first."""
+        self._build()
+        return [self._sessions[session_id] for session_id in reversed(self._by_volunteer.get(volunteer, []))]
+
+    def display_name(self, volunteer: Hashable) -> str:
+        if self.label is not None:
+            return self.label(volunteer)
+        self._build()
+        return self._names.get(volunteer, str(volunteer))
+
+    def volunteers(self) -> List[Hashable]:
+        self._build()
+        return list(self._by_volunteer)
+
+    def members(self) -> List[Hashable]:
+        """Volunteers the reports cover (everyone seen when `everyone` is not given)."""
+        self._build()
+        if self.everyone is None:
+            return list(self._by_volunteer)
+        members = dict.fromkeys(self.everyone())
+        for volunteer, sessions in self._by_volunteer.items():
+            if len(sessions) >= REGULAR_SESSIONS:
+                members[volunteer] = None
+        return list(members)
+
+    def monthly_rates(self, month: str, session_type: str = SESSION_MEETING) -> List[Tuple[Hashable, int, int]]:
+        """(volunteer, attended, held) for every member, best attendance first."""
+        held = self._held.get((month, session_type), 0)
+        rows = [
+            (volunteer, self._attended.get(volunteer, {}).get((month, session_type), 0), held)
+            for volunteer in self.members()
+        ]
+        rows.sort(key=lambda row: (-row[1], self.display_name(row[0])))
+        return rows
+
+    def missed_last(self, count: int, session_type: str = SESSION_MEETING) -> List[Hashable]:
+        """Volunteers who attended none of the last `count` sessions of this type."""
+        self._build()
+        sessions = self._by_type.get(session_type, [])
+        if len(sessions) < count:
+            return []
+        cutoff = sessions[-count]
+        return [
+            volunteer for volunteer in self.members()
+            if self._last_seen.get(volunteer, {}).get(session_type, 0) < cutoff
+        ]
+
+
+def format_monthly_rates(registry: AttendanceRegistry, month: str, session_type: str = SESSION_MEETING) -> str:
+    rows = registry.monthly_rates(month, session_type)
+    label = SESSION_LABELS.get(session_type, session_type)
+    if not rows or rows[0][2] == 0:
+        return f"لا توجد جلسات {label} مسجلة في {month}."
+    lines = [f"نسبة حضور ال{label} لشهر {month} (عدد الجلسات: {rows[0][2]}):", ""]
+    for volunteer, attended, held in rows:
+        lines.append(f"- {registry.display_name(volunteer)}: {attended}/{held} ({attended * 100 // held}%)")
+    return "\n".join(lines)
+
+
+def format_missed(registry: AttendanceRegistry, count: int, session_type: str = SESSION_MEETING) -> str:
+    label = SESSION_LABELS.get(session_type, session_type)
+    missed = registry.missed_last(count, session_type)
+    if not missed:
+        return f"لا يوجد من غاب عن آخر {count} جلسات {label}. 🌟"
+    names = sorted(registry.display_name(volunteer) for volunteer in missed)
+    return f"الغائبون عن آخر {count} جلسات {label}:\n\n" + "\n".join(f"- {name}" for name in names)
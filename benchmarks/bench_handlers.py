@@ -0,0 +1,451 @@
+"""Per-handler micro-benchmarks with allocation tracking and regression checks.
+
+Usage: python benchmarks/bench_handlers.py [--iterations 200] [--save]
+                                          [--baseline PATH] [--time-threshold 1.0]
+                                          [--alloc-threshold 0.2]
+
+Every handler registered on the dispatcher or the button router has a
+scenario: the user is driven into the right FSM state (and any request or
+photo the handler needs is created), then one Update is fed straight into
+dp.feed_update with a mocked Bot session (no network). Only that last
+update is measured. The script refuses to run while a handler has no
+scenario.
+
+Times are stored as ratios to a fixed pure-Python calibration loop run
+between the measured updates, so a baseline saved on one machine holds on
+another and a machine slowing down mid-run does not show as a regression.
+Allocations are traced in a separate pass (so tracing does not distort
+the timings) as the bytes an update leaves allocated and the peak it
+reaches above the memory in use before it. Those counts barely change
+from run to run, while the time ratios still move by up to ~1.5x on a
+busy single-core runner, hence the looser default time threshold.
+
+Results are compared against the JSON baseline; the script exits with
+status 1 when a handler is slower or allocates more than the thresholds
+allow, or when there is no baseline to compare with. --save writes the
+current results as the new baseline instead (commit it with the change).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import tempfile
+import statistics
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Union
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bot-bench-")
+os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+os.environ['DB_PATH'] = os.path.join(TMP_DIR, 'bot.db')
+# Unpaced, so the broadcasts admin_broadcast_message starts finish between iterations
+os.environ['BROADCAST_RATE'] = '1000000'
+
+import logging
+logging.disable(logging.WARNING)
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Message, Update
+
+import main
+import metrics
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'handlers.json')
+ADMIN_ID = main.ADMIN_IDS[-1]
+USER_ID = 20_000_000
+CALIBRATION_SIZE = 2000
+ALLOC_SLACK = 512  # bytes; retained memory of a few hundred bytes is noise from caches warming up
+BENCH_PHOTOS = 12  # more than one page, so the paging handlers have a next page
+
+Text = Union[str, Callable[[], str]]
+
+
+class Scenario(NamedTuple):
+    user_id: int
+    setup: List[str]  # texts that bring the user to the handler's state
+    event: Callable[[int], Update]  # builds the measured update for the user
+    before: Optional[Callable[[], Awaitable[None]]] = None  # creates what the handler works on
+
+
+_ids = itertools.count(1)
+
+
+def _resolve(value: Text) -> str:
+    return value() if callable(value) else value
+
+
+def make_update(user_id: int, text: str) -> Update:
+    return Update.model_validate({
+        'update_id': next(_ids),
+        'message': {
+            'message_id': next(_ids),
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench', 'language_code': 'ar'},
+            'text': text,
+        },
+    }, context={'bot': main.bot})
+
+
+def text(value: Text) -> Callable[[int], Update]:
+    return lambda user_id: make_update(user_id, _resolve(value))
+
+
+def photo() -> Callable[[int], Update]:
+    def build(user_id: int) -> Update:
+        return Update.model_validate({
+            'update_id': next(_ids),
+            'message': {
+                'message_id': next(_ids),
+                'date': 0,
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+                'photo': [{'file_id': 'bench-upload', 'file_unique_id': 'bench-upload', 'width': 1280, 'height': 960}],
+            },
+        }, context={'bot': main.bot})
+    return build
+
+
+def callback(data: Text, chat_id: Optional[int] = None) -> Callable[[int], Update]:
+    """A button press on a bot message in `chat_id` (the user's private chat by default)."""
+    def build(user_id: int) -> Update:
+        return Update.model_validate({
+            'update_id': next(_ids),
+            'callback_query': {
+                'id': str(next(_ids)),
+                'chat_instance': 'bench',
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+                'data': _resolve(data),
+                'message': {
+                    'message_id': next(_ids),
+                    'date': 0,
+                    'chat': {'id': chat_id or user_id, 'type': 'group' if chat_id else 'private'},
+                    'text': 'طلب تجريبي',
+                },
+            },
+        }, context={'bot': main.bot})
+    return build
+
+
+def steps(user_id: int, handlers: List[str], texts: List[str], prefix: List[str] = ()) -> Dict[str, Scenario]:
+    """Scenarios for consecutive form steps; each is measured after the steps before it."""
+    prefix = list(prefix)
+    return {name: Scenario(user_id, prefix + texts[:i], text(texts[i])) for i, name in enumerate(handlers)}
+
+
+def latest_request(user_id: int) -> int:
+    return main.request_registry.for_user(user_id, limit=1)[0]['request_id']
+
+
+EXCUSE = ["اعتذار", "متطوع تجريبي", "اجتماع", "ظرف طارئ", "تأكيد الطلب"]
+LEAVE = ["إجازة", "متطوع تجريبي", "سفر", "3", "2026-11-01", "2026-11-03", "تأكيد الطلب"]
+INITIATIVE = ["مبادرة", "مقدمة", "أهداف", "الفئة", "الخطة", "الموارد", "الشركاء", "الجدول", "قياس النجاح"]
+
+
+async def new_request() -> None:
+    await prepare(USER_ID, EXCUSE)
+
+
+async def add_photos() -> None:
+    for i in range(BENCH_PHOTOS):
+        main.team_photos.setdefault(f"bench-{i}", {'file_id': f"bench-photo-{i}"})
+
+
+async def select_photos() -> None:
+    await add_photos()
+    state = main.dp.fsm.get_context(main.bot, ADMIN_ID, ADMIN_ID)
+    await state.update_data(photo_selection=["bench-0"], photo_offset=0)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    'start_handler': Scenario(USER_ID, [], text("/start")),
+    'back_to_main': Scenario(USER_ID, ["اعتذار"], text("رجوع")),
+    **steps(USER_ID, ['excuse_start', 'excuse_name', 'excuse_activity_type', 'excuse_reason', 'confirm_excuse'], EXCUSE),
+    **steps(
+        USER_ID,
+        ['leave_start', 'leave_name', 'leave_reason', 'leave_duration', 'leave_start_date', 'leave_end_date', 'confirm_leave'],
+        LEAVE,
+    ),
+    'feedback_start': Scenario(USER_ID, [], text("اقتراحات")),
+    'feedback_bot_start': Scenario(USER_ID, ["اقتراحات"], text("اقتراح تطوير البوت")),
+    'feedback_bot_message': Scenario(USER_ID, ["اقتراحات", "اقتراح تطوير البوت"], text("اقتراح تجريبي")),
+    'feedback_secret_start': Scenario(USER_ID, ["اقتراحات"], text("آخر")),
+    'feedback_secret_message': Scenario(USER_ID, ["اقتراحات", "آخر"], text("تقييم تجريبي")),
+    'feedback_initiative_start': Scenario(USER_ID, ["اقتراحات"], text("اقتراح مبادرة")),
+    **steps(
+        USER_ID,
+        [
+            'feedback_initiative_name', 'feedback_initiative_intro', 'feedback_initiative_goals',
+            'feedback_initiative_target', 'feedback_initiative_plan', 'feedback_initiative_resources',
+            'feedback_initiative_partners', 'feedback_initiative_timeline', 'feedback_initiative_success',
+        ],
+        INITIATIVE,
+        prefix=["اقتراحات", "اقتراح مبادرة"],
+    ),
+    'track_start': Scenario(USER_ID, [], text("تتبع طلباتي")),
+    'track_request_details': Scenario(USER_ID, ["تتبع طلباتي"], text(lambda: str(latest_request(USER_ID)))),
+    'references_handler': Scenario(USER_ID, [], text("مراجع الفريق")),
+    'code_of_conduct': Scenario(USER_ID, [], text("مدونة السلوك")),
+    'rules': Scenario(USER_ID, [], text("بنود وقوانين الفريق")),
+    'phrase_handler': Scenario(USER_ID, [], text("أهدني عبارة")),
+    'dhikr_handler': Scenario(USER_ID, [], text("لا تنس ذكر الله")),
+    'inquiries_handler': Scenario(USER_ID, [], text("استعلامات")),
+    'inquire_meeting': Scenario(USER_ID, [], text("استعلام عن اجتماع")),
+    'meeting_general': Scenario(USER_ID, [], text("الاجتماع العام")),
+    'meeting_support1': Scenario(USER_ID, [], text("اجتماع فريق الدعم الاول")),
+    'meeting_support2': Scenario(USER_ID, [], text("اجتماع فريق الدعم الثاني")),
+    'meeting_central': Scenario(USER_ID, [], text("اجتماع الفريق المركزي")),
+    'download_team_photos': Scenario(USER_ID, [], text("تحميل صور الفريق الاخيرة"), add_photos),
+    'download_team_photos_page': Scenario(USER_ID, [], callback("photos_page_10"), add_photos),
+    'approve_request': Scenario(
+        ADMIN_ID, [], callback(lambda: f"approve_excuse_{latest_request(USER_ID)}_{USER_ID}", main.EXCUSE_GROUP_ID),
+        new_request,
+    ),
+    'reject_request': Scenario(
+        ADMIN_ID, [], callback(lambda: f"reject_excuse_{latest_request(USER_ID)}_{USER_ID}", main.EXCUSE_GROUP_ID),
+        new_request,
+    ),
+    'check_webhook': Scenario(ADMIN_ID, [], text("/webhook")),
+    'admin_panel': Scenario(ADMIN_ID, [], text("/admin")),
+    'admin_general': Scenario(ADMIN_ID, [], text("وضع موعد الاجتماع العام")),
+    'admin_support1': Scenario(ADMIN_ID, [], text("وضع موعد دعم أول")),
+    'admin_support2': Scenario(ADMIN_ID, [], text("وضع موعد دعم ثاني")),
+    'admin_central': Scenario(ADMIN_ID, [], text("وضع موعد مركزي")),
+    'admin_set_date': Scenario(ADMIN_ID, ["وضع موعد الاجتماع العام"], text("2026-11-05 18:30 أسبوعي")),
+    'admin_broadcast_start': Scenario(ADMIN_ID, [], text("إرسال بث للجميع")),
+    'admin_broadcast_audience': Scenario(ADMIN_ID, ["إرسال بث للجميع"], text("الجميع")),
+    'admin_broadcast_message': Scenario(ADMIN_ID, ["إرسال بث للجميع", "الجميع"], text("رسالة تجريبية")),
+    'admin_send_user_msg_start': Scenario(ADMIN_ID, [], text("إرسال رسالة لمستخدم")),
+    'admin_waiting_user_id': Scenario(ADMIN_ID, ["إرسال رسالة لمستخدم"], text(str(USER_ID))),
+    'admin_send_user_message': Scenario(ADMIN_ID, ["إرسال رسالة لمستخدم", str(USER_ID)], text("رسالة تجريبية")),
+    'admin_attendance_start': Scenario(ADMIN_ID, [], text("تفقد")),
+    'attendance_meeting': Scenario(ADMIN_ID, ["تفقد"], text("تفقد اجتماع")),
+    'attendance_initiative': Scenario(ADMIN_ID, ["تفقد"], text("تفقد مبادرة")),
+    'admin_attendance_names': Scenario(
+        ADMIN_ID, ["تفقد", "تفقد اجتماع"], text("أحمد محمد, فاطمة علي, سارة خالد, محمود حسن")
+    ),
+    'admin_leave_calendar_start': Scenario(ADMIN_ID, [], text("تقويم الإجازات")),
+    'admin_leave_calendar': Scenario(ADMIN_ID, ["تقويم الإجازات"], text("2026-11-01 2026-11-30")),
+    'attendance_monthly_rates': Scenario(ADMIN_ID, [], text("نسبة الحضور هذا الشهر")),
+    'attendance_missed_meetings': Scenario(ADMIN_ID, [], text("الغائبون عن آخر 3 اجتماعات")),
+    'admin_upload_photos_start': Scenario(ADMIN_ID, [], text("رفع صور الفريق")),
+    'admin_upload_photo': Scenario(ADMIN_ID, ["رفع صور الفريق"], photo()),
+    'admin_upload_photo_invalid': Scenario(ADMIN_ID, ["رفع صور الفريق"], text("ليست صورة")),
+    'admin_delete_photos_start': Scenario(ADMIN_ID, [], text("حذف صور الفريق"), add_photos),
+    'toggle_photo_selection': Scenario(ADMIN_ID, [], callback("photo_toggle:bench-1"), select_photos),
+    'photo_delete_next_page': Scenario(ADMIN_ID, [], callback("photo_delete_page:10"), select_photos),
+    'delete_selected_photos': Scenario(ADMIN_ID, [], callback("photo_delete_selected"), select_photos),
+    'cancel_photo_delete': Scenario(ADMIN_ID, [], callback("photo_delete_cancel"), select_photos),
+}
+
+
+def registered_handlers() -> Set[str]:
+    """Names of every handler an update can reach."""
+    names = {handler.callback.__name__ for handler in main.text_router.handlers()}
+    routers = [main.dp]
+    while routers:
+        router = routers.pop()
+        routers.extend(router.sub_routers)
+        for event_name, observer in router.observers.items():
+            if event_name == 'update':
+                continue  # the dispatcher's own entry point, not a bot handler
+            names.update(handler.callback.__name__ for handler in observer.handlers)
+    return names
+
+
+class MockSession(BaseSession):
+    """Answers every Bot API method locally with a minimal valid result."""
+
+    def __init__(self):
+        super().__init__()
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        returning = method.__returning__
+        if returning is Message:
+            chat_id = getattr(method, 'chat_id', 1)
+            result = {
+                'message_id': next(self._message_ids),
+                'date': 0,
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+                'text': '',
+            }
+            if hasattr(method, 'document'):
+                result['document'] = {'file_id': 'bench-document', 'file_unique_id': 'bench-document'}
+            return Message.model_validate(result, context={'bot': bot})
+        if returning is bool:
+            return True
+        return None
+
+    async def stream_content(self, *args, **kwargs):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+async def prepare(user_id: int, texts: List[str]) -> None:
+    state = main.dp.fsm.get_context(main.bot, user_id, user_id)
+    await state.clear()
+    for value in texts:
+        await main.dp.feed_update(main.bot, make_update(user_id, value))
+    await settle()
+
+
+async def settle() -> None:
+    """Let handler side tasks (admin notifications, broadcasts) finish outside the measurement."""
+    await asyncio.sleep(0)
+    while main.background_tasks:
+        await asyncio.gather(*main.background_tasks, return_exceptions=True)
+
+
+async def setup_scenario(scenario: Scenario) -> Update:
+    if scenario.before is not None:
+        await scenario.before()
+    await prepare(scenario.user_id, scenario.setup)
+    if scenario.before is not None and scenario.setup:
+        await settle()
+    return scenario.event(scenario.user_id)
+
+
+def calibrate() -> float:
+    """Time one run of a fixed pure-Python loop (dicts, strings, calls), the unit handler times are stored in."""
+    start = time.perf_counter()
+    table = {}
+    for i in range(CALIBRATION_SIZE):
+        table[f"key-{i}"] = [i, str(i)]
+    sum(len(value[1]) for value in table.values())
+    return time.perf_counter() - start
+
+
+def handled(name: str) -> int:
+    """Calls of a handler so far, with failed ones counted negative."""
+    series = metrics.handler_duration.values.get((name,))
+    return (sum(series[:-1]) if series else 0) - 2 * metrics.handler_errors.values.get((name,), 0)
+
+
+async def check_scenario(name: str) -> None:
+    """Fail loudly when a scenario stops reaching its handler (e.g. after a flow change)."""
+    scenario = SCENARIOS[name]
+    update = await setup_scenario(scenario)
+    before = handled(name)
+    await main.dp.feed_update(main.bot, update)
+    await settle()
+    if handled(name) != before + 1:
+        raise RuntimeError(f"Scenario {name} did not run its handler successfully")
+
+
+async def bench_scenario(name: str, iterations: int) -> Dict[str, float]:
+    scenario = SCENARIOS[name]
+    await check_scenario(name)
+    timings, calibrations = [], []
+    for _ in range(iterations):
+        update = await setup_scenario(scenario)
+        start = time.perf_counter()
+        await main.dp.feed_update(main.bot, update)
+        timings.append(time.perf_counter() - start)
+        await settle()
+        # Interleaved with the updates, so the ratio follows the machine's speed as it drifts during the run
+        calibrations.append(calibrate())
+
+    retained, peaks = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(max(10, iterations // 10)):
+            update = await setup_scenario(scenario)
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await main.dp.feed_update(main.bot, update)
+            after, peak = tracemalloc.get_traced_memory()
+            retained.append(after - before)
+            peaks.append(peak - before)
+            await settle()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    median = statistics.median(timings)
+    calibration = statistics.median(calibrations)
+    return {
+        'median_us': round(median * 1e6, 1),
+        'p95_us': round(timings[int(len(timings) * 0.95) - 1] * 1e6, 1),
+        'calibration_us': round(calibration * 1e6, 1),
+        'time_ratio': round(median / calibration, 4),
+        'alloc_bytes': int(statistics.median(retained)),
+        'peak_alloc_bytes': int(statistics.median(peaks)),
+    }
+
+
+def compare(results: Dict, baseline: Dict, time_threshold: float, alloc_threshold: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            regressions.append(f"{name}: not in the baseline")
+            continue
+        if current['time_ratio'] > previous['time_ratio'] * (1 + time_threshold):
+            regressions.append(
+                f"{name}: median {previous['time_ratio']} -> {current['time_ratio']} calibration loops "
+                f"({current['median_us']} us now)"
+            )
+        for key, label in (('alloc_bytes', 'allocations kept'), ('peak_alloc_bytes', 'peak allocations')):
+            if current[key] > max(previous[key], 0) * (1 + alloc_threshold) + ALLOC_SLACK:
+                regressions.append(f"{name}: {label} {previous[key]} -> {current[key]} bytes per update")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> int:
+    missing = sorted(registered_handlers() - set(SCENARIOS))
+    if missing:
+        print(f"No scenario for handlers: {', '.join(missing)}")
+        return 1
+
+    main.bot.session = MockSession()
+    results = {}
+    print(f"{'handler':<30} {'median':>10} {'p95':>10} {'ratio':>8} {'kept':>8} {'peak':>9}")
+    for name in SCENARIOS:
+        results[name] = result = await bench_scenario(name, args.iterations)
+        print(
+            f"{name:<30} {result['median_us']:>8.0f}us {result['p95_us']:>8.0f}us {result['time_ratio']:>8.3f} "
+            f"{result['alloc_bytes']:>7}B {result['peak_alloc_bytes']:>8}B"
+        )
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save to create it.")
+        return 1
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.time_threshold, args.alloc_threshold)
+    if regressions:
+        print("Regressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("No regressions against baseline.")
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help="overwrite the baseline with this run")
+    parser.add_argument('--time-threshold', type=float, default=1.0,
+                        help="allowed relative slowdown, in calibration-loop units")
+    parser.add_argument('--alloc-threshold', type=float, default=0.2, help="allowed relative allocation growth")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
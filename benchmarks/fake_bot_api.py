@@ -0,0 +1,87 @@
+"""A local stand-in for the Telegram Bot API, for load tests.
+
+It answers /bot<token>/<method> with well-formed results after a
+configurable latency, can inject 429 responses, and records every message
+sent to a chat so a load generator can wait for the bot's reply.
+"""
+import time
+import random
+import asyncio
+import itertools
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.02, jitter: float = 0.01, flood_rate: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.floods = 0
+        self._message_ids = itertools.count(1)
+        self._replies: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    def replies(self, chat_id: int) -> asyncio.Queue:
+        """Queue of arrival times of messages sent to `chat_id`."""
+        return self._replies[chat_id]
+
+    def _message(self, chat_id: int, **extra: Any) -> Dict[str, Any]:
+        chat_type = 'private' if chat_id > 0 else 'group'
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': chat_type, 'title': None if chat_id > 0 else 'group'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'bot'},
+            **extra,
+        }
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        chat_id = int(params.get('chat_id', 0) or 0)
+        if method in ('sendMessage', 'editMessageText', 'copyMessage'):
+            if method == 'copyMessage':
+                return {'message_id': next(self._message_ids)}
+            return self._message(chat_id, text=params.get('text', ''))
+        if method in ('sendPhoto', 'sendDocument'):
+            photo = [{'file_id': 'fake', 'file_unique_id': 'fake', 'width': 1, 'height': 1}]
+            return self._message(chat_id, photo=photo)
+        if method == 'sendMediaGroup':
+            return [self._message(chat_id, photo=[{'file_id': 'f', 'file_unique_id': 'f', 'width': 1, 'height': 1}])]
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'fake_bot'}
+        return True
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == 'application/json':
+            return await request.json()
+        form = await request.post()
+        return {key: value for key, value in form.items() if isinstance(value, str)}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = await self._params(request)
+        self.calls[method] += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if self.flood_rate and random.random() < self.flood_rate:
+            self.floods += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }, status=429)
+        result = self._result(method, params)
+        if method in ('sendMessage', 'sendPhoto', 'sendMediaGroup', 'sendDocument', 'copyMessage'):
+            chat_id = int(params.get('chat_id', 0) or 0)
+            self._replies[chat_id].put_nowait(time.perf_counter())
+        return web.json_response({'ok': True, 'result': result})
+
+    def summary(self) -> List[str]:
+        return [f"{method}: {count}" for method, count in sorted(self.calls.items())]
@@ -0,0 +1,167 @@
+"""End-to-end webhook load test against a local fake Bot API.
+
+Usage: python benchmarks/loadtest.py [--users 2000] [--concurrency 200]
+                                    [--api-latency 0.02] [--flood-rate 0.0]
+                                    [--no-rate-limit]
+
+Starts the bot's aiohttp app (main.build_app) and benchmarks/fake_bot_api.py
+on local ports, then lets virtual users walk complete excuse, leave and
+initiative flows by POSTing Update payloads to /webhook. Each step waits
+for the bot's reply to arrive at the fake API, so the reported latency is
+webhook-to-reply, like a real user would see it.
+
+Outgoing rate limits stay on, as in production; --no-rate-limit turns them
+off to measure the bot alone rather than Telegram's limits.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import itertools
+import tempfile
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bot-loadtest-")
+os.environ.setdefault('BOT_TOKEN', '123456:LOADTEST')
+os.environ.setdefault('WEBHOOK_SECRET', 'loadtest')
+os.environ['DB_PATH'] = os.path.join(TMP_DIR, 'bot.db')
+
+import logging
+logging.disable(logging.WARNING)
+
+from aiohttp import ClientSession, web
+from aiogram.client.telegram import TelegramAPIServer
+
+from fake_bot_api import FakeBotAPI
+
+import main
+
+USER_ID_BASE = 10_000_000
+
+FLOWS: Dict[str, List[str]] = {
+    'excuse': ["اعتذار", "متطوع تجريبي", "اجتماع", "ظرف طارئ", "تأكيد الطلب"],
+    'leave': ["إجازة", "متطوع تجريبي", "سفر", "3", "2026-11-01", "2026-11-03", "تأكيد الطلب"],
+    'initiative': [
+        "اقتراحات", "اقتراح مبادرة", "مبادرة تجريبية", "مقدمة", "أهداف", "الفئة",
+        "الخطة", "الموارد", "الشركاء", "الجدول", "قياس النجاح",
+    ],
+}
+
+_update_ids = itertools.count(1)
+
+
+def make_update(user_id: int, text: str) -> Dict:
+    return {
+        'update_id': next(_update_ids),
+        'message': {
+            'message_id': next(_update_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': 'VU'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'VU', 'language_code': 'ar'},
+            'text': text,
+        },
+    }
+
+
+class Results:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.acks: List[float] = []
+        self.timeouts = 0
+        self.http_errors = 0
+        self.flows_done = 0
+
+
+async def virtual_user(session: ClientSession, url: str, api: FakeBotAPI, user_id: int, flow: List[str],
+                       results: Results, reply_timeout: float) -> None:
+    replies = api.replies(user_id)
+    headers = {'X-Telegram-Bot-Api-Secret-Token': os.environ['WEBHOOK_SECRET']}
+    for text in flow:
+        sent = time.perf_counter()
+        async with session.post(url, json=make_update(user_id, text), headers=headers) as response:
+            await response.read()
+            if response.status != 200:
+                results.http_errors += 1
+                return
+        results.acks.append(time.perf_counter() - sent)
+        try:
+            replied = await asyncio.wait_for(replies.get(), reply_timeout)
+        except asyncio.TimeoutError:
+            results.timeouts += 1
+            return
+        results.latencies.append(replied - sent)
+    results.flows_done += 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def start_site(app: web.Application, port: int) -> Tuple[web.AppRunner, int]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+async def run(args: argparse.Namespace) -> None:
+    api = FakeBotAPI(latency=args.api_latency, flood_rate=args.flood_rate)
+    api_runner, api_port = await start_site(api.app, 0)
+    main.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}")
+    main.api_middleware.rate_limit = not args.no_rate_limit
+
+    bot_runner, bot_port = await start_site(main.build_app(), 0)
+    url = f"http://127.0.0.1:{bot_port}/webhook"
+    # Let the background startup tasks (webhook check, admin notices) settle
+    await asyncio.sleep(0.5)
+
+    results = Results()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    flow_names = list(FLOWS)
+
+    async def limited(session: ClientSession, index: int) -> None:
+        async with semaphore:
+            flow = FLOWS[flow_names[index % len(flow_names)]]
+            await virtual_user(session, url, api, USER_ID_BASE + index, flow, results, args.reply_timeout)
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(limited(session, i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    steps = len(results.latencies)
+    print(f"virtual users:     {args.users} (concurrency {args.concurrency})")
+    print(f"completed flows:   {results.flows_done}")
+    print(f"steps:             {steps} in {elapsed:.1f}s -> {steps / elapsed:.0f} updates/s")
+    print(f"reply latency:     p50 {percentile(results.latencies, 50) * 1000:.0f} ms, "
+          f"p95 {percentile(results.latencies, 95) * 1000:.0f} ms, "
+          f"p99 {percentile(results.latencies, 99) * 1000:.0f} ms")
+    print(f"webhook ack:       p50 {percentile(results.acks, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(results.acks, 99) * 1000:.1f} ms")
+    print(f"timeouts:          {results.timeouts}, HTTP errors: {results.http_errors}, injected 429s: {api.floods}")
+    print("Bot API calls:     " + ", ".join(api.summary()))
+
+    await bot_runner.cleanup()
+    await api_runner.cleanup()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--api-latency', type=float, default=0.02, help="seconds per fake Bot API call")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="fraction of API calls answered with 429")
+    parser.add_argument('--reply-timeout', type=float, default=30.0)
+    parser.add_argument('--no-rate-limit', action='store_true', help="turn the bot's outgoing rate limits off")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,342 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from persistence import Store
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages per second across different chats
+DEFAULT_RATE = 28.0
+DEFAULT_CONCURRENCY = 8
+PROGRESS_INTERVAL = 2.0
+MAX_RETRIES = 3
+MAX_FINISHED_JOBS = 20
+JOB_LEASE_TTL = 60.0  # seconds a job stays with a worker that stopped renewing its lease
+
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+
+
+class TokenBucket:
+    """Global rate limiter shared by every sender of one broadcast."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate / 5)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Block every caller of acquire() for the given number of seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def is_unreachable(error: BaseException) -> bool:
+    """True for errors that will not go away by retrying later (blocked bot, deleted chat)."""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and 'chat not found' in str(error).lower()
+
+
+class BroadcastEngine:
+    """Send one message to many chats with a bounded pool of concurrent senders.
+
+    `send` is called with a chat id and must perform the actual API call;
+    `progress` is called with a status text to show (e.g. by editing a
+    message in place).
+
+    Recipients are taken in list order. `cursor` is the index below which
+    every recipient is done, and `completed` holds the finished indexes above
+    it, so a checkpoint of both (see `state()`) is enough to resume without
+    sending anything twice. `on_checkpoint` runs after every recipient whose
+    send returned or failed for good; a send cancelled in flight is left for
+    the resume. `on_unreachable` receives chat ids that blocked the bot or no
+    longer exist.
+    """
+
+    def __init__(
+        self,
+        recipients: Iterable[int],
+        send: Callable[[int], Awaitable[object]],
+        progress: Optional[Callable[[str], Awaitable[object]]] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rate: float = DEFAULT_RATE,
+        resume: Optional[Dict] = None,
+        on_checkpoint: Optional[Callable[["BroadcastEngine"], None]] = None,
+        on_unreachable: Optional[Callable[[int], None]] = None,
+    ):
+        self.recipients = list(recipients)
+        self.send = send
+        self.progress = progress
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate)
+        self.on_checkpoint = on_checkpoint
+        self.on_unreachable = on_unreachable
+        self.total = len(self.recipients)
+        resume = resume or {}
+        self.cursor = resume.get('cursor', 0)
+        self._completed = {i for i in resume.get('completed', ()) if i >= self.cursor}
+        self._next = self.cursor
+        self.sent = resume.get('sent', 0)
+        self.failed = resume.get('failed', 0)
+        self.unreachable = resume.get('unreachable', 0)
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.stopped = False
+        self._last_progress = ""
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.sent - self.failed
+
+    @property
+    def rate(self) -> float:
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def state(self) -> Dict:
+        """Checkpoint of the progress, accepted back as `resume`."""
+        return {
+            'cursor': self.cursor,
+            'completed': sorted(self._completed),
+            'sent': self.sent,
+            'failed': self.failed,
+            'unreachable': self.unreachable,
+        }
+
+    def stop(self) -> None:
+        """Let in-flight sends finish but start no new ones."""
+        self.stopped = True
+
+    def progress_text(self, done: bool = False) -> str:
+        if done:
+            header = "✅ اكتمل البث"
+        elif self.stopped:
+            header = "⏸ توقف البث مؤقتاً وسيُستأنف بعد إعادة التشغيل"
+        else:
+            header = "⏳ جارٍ البث"
+        return (
+            f"{header}\n"
+            f"تم الإرسال: {self.sent}\n"
+            f"فشل: {self.failed} (منهم {self.unreachable} حظروا البوت)\n"
+            f"المتبقي: {self.remaining}\n"
+            f"السرعة: {self.rate:.1f} رسالة/ثانية"
+        )
+
+    async def _report(self, done: bool = False) -> None:
+        if self.progress is None:
+            return
+        text = self.progress_text(done)
+        if text == self._last_progress:
+            return
+        try:
+            await self.progress(text)
+            self._last_progress = text
+        except TelegramRetryAfter as e:
+            self.bucket.pause(e.retry_after)
+        except TelegramBadRequest:
+            # "message is not modified" and similar are harmless here
+            pass
+        except Exception as e:
+            logger.error(f"Failed to update broadcast progress: {e}")
+
+    async def _deliver(self, chat_id: int) -> str:
+        for _ in range(MAX_RETRIES):
+            await self.bucket.acquire()
+            try:
+                await self.send(chat_id)
+                return 'sent'
+            except TelegramRetryAfter as e:
+                logger.warning(f"Broadcast hit flood limit, pausing {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+            except Exception as e:
+                logger.error(f"Failed to send to {chat_id}: {e}")
+                return 'unreachable' if is_unreachable(e) else 'failed'
+        return 'failed'
+
+    def _take(self) -> Optional[int]:
+        while self._next < self.total and self._next in self._completed:
+            self._next += 1
+        if self._next >= self.total:
+            return None
+        index = self._next
+        self._next += 1
+        return index
+
+    def _complete(self, index: int) -> None:
+        self._completed.add(index)
+        while self.cursor in self._completed:
+            self._completed.discard(self.cursor)
+            self.cursor += 1
+        if self.on_checkpoint is not None:
+            self.on_checkpoint(self)
+
+    async def _worker(self) -> None:
+        while not self.stopped:
+            index = self._take()
+            if index is None:
+                return
+            chat_id = self.recipients[index]
+            outcome = await self._deliver(chat_id)
+            if outcome == 'sent':
+                self.sent += 1
+            else:
+                self.failed += 1
+                if outcome == 'unreachable':
+                    self.unreachable += 1
+                    if self.on_unreachable is not None:
+                        self.on_unreachable(chat_id)
+            self._complete(index)
+
+    async def _progress_loop(self) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            await self._report()
+
+    async def run(self) -> bool:
+        """Send to every remaining recipient; returns False if stopped early."""
+        self.started_at = time.monotonic()
+        reporter = asyncio.create_task(self._progress_loop())
+        try:
+            workers = min(self.concurrency, self.total - self.cursor) or 1
+            await asyncio.gather(*(self._worker() for _ in range(workers)))
+        finally:
+            reporter.cancel()
+            self.finished_at = time.monotonic()
+        finished = self.cursor >= self.total
+        await self._report(done=finished)
+        logger.info(
+            f"Broadcast {'finished' if finished else 'paused'}: {self.sent} sent, {self.failed} failed "
+            f"({self.unreachable} unreachable) in {self.finished_at - self.started_at:.1f}s"
+        )
+        return finished
+
+
+class BroadcastJobs:
+    """Persisted broadcast jobs, so a restart resumes them instead of losing them.
+
+    `records` maps job id -> job state (content, progress message, checkpoint)
+    and `recipients` maps job id -> recipient list, written once per job and
+    dropped when the job finishes.
+
+    With a `store`, a job runs only in the process holding its lease there;
+    the runner renews it with keep_lease(), and a lease that is not renewed
+    for `lease_ttl` seconds (the process died) lets another process resume
+    the job.
+    """
+
+    def __init__(self, records: Dict, recipients: Dict, keep: int = MAX_FINISHED_JOBS,
+                 store: Optional[Store] = None, lease_ttl: float = JOB_LEASE_TTL):
+        self.records = records
+        self.recipients = recipients
+        self.keep = keep
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def create(self, job_id: int, recipients: List[int], content: Dict, progress_chat_id: Optional[int] = None,
+               progress_message_id: Optional[int] = None) -> Dict:
+        self.recipients[job_id] = list(recipients)
+        record = self.records[job_id] = {
+            'id': job_id,
+            'status': JOB_RUNNING,
+            'content': content,
+            'total': len(recipients),
+            'progress_chat_id': progress_chat_id,
+            'progress_message_id': progress_message_id,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'state': {},
+        }
+        self._prune()
+        return record
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        return self.records.get(job_id)
+
+    def unfinished(self) -> List[int]:
+        return sorted(job_id for job_id, record in self.records.items() if record['status'] == JOB_RUNNING)
+
+    async def acquire(self, job_id: int) -> bool:
+        """Take or renew this process's lease on a job; False while another process runs it."""
+        if self.store is None:
+            return True
+        return await asyncio.to_thread(self.store.hold, 'broadcast_jobs', job_id, self.owner, self.lease_ttl)
+
+    async def release(self, job_id: int) -> None:
+        if self.store is not None:
+            await asyncio.to_thread(self.store.release, 'broadcast_jobs', job_id, self.owner)
+
+    async def keep_lease(self, job_id: int, engine: BroadcastEngine) -> None:
+        """Renew the job's lease while it runs; stop the engine if another process took the job over."""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                held = await self.acquire(job_id)
+            except Exception as e:
+                logger.error(f"Failed to renew the lease on broadcast job {job_id}: {e}")
+                continue
+            if not held:
+                logger.error(f"Broadcast job {job_id} was taken over by another worker, stopping here")
+                engine.stop()
+                return
+
+    def checkpoint(self, job_id: int, engine: BroadcastEngine) -> None:
+        # Reassign so the persistent dict records the change
+        self.records[job_id] = {**self.records[job_id], 'state': engine.state()}
+
+    def finish(self, job_id: int, engine: BroadcastEngine) -> None:
+        self.records[job_id] = {**self.records[job_id], 'status': JOB_DONE, 'state': engine.state()}
+        self.recipients.pop(job_id, None)
+
+    def _prune(self) -> None:
+        finished = sorted(job_id for job_id, record in self.records.items() if record['status'] == JOB_DONE)
+        for job_id in finished[:max(0, len(finished) - self.keep)]:
+            del self.records[job_id]
+
+
+async def fan_out(
+    recipients: Iterable[int],
+    send: Callable[[int], Awaitable[object]],
+    timeout: float = 10.0,
+) -> Dict[int, BaseException]:
+    """Send to every recipient concurrently, each with its own timeout.
+
+    Returns a mapping of chat id -> exception for the deliveries that failed.
+    """
+    recipients = list(recipients)
+
+    async def deliver(chat_id: int) -> None:
+        await asyncio.wait_for(send(chat_id), timeout)
+
+    results = await asyncio.gather(*(deliver(chat_id) for chat_id in recipients), return_exceptions=True)
+    failures = {}
+    for chat_id, result in zip(recipients, results):
+        if isinstance(result, BaseException):
+            if isinstance(result, asyncio.TimeoutError):
+                result = asyncio.TimeoutError(f"no response within {timeout}s")
+            failures[chat_id] = result
+    return failures
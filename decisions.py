@@ -0,0 +1,132 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, MutableMapping, Optional, Tuple
+
+from persistence import Store
+from requests_registry import STATUS_LABELS
+
+DEFAULT_TTL = 3600.0  # seconds a decision answers repeated taps from memory
+DEFAULT_CACHE_SIZE = 1024
+MAX_AUDIT = 20  # attempts kept per request
+
+OUTCOME_APPLIED = 'applied'
+OUTCOME_DUPLICATE = 'duplicate'  # same decision tapped again
+OUTCOME_CONFLICT = 'conflict'  # a different decision came too late
+
+
+class DecisionLog:
+    """First decision per request wins; later taps are answered, not applied.
+
+    The winning decision is claimed in the store with one immediate write,
+    so two admins (or two worker processes) deciding at once cannot both
+    succeed. Decisions are then cached for `ttl` seconds, so double taps
+    are answered from memory without touching the database. Every attempt,
+    applied or not, is kept in `audit` (request_id -> attempts, normally a
+    PersistentDict).
+    """
+
+    def __init__(
+        self,
+        store: Store,
+        audit: MutableMapping[int, List[Dict]],
+        name: str = 'request_decisions',
+        ttl: float = DEFAULT_TTL,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self.store = store
+        self.audit = audit
+        self.name = name
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self.hits = 0
+        self.claims = 0
+
+    def _cached(self, request_id: int) -> Optional[Dict]:
+        entry = self._cache.get(request_id)
+        if entry is None:
+            return None
+        expires, decision = entry
+        if expires < time.monotonic():
+            del self._cache[request_id]
+            return None
+        return decision
+
+    def _remember(self, request_id: int, decision: Dict) -> None:
+        self._cache[request_id] = (time.monotonic() + self.ttl, decision)
+        self._cache.move_to_end(request_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, request_id: int) -> Optional[Dict]:
+        """The decision taken on this request, if any."""
+        decision = self._cached(request_id)
+        if decision is None:
+            decision = await asyncio.to_thread(self.store.claimed, self.name, request_id)
+            if decision is not None:
+                self._remember(request_id, decision)
+        return decision
+
+    async def _claim(self, request_id: int, decision: Dict) -> Dict:
+        winner = self._cached(request_id)
+        if winner is not None:
+            self.hits += 1
+            return winner
+        # One claim per request at a time in this process; the others then hit the cache
+        lock = self._locks.setdefault(request_id, asyncio.Lock())
+        try:
+            async with lock:
+                winner = self._cached(request_id)
+                if winner is None:
+                    self.claims += 1
+                    winner = await asyncio.to_thread(self.store.claim, self.name, request_id, decision)
+                    self._remember(request_id, winner)
+                else:
+                    self.hits += 1
+        finally:
+            if not lock.locked():
+                self._locks.pop(request_id, None)
+        return winner
+
+    def _log(self, request_id: int, status: str, by: int, at: str, outcome: str) -> None:
+        attempts = self.audit.get(request_id, []) + [{'status': status, 'by': by, 'at': at, 'outcome': outcome}]
+        self.audit[request_id] = attempts[-MAX_AUDIT:]
+
+    async def check(self, request_id: int, status: str, by: int) -> Optional[Dict]:
+        """The decision that stands, if any; a tap on a decided request is logged as an attempt."""
+        decision = await self.get(request_id)
+        if decision is not None:
+            outcome = OUTCOME_DUPLICATE if decision['status'] == status else OUTCOME_CONFLICT
+            self._log(request_id, status, by, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), outcome)
+        return decision
+
+    async def decide(self, request_id: int, status: str, by: int) -> Tuple[Dict, bool]:
+        """Record `status` unless the request was already decided.
+
+        Returns the decision that stands and whether it is this one.
+        """
+        at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        decision = {'status': status, 'by': by, 'at': at, 'token': uuid.uuid4().hex}
+        winner = await self._claim(request_id, decision)
+        applied = winner['token'] == decision['token']
+        if applied:
+            outcome = OUTCOME_APPLIED
+        else:
+            outcome = OUTCOME_DUPLICATE if winner['status'] == status else OUTCOME_CONFLICT
+        self._log(request_id, status, by, at, outcome)
+        return winner, applied
+
+    async def seed(self, request_id: int, status: str, by: Optional[int], at: str) -> Dict:
+        """Record a decision taken before this log existed, unless one is recorded already."""
+        return await self._claim(request_id, {'status': status, 'by': by, 'at': at, 'token': ''})
+
+
+def format_decided(decision: Dict, name: Optional[str] = None) -> str:
+    """Answer for a tap on a request that was already decided."""
+    status = STATUS_LABELS.get(decision['status'], decision['status'])
+    who = name or decision.get('by') or 'غير معروف'
+    return f"تم البت في هذا الطلب مسبقاً: {status}\nبواسطة: {who}\nفي: {decision['at']}"
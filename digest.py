@@ -0,0 +1,195 @@
+import html
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, MutableMapping, Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from requests_registry import STATUS_APPROVED, STATUS_REJECTED, TYPE_LABELS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 120.0  # seconds
+DEFAULT_MAX_ITEMS = 15
+MAX_DIGESTS = 200
+MAX_LINE = 120  # characters of request details shown per item
+
+STATUS_MARKS = {
+    None: '⏳',
+    STATUS_APPROVED: '✅',
+    STATUS_REJECTED: '❌',
+}
+
+
+def digest_item(request_id: int, user_id: int, request_type: str, line: str) -> Dict:
+    """A digest entry; `line` is plain text typed by the volunteer and is escaped for HTML here."""
+    if len(line) > MAX_LINE:
+        line = line[:MAX_LINE - 1] + '…'
+    return {
+        'request_id': request_id,
+        'user_id': user_id,
+        'type': request_type,
+        'line': html.escape(line),
+        'status': None,
+        'warning': None,
+    }
+
+
+def render_digest(items: List[Dict]) -> str:
+    labels = sorted({TYPE_LABELS.get(item['type'], item['type']) for item in items})
+    waiting = sum(1 for item in items if item['status'] is None)
+    lines = [f"**طلبات {' و'.join(labels)} جديدة ({len(items)}، بانتظار القرار: {waiting})**", ""]
+    for item in items:
+        lines.append(f"{STATUS_MARKS.get(item['status'], '')} #{item['request_id']} {item['line']}")
+        if item['warning'] and item['status'] is None:
+            lines.append(f"   ⚠️ {item['warning']}")
+    return "\n".join(lines)
+
+
+def digest_keyboard(items: List[Dict]) -> Optional[InlineKeyboardMarkup]:
+    """One approve/reject row per undecided item, using the callback data of the individual messages."""
+    rows = []
+    for item in items:
+        if item['status'] is not None:
+            continue
+        suffix = f"{item['type']}_{item['request_id']}_{item['user_id']}"
+        if item['warning']:
+            approve = InlineKeyboardButton(text=f"⚠️ قبول #{item['request_id']}", callback_data=f"approve_{suffix}_force")
+        else:
+            approve = InlineKeyboardButton(text=f"✅ #{item['request_id']}", callback_data=f"approve_{suffix}")
+        rows.append([approve, InlineKeyboardButton(text=f"❌ #{item['request_id']}", callback_data=f"reject_{suffix}")])
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
+
+class RequestDigests:
+    """Collects new requests per admin group and posts them as one message.
+
+    Items wait in `pending` (chat_id -> items, normally a PersistentDict so
+    a restart does not lose them) until `window` seconds after the first
+    one or until `max_items` are waiting. Posted digests are kept in
+    `digests` ("chat_id:message_id" -> {'chat_id', 'items'}) so decisions
+    can mark their item and edit the message in place; a digest is
+    forgotten once every item is decided.
+
+    `send(chat_id, text, keyboard)` posts a digest and `edit(chat_id,
+    message_id, text, keyboard)` updates one.
+    """
+
+    def __init__(
+        self,
+        pending: MutableMapping[int, List[Dict]],
+        digests: MutableMapping[str, Dict],
+        send: Callable[[int, str, Optional[InlineKeyboardMarkup]], Awaitable[Message]],
+        edit: Callable[[int, int, str, Optional[InlineKeyboardMarkup]], Awaitable[object]],
+        window: float = DEFAULT_WINDOW,
+        max_items: int = DEFAULT_MAX_ITEMS,
+    ):
+        self.pending = pending
+        self.digests = digests
+        self.send = send
+        self.edit = edit
+        self.window = window
+        self.max_items = max(1, max_items)
+        self._timers: Dict[int, asyncio.Task] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self.posted = 0
+        self.edits = 0
+
+    async def add(self, chat_id: int, item: Dict) -> None:
+        """Queue an item; posting always happens in a background task, never in the caller."""
+        self.pending[chat_id] = self.pending.get(chat_id, []) + [item]
+        if len(self.pending[chat_id]) >= self.max_items:
+            timer = self._timers.pop(chat_id, None)
+            if timer is not None:
+                timer.cancel()
+            self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id, 0))
+        elif chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id, self.window))
+
+    async def _flush_later(self, chat_id: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._timers.pop(chat_id, None)
+        await self.flush(chat_id)
+
+    async def flush(self, chat_id: int) -> None:
+        """Post everything waiting for this chat as one digest now."""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        async with self._locks.setdefault(chat_id, asyncio.Lock()):
+            items = self.pending.pop(chat_id, None)
+            if not items:
+                return
+            retry = []
+            try:
+                await self._post(chat_id, items)
+            except TelegramBadRequest as e:
+                # Telegram refused the content; post the items one by one so a bad one cannot block the rest
+                logger.error(f"Digest of {len(items)} requests rejected by {chat_id} ({e}), posting them separately")
+                for item in items:
+                    try:
+                        await self._post(chat_id, [item])
+                    except TelegramBadRequest as e:
+                        logger.error(f"Dropping request #{item['request_id']} from the {chat_id} digest: {e}")
+                    except Exception as e:
+                        logger.error(f"Failed to post request #{item['request_id']} to {chat_id}: {e}")
+                        retry.append(item)
+            except Exception as e:
+                logger.error(f"Failed to post a digest of {len(items)} requests to {chat_id}: {e}")
+                retry = items
+            if retry:
+                # Keep them for the next attempt, ahead of anything that arrived meanwhile
+                self.pending[chat_id] = retry + self.pending.get(chat_id, [])
+                if chat_id not in self._timers:
+                    self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id, self.window))
+
+    async def _post(self, chat_id: int, items: List[Dict]) -> None:
+        message = await self.send(chat_id, render_digest(items), digest_keyboard(items))
+        self.posted += 1
+        self.digests[f"{chat_id}:{message.message_id}"] = {'chat_id': chat_id, 'items': items}
+        self._prune()
+
+    def _prune(self) -> None:
+        for key in list(self.digests)[:max(0, len(self.digests) - MAX_DIGESTS)]:
+            del self.digests[key]
+
+    def get(self, chat_id: int, message_id: int) -> Optional[Dict]:
+        return self.digests.get(f"{chat_id}:{message_id}")
+
+    async def _update(self, chat_id: int, message_id: int, request_id: int, **changes) -> bool:
+        key = f"{chat_id}:{message_id}"
+        if key not in self.digests:
+            return False
+        # Edits of one chat's digests go out in the order the changes were made
+        async with self._locks.setdefault(chat_id, asyncio.Lock()):
+            digest = self.digests.get(key)
+            if digest is None:
+                return False
+            items = [{**item, **changes} if item['request_id'] == request_id else item for item in digest['items']]
+            if all(item['status'] is not None for item in items):
+                del self.digests[key]
+            else:
+                self.digests[key] = {**digest, 'items': items}
+            await self.edit(chat_id, message_id, render_digest(items), digest_keyboard(items))
+            self.edits += 1
+        return True
+
+    async def decide(self, chat_id: int, message_id: int, request_id: int, status: str) -> bool:
+        """Mark one item approved/rejected and edit the digest; False if the message is not a digest."""
+        return await self._update(chat_id, message_id, request_id, status=status)
+
+    async def warn(self, chat_id: int, message_id: int, request_id: int, warning: str) -> bool:
+        """Show a warning under one item and turn its approve button into a forced approve."""
+        return await self._update(chat_id, message_id, request_id, warning=warning)
+
+    def start(self) -> None:
+        """Post what was still waiting when the bot stopped, after one window."""
+        for chat_id in list(self.pending):
+            if chat_id not in self._timers:
+                self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id, self.window))
+
+    async def close(self) -> None:
+        """Post everything still waiting."""
+        for chat_id in list(self.pending):
+            await self.flush(chat_id)
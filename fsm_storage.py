@@ -0,0 +1,153 @@
+import json
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_WRITE_DELAY = 0.05  # seconds; writes made within this window share one transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+Record = Tuple[Optional[str], Dict[str, Any]]
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage that keeps in-flight forms across restarts.
+
+    Reads go through an in-process LRU cache, so the hot path never touches
+    the disk once a chat is warm. Writes only update the cache and mark the
+    key dirty; dirty keys are written together shortly afterwards, so the
+    several set_state/update_data calls made while handling one update end
+    up in a single transaction. When several processes share the database,
+    use cache_size=0 so every read sees the other processes' writes, and
+    flush() before another process may handle the same chat.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        write_delay: float = DEFAULT_WRITE_DELAY,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.path = path
+        self.cache_size = cache_size
+        self.write_delay = write_delay
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._cache: "OrderedDict[str, Record]" = OrderedDict()
+        self._dirty: Dict[str, Record] = {}
+        self._inflight: Dict[str, Record] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.disk_reads = 0
+        self.disk_writes = 0
+
+    def _read(self, key: str) -> Record:
+        record = self._dirty.get(key) or self._inflight.get(key)
+        if record is None:
+            record = self._cache.get(key)
+            if record is not None:
+                self._cache.move_to_end(key)
+                return record
+            self.disk_reads += 1
+            with self._db_lock:
+                row = self._conn.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+            record = (row[0], json.loads(row[1])) if row else (None, {})
+        self._remember(key, record)
+        return record
+
+    def _remember(self, key: str, record: Record) -> None:
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            # Dirty records are still held by self._dirty until written
+            self._cache.popitem(last=False)
+
+    def _write(self, key: str, record: Record) -> None:
+        self._remember(key, record)
+        self._dirty[key] = record
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.write_delay)
+        await self.flush()
+
+    def _commit(self, batch: Dict[str, Record]) -> None:
+        upserts = [
+            (key, state, json.dumps(data, ensure_ascii=False))
+            for key, (state, data) in batch.items()
+            if state is not None or data
+        ]
+        deletes = [(key,) for key, (state, data) in batch.items() if state is None and not data]
+        with self._db_lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                cur.executemany("INSERT OR REPLACE INTO fsm (key, state, data) VALUES (?, ?, ?)", upserts)
+                cur.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        self.disk_writes += 1
+
+    async def flush(self) -> None:
+        # Serialized, so when flush() returns no earlier write is still in flight
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            self._inflight = batch
+            try:
+                await asyncio.to_thread(self._commit, batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} FSM records: {e}")
+                for key, record in batch.items():
+                    self._dirty.setdefault(key, record)
+            finally:
+                self._inflight = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key)
+        _, data = self._read(k)
+        self._write(k, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._read(self.key_builder.build(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = self.key_builder.build(key)
+        state, _ = self._read(k)
+        self._write(k, (state, data.copy()))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return self._read(self.key_builder.build(key))[1].copy()
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            # Let a pending write finish rather than dropping its batch
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        with self._db_lock:
+            self._conn.close()
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+
+from persistence import Store
+
+logger = logging.getLogger(__name__)
+
+
+class BlockIdAllocator:
+    """Unique, increasing IDs leased in blocks from a durable sequence (hi/lo).
+
+    Handing out an ID is an in-memory increment; only when a block runs out
+    is the next one reserved with a single database write. IDs left in a
+    block when the process stops are skipped, so there can be gaps but
+    never duplicates, also across processes sharing the database.
+    """
+
+    def __init__(self, store: Store, name: str, block_size: int = 10, start: int = 1):
+        self.store = store
+        self.name = name
+        self.block_size = max(1, block_size)
+        self.start = start
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def next(self) -> int:
+        if self._next >= self._end:
+            async with self._lock:
+                if self._next >= self._end:
+                    first = await asyncio.to_thread(self.store.lease, self.name, self.block_size, self.start)
+                    self._next, self._end = first, first + self.block_size
+                    logger.debug(f"Leased {self.name} ids {first}-{self._end - 1}")
+        value = self._next
+        self._next += 1
+        return value
+
+    def next_nowait(self) -> int:
+        """Like next(), for synchronous callers.
+
+        When the block is used up the next one is leased right here, which
+        blocks the event loop for one short write, once per block.
+        """
+        if self._next >= self._end:
+            first = self.store.lease(self.name, self.block_size, self.start)
+            self._next, self._end = first, first + self.block_size
+            logger.debug(f"Leased {self.name} ids {first}-{self._end - 1}")
+        value = self._next
+        self._next += 1
+        return value
@@ -0,0 +1,169 @@
+import re
+from bisect import insort
+from datetime import date, timedelta
+from typing import Dict, List, MutableMapping, Optional, Tuple
+
+from reminders import to_ascii_digits
+from volunteer_roster import normalize_arabic
+
+_DATE = re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})")
+
+
+def parse_date(text: str) -> Optional[date]:
+    """Parse "YYYY-MM-DD" (Arabic digits, '/' or '.' separators allowed)."""
+    match = _DATE.search(to_ascii_digits(text))
+    if match is None:
+        return None
+    try:
+        return date(*(int(part) for part in match.groups()))
+    except ValueError:
+        return None
+
+
+def parse_range(text: str) -> Optional[Tuple[date, date]]:
+    """Parse one date or two dates ("from to") into an inclusive range."""
+    dates = [parse_date(part.group(0)) for part in _DATE.finditer(to_ascii_digits(text))]
+    if not dates or None in dates:
+        return None
+    start, end = dates[0], dates[-1]
+    return (start, end) if start <= end else (end, start)
+
+
+class LeaveCalendar:
+    """Approved leaves as date intervals, indexed for overlap queries.
+
+    `records` maps request_id -> {'request_id', 'volunteer_id', 'name',
+    'start', 'end'} with ISO dates (normally a PersistentDict). Intervals are
+    kept sorted by start; an implicit balanced tree over that order stores
+    the latest end date of every subtree, so an overlap query skips whole
+    subtrees that end too early or start too late and visits O(log n + k)
+    nodes for k matches in practice. The sorted intervals are built on the
+    first query and the tree after inserts or removals, both lazily.
+    """
+
+    def __init__(self, records: MutableMapping[int, Dict]):
+        self._records = records
+        self.reload()
+
+    def reload(self) -> None:
+        """Drop the intervals; they are rebuilt from the records on next use."""
+        self._intervals: Optional[List[Tuple[date, date, int]]] = None
+        self._max_end: Optional[List[date]] = None
+
+    def _sort(self) -> List[Tuple[date, date, int]]:
+        # Sorted on first query so a cold start does not pay for it
+        if self._intervals is None:
+            self._intervals = sorted(
+                (date.fromisoformat(record['start']), date.fromisoformat(record['end']), request_id)
+                for request_id, record in self._records.items()
+            )
+        return self._intervals
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, request_id: int, volunteer_id: Optional[int], name: str, start: date, end: date) -> Dict:
+        if request_id in self._records:
+            self.remove(request_id)
+        record = self._records[request_id] = {
+            'request_id': request_id,
+            'volunteer_id': volunteer_id,
+            'name': name,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+        }
+        if self._intervals is not None:
+            insort(self._intervals, (start, end, request_id))
+        self._max_end = None
+        return record
+
+    def remove(self, request_id: int) -> None:
+        record = self._records.pop(request_id, None)
+        if record is not None and self._intervals is not None:
+            self._intervals.remove((date.fromisoformat(record['start']), date.fromisoformat(record['end']), request_id))
+        self._max_end = None
+
+    def _build(self, lo: int, hi: int) -> date:
+        mid = (lo + hi) // 2
+        latest = self._intervals[mid][1]
+        if lo < mid:
+            latest = max(latest, self._build(lo, mid))
+        if mid + 1 < hi:
+            latest = max(latest, self._build(mid + 1, hi))
+        self._max_end[mid] = latest
+        return latest
+
+    def _collect(self, lo: int, hi: int, start: date, end: date, found: List[Dict]) -> None:
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self._max_end[mid] < start:
+            return  # everything in this subtree ends before the range
+        self._collect(lo, mid, start, end, found)
+        interval_start, interval_end, request_id = self._intervals[mid]
+        if interval_start > end:
+            return  # this one and everything to its right starts after the range
+        if interval_end >= start:
+            found.append(self._records[request_id])
+        self._collect(mid + 1, hi, start, end, found)
+
+    def overlapping(self, start: date, end: Optional[date] = None) -> List[Dict]:
+        """Leaves that overlap the inclusive range (or the single day `start`), by start date."""
+        end = end or start
+        intervals = self._sort()
+        if self._max_end is None:
+            self._max_end = [start] * len(intervals)
+            if intervals:
+                self._build(0, len(intervals))
+        found: List[Dict] = []
+        self._collect(0, len(intervals), start, end, found)
+        return found
+
+    def peak_absent(self, start: date, end: date, extra: Optional[Dict] = None) -> Tuple[int, Optional[date]]:
+        """Most distinct volunteers on leave on any single day of the range, and that day.
+
+        Overlapping leaves of one volunteer count once. `extra` is a leave
+        record that is not approved yet, added to see its effect.
+        """
+        records = self.overlapping(start, end)
+        if extra is not None:
+            records.append(extra)
+        by_volunteer: Dict[Tuple, List[Tuple[date, date]]] = {}
+        for record in records:
+            who = ('id', record['volunteer_id']) if record.get('volunteer_id') is not None else ('name', normalize_arabic(record['name']))
+            interval = (max(date.fromisoformat(record['start']), start), min(date.fromisoformat(record['end']), end))
+            by_volunteer.setdefault(who, []).append(interval)
+        events: List[Tuple[date, int]] = []
+        for intervals in by_volunteer.values():
+            intervals.sort()
+            merged = [list(intervals[0])]
+            for interval_start, interval_end in intervals[1:]:
+                if interval_start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], interval_end)
+                else:
+                    merged.append([interval_start, interval_end])
+            for interval_start, interval_end in merged:
+                events.append((interval_start, 1))
+                events.append((interval_end + timedelta(days=1), -1))
+        events.sort()
+        current = peak = 0
+        peak_day = None
+        for day, delta in events:
+            current += delta
+            if current > peak:
+                peak, peak_day = current, day
+        return peak, peak_day
+
+def format_calendar(calendar: LeaveCalendar, start: date, end: date) -> str:
+    leaves = calendar.overlapping(start, end)
+    title = start.isoformat() if start == end else f"{start.isoformat()} → {end.isoformat()}"
+    if not leaves:
+        return f"لا توجد إجازات مقبولة في {title}. 🌟"
+    peak, peak_day = calendar.peak_absent(start, end)
+    lines = [f"الإجازات المقبولة في {title} ({len(leaves)}):", ""]
+    for record in leaves:
+        lines.append(f"- {record['name']}: {record['start']} → {record['end']} (طلب #{record['request_id']})")
+    if start != end:
+        lines.append("")
+        lines.append(f"أكبر عدد في إجازة بنفس اليوم: {peak} ({peak_day.isoformat()})")
+    return "\n".join(lines)
@@ -1,25 +1,56 @@
 import os
+from startup_timeline import StartupTimeline
+startup_timeline = StartupTimeline(release=os.getenv('RENDER_GIT_COMMIT', '')[:7] or None)
+
 import random
+import hashlib
 import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from itertools import islice
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command, StateFilter 
+from aiogram.filters import Command
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 
+from broadcast import BroadcastEngine, BroadcastJobs, JOB_RUNNING, fan_out
+from persistence import Store
+from id_allocator import BlockIdAllocator
+from fsm_storage import SQLiteStorage, DEFAULT_CACHE_SIZE
+from shared_state import KeyLocks, SharedStateMiddleware
+from text_router import TextCommandRouter
+from user_registry import UserRegistry, UserRegistryMiddleware
+from update_queue import QueuedRequestHandler
+import metrics
+from api_middleware import ApiCallMiddleware
+from static_assets import StaticAssetCache, StaticDocument
+from digest import RequestDigests, digest_item
+from decisions import DecisionLog, format_decided
+from volunteer_roster import VolunteerRoster
+from leave_calendar import LeaveCalendar, parse_date, parse_range, format_calendar
+from reminders import ReminderScheduler, parse_meeting_time, format_meeting_time, format_offset
+from attendance import (
+    AttendanceRegistry, SESSION_MEETING, SESSION_INITIATIVE,
+    parse_names, format_monthly_rates, format_missed
+)
+from requests_registry import (
+    RequestRegistry, STATUS_PENDING, STATUS_APPROVED, STATUS_REJECTED,
+    format_request_line, format_request_details
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+startup_timeline.mark('imports')
 
 # Environment variables and constants
 # NOTE: Ensure BOT_TOKEN, CHAT_ADMIN_ID, RENDER_EXTERNAL_HOSTNAME, WEBHOOK_SECRET are set in your environment
@@ -39,24 +70,165 @@ EXCUSE_GROUP_ID = -4737111167  # Chat ID for the excuses group
 LEAVE_GROUP_ID = -4868672688  # Chat ID for the leave group
 ATTENDANCE_GROUP_ID = -4966592161  # Chat ID for the attendance group
 
+# Broadcast tuning (Telegram allows ~30 msg/s across chats)
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 8))
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 28))
+ADMIN_SEND_TIMEOUT = float(os.getenv('ADMIN_SEND_TIMEOUT', 10))  # seconds per admin
+PHOTOS_PAGE_SIZE = 10  # Telegram albums hold at most 10 items
+
+# Local SQLite database for bot state (users, counters, schedules, photos)
+DB_PATH = os.getenv('DB_PATH', 'bot.db')
+DB_FLUSH_INTERVAL_MS = int(os.getenv('DB_FLUSH_INTERVAL_MS', 500))
+REQUEST_ID_BLOCK = int(os.getenv('REQUEST_ID_BLOCK', 10))  # request ids reserved per database write
+
+# WORKERS > 1 runs that many processes on the same port (SO_REUSEPORT) sharing the
+# database; chats are locked across processes through files in LOCK_DIR
+WORKERS = int(os.getenv('WORKERS', 1))
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', 0))
+SHARED_STATE = WORKERS > 1
+PRIMARY_WORKER = WORKER_INDEX == 0  # Runs the webhook setup, reminders and broadcast resumption
+LOCK_DIR = os.getenv('LOCK_DIR', f"{DB_PATH}.locks")
+
+# Webhook intake: updates are queued and handled by workers sharded by chat.
+# UPDATE_WORKERS=0 processes updates with aiogram's plain request handler instead.
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 8))
+UPDATE_QUEUE_MAX = int(os.getenv('UPDATE_QUEUE_MAX', 1000))
+
+# Fast start: skip set_webhook when the registered webhook already matches and
+# do webhook checks and admin notices in the background. FAST_START=0 disables.
+FAST_START = os.getenv('FAST_START', '1') != '0'
+
+# Outgoing Bot API calls: retries for 429/network errors, shared rate limits
+API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', 3))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', 20))  # seconds queued group posts get to go out on shutdown
+
+# Send the code of conduct as a document uploaded once and resent by file_id.
+# REFERENCE_DOCS=0 sends it as a Markdown message instead.
+REFERENCE_DOCS = os.getenv('REFERENCE_DOCS', '1') != '0'
+
+# Meeting times are entered and shown in this timezone; reminders go out
+# this many hours before each meeting
+BOT_TIMEZONE = os.getenv('BOT_TIMEZONE', 'Asia/Damascus')
+MEETING_REMINDER_HOURS = [float(h) for h in os.getenv('MEETING_REMINDER_HOURS', '24,1').split(',') if h.strip()]
+try:
+    TZ = ZoneInfo(BOT_TIMEZONE)
+except ZoneInfoNotFoundError:
+    logger.warning(f"Unknown timezone {BOT_TIMEZONE}, using UTC")
+    TZ = timezone.utc
+
+# Staffing check when approving leaves: warn if fewer than MIN_STAFFING volunteers
+# would be available on some day out of a team of TEAM_SIZE (required for the check).
+TEAM_SIZE = int(os.getenv('TEAM_SIZE', 0))
+MIN_STAFFING = int(os.getenv('MIN_STAFFING', 0))  # 0 disables the check
+if MIN_STAFFING and TEAM_SIZE <= 0:
+    logger.error("MIN_STAFFING is set but TEAM_SIZE is not, staffing check disabled")
+    MIN_STAFFING = 0
+
+# Digest mode: new excuse/leave requests are collected per group and posted as one
+# message (after DIGEST_WINDOW seconds or DIGEST_MAX_ITEMS requests). Off by default.
+NOTIFICATION_DIGEST = os.getenv('NOTIFICATION_DIGEST', '0') != '0'
+DIGEST_WINDOW = float(os.getenv('DIGEST_WINDOW', 120))
+DIGEST_MAX_ITEMS = int(os.getenv('DIGEST_MAX_ITEMS', 15))
+DECISION_CACHE_TTL = float(os.getenv('DECISION_CACHE_TTL', 3600))  # seconds repeated approve/reject taps are answered from memory
+
 # Bot and Dispatcher setup
 if not TOKEN:
     logger.error("BOT_TOKEN is not set. Bot cannot run.")
     
 bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-storage = MemoryStorage()
+api_middleware = ApiCallMiddleware(max_retries=API_MAX_RETRIES)
+bot.session.middleware(api_middleware)
+# Keeps half-filled forms across restarts; uncached when other workers write to it too
+storage = SQLiteStorage(DB_PATH, cache_size=0 if SHARED_STATE else DEFAULT_CACHE_SIZE)
 dp = Dispatcher(storage=storage)
-
-# Global variables
-request_counter = 1
-users = set() # Stores user IDs who have interacted with the bot
-meeting_schedules = {
+dp.update.outer_middleware(metrics.UpdateMetricsMiddleware())
+dp.message.middleware(metrics.HandlerMetricsMiddleware())
+dp.callback_query.middleware(metrics.HandlerMetricsMiddleware())
+text_router = TextCommandRouter(observer=metrics.observe_handler)  # Menu buttons: one dict lookup instead of a filter scan
+dp.message.outer_middleware(text_router)
+
+# Global variables (restored from the database and flushed back in batches)
+db = Store(DB_PATH, flush_interval=DB_FLUSH_INTERVAL_MS / 1000, shared=SHARED_STATE)
+if SHARED_STATE:
+    dp.update.outer_middleware(SharedStateMiddleware(KeyLocks(LOCK_DIR), db, storage))
+counters = db.load_dict('counters', default={'request_counter': 1})  # Legacy counters, only used to seed the sequences
+request_ids = BlockIdAllocator(db, 'request_id', block_size=REQUEST_ID_BLOCK, start=counters.get('request_counter', 1))
+broadcast_ids = BlockIdAllocator(db, 'broadcast_id', block_size=1, start=counters.get('broadcast_counter', 1))
+users = db.load_set('users') # Stores user IDs who have interacted with the bot
+blocked_users = db.load_set('blocked_users')  # Tombstones: users who blocked the bot, skipped by broadcasts
+user_registry = UserRegistry(db)  # user_id -> last seen / first name / language
+dp.update.outer_middleware(UserRegistryMiddleware(user_registry, audience=users, tombstones=blocked_users))
+meeting_schedules = db.load_dict('meeting_schedules', default={
     'الاجتماع العام': 'غير محدد',
     'اجتماع فريق الدعم الاول': 'غير محدد',
     'فريق الدعم الثاني': 'غير محدد',
     'الفريق المركزي': 'غير محدد'
-}
-team_photos = []  # List to store photo file_ids, e.g., [{'file_id': 'id1'}, {'file_id': 'id2'}]
+})
+bot_settings = db.load_dict('settings')  # Internal bookkeeping, e.g. the registered webhook
+startup_history = db.load_list('startup_history')  # Recent startup timelines, newest last
+request_registry = RequestRegistry(db.load_dict('requests'))  # Excuse/leave requests and their status
+request_decisions = DecisionLog(db, db.load_dict('decision_audit'), ttl=DECISION_CACHE_TTL)  # First approve/reject per request wins
+volunteers = db.load_dict('volunteers')
+attendance_sessions = db.load_dict('attendance_sessions')
+# Leased like request ids, so workers never hand out the same one; sessions one at a
+# time because their order is their chronology
+volunteer_ids = BlockIdAllocator(db, 'volunteer_id', block_size=REQUEST_ID_BLOCK, start=max(volunteers, default=0) + 1)
+session_ids = BlockIdAllocator(db, 'attendance_session_id', block_size=1, start=max(attendance_sessions, default=0) + 1)
+volunteer_roster = VolunteerRoster(volunteers, allocate=volunteer_ids.next_nowait)  # volunteer_id -> canonical name and spellings
+attendance_registry = AttendanceRegistry(  # Attendance checks by session id, volunteers resolved through the roster
+    attendance_sessions, key=volunteer_roster.resolve, label=volunteer_roster.name, allocate=session_ids.next_nowait,
+    everyone=volunteer_roster.members,
+)
+leave_calendar = LeaveCalendar(db.load_dict('leave_calendar'))  # Approved leaves by request id, as date intervals
+meeting_reminders = ReminderScheduler(  # One task fires all meeting reminders, schedule kept in the database
+    db.load_dict('meeting_reminders'),
+    lambda key, at, offset: send_meeting_reminder(key, at, offset),
+    offsets=[timedelta(hours=hours) for hours in MEETING_REMINDER_HOURS],
+    tz=TZ,
+)
+broadcast_jobs = BroadcastJobs(db.load_dict('broadcast_jobs'), db.load_dict('broadcast_recipients'), store=db)  # Leased to the worker sending them
+if SHARED_STATE:
+    # Rebuild in-memory indexes when another worker changed their records
+    db.on_change('requests', request_registry.reload)
+    db.on_change('volunteers', volunteer_roster.reload)
+    db.on_change('attendance_sessions', attendance_registry.reload)
+    db.on_change('leave_calendar', leave_calendar.reload)
+    db.on_change('meeting_reminders', meeting_reminders.reload)
+static_assets = StaticAssetCache(db.load_dict('static_assets'))  # Uploaded reference documents by file_id
+request_digests = RequestDigests(  # Requests waiting to be posted as a digest (per worker) and posted digests
+    db.load_dict(f'digest_pending_{WORKER_INDEX}'),
+    db.load_dict('request_digests'),
+    lambda chat_id, text, keyboard: bot.send_message(chat_id, text, reply_markup=keyboard),
+    lambda chat_id, message_id, text, keyboard: bot.edit_message_text(
+        text, chat_id=chat_id, message_id=message_id, reply_markup=keyboard
+    ),
+    window=DIGEST_WINDOW,
+    max_items=DIGEST_MAX_ITEMS,
+)
+team_photos = db.load_dict('team_photos_by_id')  # file_unique_id -> {'file_id': ...}, oldest first
+MAX_PHOTO_KEY = 32  # keys go into callback data, which Telegram caps at 64 bytes
+
+def legacy_photo_key(file_id: str) -> str:
+    """Short stable key for a photo stored before file_unique_id was kept (same on every worker)."""
+    return "legacy-" + hashlib.sha1(file_id.encode()).hexdigest()[:16]
+
+# Older databases stored photos as a list without stable ids, and an earlier
+# migration keyed them by the (too long) file_id; rebuild in order with short keys
+legacy_photos = db.load_list('team_photos')
+if legacy_photos or any(len(photo_key) > MAX_PHOTO_KEY for photo_key in team_photos):
+    photos = [(legacy_photo_key(photo_info['file_id']), photo_info) for photo_info in legacy_photos]
+    photos += [
+        (legacy_photo_key(photo_info['file_id']) if len(photo_key) > MAX_PHOTO_KEY else photo_key, photo_info)
+        for photo_key, photo_info in team_photos.items()
+    ]
+    for photo_key in list(team_photos):
+        del team_photos[photo_key]
+    for photo_key, photo_info in photos:
+        team_photos[photo_key] = photo_info
+    legacy_photos.clear()
+background_tasks = set()  # Strong references to fire-and-forget tasks
+running_broadcasts = {}  # job id -> (BroadcastEngine, task), stopped cleanly on shutdown
+broadcast_watcher = None  # Task resuming orphaned broadcast jobs, on every worker
 
 # Lists and data
 motivational_phrases = [
@@ -86,6 +258,62 @@ dhikr_phrases = [
     "سبحان الله وبحمده",
     "سبحان الله العظيم"
 ]
+DHIKR_TEXT = "\n".join(dhikr_phrases) + " 🌟"
+
+# Reference texts, rendered once at import
+# --- النص الجديد لمدونة السلوك ---
+CODE_OF_CONDUCT_TEXT = (
+    "**مدوّنة السلوك للعمل التطوعي**\n\n"
+    "تصدر هذه 'مدونة السلوك' كوثيقة ملزمة للإدارة والمنسقين والمتطوعين من أجل الحفاظ على بيئة عمل منظمة، محترمة، قائمة على الانضباط وروح الفريق.\n\n"
+    "**الالتزام بما يلي هو شرط أساسي للاستمرار ضمن الفريق.**\n\n"
+    "--- **مبادئ السلوك والالتزام** ---\n\n"
+    "**1. الجدية والانضباط**\n"
+    "المطلوب من كل عضو الالتزام بالجدية الكاملة في أداء المهام. أي استهتار أو تعامل غير مسؤول مع الأنشطة مرفوض رفضاً قاطعاً.\n\n"
+    "**2. الفصل بين الشخصي والعمل**\n"
+    "يُمنع إدخال الاهتمامات أو العلاقات الشخصية في العمل التطوعي، مساحة مهنية. أي محاولة لخلط الشخصي مع العمل تُعتبر إخلالاً مباشراً بالمسؤولية.\n\n"
+    "**3. سرية المعلومات**\n"
+    "جميع تفاصيل العمل والقرارات والخطط تُعتبر معلومات داخلية. يُمنع تداولها أو مناقشتها خارج الاجتماعات الرسمية أو القنوات المخصصة.\n\n"
+    "**4. مسؤولية المنسقين**\n"
+    "المنسقون مسؤولون عن متابعة التزام الجميع بهذه المدونة. التهاون أو التغاضي عن أي مخالفة يُعرض المنسق نفسه للمساءلة.\n\n"
+    "**5. منع الشللية والتكتلات**\n"
+    "يُمنع تكوين مجموعات فرعية أو شلل أو تكتلات لمصالح شخصية أو لأغراض ترفيهية. الفريق وحدة واحدة وأي سلوك يُهدد هذه الوحدة مرفوض.\n\n"
+    "**6. روح الفريق**\n"
+    "الاحترام المتبادل والتعاون أساس عملنا. نشر الطاقة السلبية، إثارة النزاعات أو إحباط الفريق غير مقبول. على الجميع دعم بعضهم البعض للحفاظ على بيئة عمل إيجابية ومنظمة.\n\n"
+    "**7. الحياد عن السياسة والدين**\n"
+    "النقاش أو الجدالات السياسية والدينية ممنوعة داخل أنشطة الفريق. الهدف الحفاظ على وحدة العمل بعيداً عن الانقسامات.\n\n"
+    "**8. المظهر والسلوك**\n"
+    "على كل عضو الالتزام بسلوك محترم ولائق. يُمنع استخدام ألفاظ غير مناسبة أو التصرفات التي تُقلل من صورة الفريق.\n\n"
+    "**9. الالتزام بالمواعيد**\n"
+    "احترام الوقت جزء أساسي من الانضباط. أي تأخير أو غياب دون عذر مقبول يُسجل كمخالفة.\n\n"
+    "**10. الالتزام بالمسؤوليات**\n"
+    "المهام الموكلة لكل عضو واجبة التنفيذ وفق المواعيد والجودة المطلوبة. التهرب أو إهمال الواجبات يُعرض صاحبه للمساءلة.\n\n"
+    "**11. المبادرة والجدية في العمل**\n"
+    "يُشجع كل عضو على المبادرة الإيجابية والاقتراح البناء ضمن القنوات الرسمية. الاستخفاف بالعمل أو الاكتفاء بدور شكلي غير مقبول.\n\n"
+    "**12. الاستمرارية مشروطة**\n"
+    "الالتزام بهذه المدونة شرط للبقاء ضمن الفريق. أي عضو يُكرر التجاوزات أو يرفض الالتزام يُعتبر خارج إطار الفريق.\n\n"
+    "--- **آلية المساءلة** ---\n\n"
+    "العقوبات تتدرج حسب طبيعة المخالفة:\n"
+    "- تنبيه شفهي.\n"
+    "- إنذار خطي.\n"
+    "- حرمان مؤقت من الأنشطة.\n"
+    "- إيقاف أو فصل نهائي في حال المخالفات الجسيمة أو التكرار.\n\n"
+    "**الختام**\n\n"
+    "هذه المدونة تُمثل تعهداً رسمياً. كل عضو يوافق على الالتزام بها بشكل كامل ويُدرك أن أي تجاوز سيُقابل بإجراءات واضحة وفورية."
+)
+# --- نهاية النص الجديد لمدونة السلوك ---
+RULES_TEXT = (
+    "**بنود وقوانين فريق أبناء الأرض:**\n\n"
+    "1. الالتزام بالأهداف الخيرية.\n"
+    "2. عدم مشاركة المعلومات الخاصة.\n"
+    "3. المشاركة الفعالة في الأنشطة.\n"
+    "4. الإبلاغ عن أي مشكلات فوراً.\n"
+    "5. عقوبات: تحذير، إيقاف، إنهاء العضوية حسب الخطأ.\n\n"
+    "للنسخة الكاملة، اطلب من الإدارة. نحن نبني عائلة قوية معاً! 🌹"
+)
+CODE_OF_CONDUCT_DOC = StaticDocument(
+    'code_of_conduct', 'code_of_conduct.txt', CODE_OF_CONDUCT_TEXT,
+    caption="مدوّنة السلوك للعمل التطوعي - فريق أبناء الأرض 🌟",
+)
 
 # Keyboards
 main_keyboard = ReplyKeyboardMarkup(
@@ -167,16 +395,32 @@ admin_keyboard = ReplyKeyboardMarkup(
         [KeyboardButton(text="حذف صور الفريق")],
         [KeyboardButton(text="إرسال رسالة لمستخدم")],
         [KeyboardButton(text="تفقد")],
+        [KeyboardButton(text="تقويم الإجازات")],
         [KeyboardButton(text="رجوع")]
     ],
     resize_keyboard=True,
     one_time_keyboard=False
 )
 
+# Broadcast audience: button text -> "active within N days" (None = everyone)
+BROADCAST_AUDIENCES = {
+    "الجميع": None,
+    "النشطون خلال 7 أيام": 7,
+    "النشطون خلال 30 يوماً": 30,
+}
+
+broadcast_audience_keyboard = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text=text)] for text in BROADCAST_AUDIENCES] + [[KeyboardButton(text="رجوع")]],
+    resize_keyboard=True,
+    one_time_keyboard=False
+)
+
 attendance_keyboard = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text="تفقد اجتماع")],
         [KeyboardButton(text="تفقد مبادرة")],
+        [KeyboardButton(text="نسبة الحضور هذا الشهر")],
+        [KeyboardButton(text="الغائبون عن آخر 3 اجتماعات")],
         [KeyboardButton(text="رجوع")]
     ],
     resize_keyboard=True,
@@ -213,12 +457,14 @@ class TrackStates(StatesGroup):
 class AdminStates(StatesGroup):
     waiting_meeting_type = State()
     waiting_meeting_date = State()
+    waiting_broadcast_audience = State()
     waiting_broadcast_message = State()
     waiting_upload_photo = State()
     waiting_user_id = State()
     waiting_user_message = State()
     waiting_attendance_type = State()
     waiting_attendance_names = State()
+    waiting_calendar_range = State()
 
 class FeedbackStates(StatesGroup):
     waiting_type = State()
@@ -234,14 +480,72 @@ class FeedbackStates(StatesGroup):
     waiting_initiative_timeline = State()
     waiting_initiative_success = State()
 
+# States where the user types free text; only "رجوع" interrupts them
+text_router.free_text(
+    ExcuseStates.waiting_name, ExcuseStates.waiting_activity_type, ExcuseStates.waiting_reason,
+    LeaveStates.waiting_name, LeaveStates.waiting_reason, LeaveStates.waiting_duration,
+    LeaveStates.waiting_start_date, LeaveStates.waiting_end_date,
+    TrackStates.waiting_request_id,
+    AdminStates.waiting_meeting_date, AdminStates.waiting_broadcast_message,
+    AdminStates.waiting_user_id, AdminStates.waiting_user_message, AdminStates.waiting_attendance_names,
+    AdminStates.waiting_calendar_range,
+    FeedbackStates.waiting_bot_suggestion, FeedbackStates.waiting_other_suggestion,
+    FeedbackStates.waiting_initiative_name, FeedbackStates.waiting_initiative_intro,
+    FeedbackStates.waiting_initiative_goals, FeedbackStates.waiting_initiative_target,
+    FeedbackStates.waiting_initiative_plan, FeedbackStates.waiting_initiative_resources,
+    FeedbackStates.waiting_initiative_partners, FeedbackStates.waiting_initiative_timeline,
+    FeedbackStates.waiting_initiative_success,
+)
+
 # Utility functions
-async def send_to_admins(text: str):
-    """Send message to all admins."""
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, text, parse_mode=ParseMode.MARKDOWN)
-        except Exception as e:
-            logger.error(f"Failed to send to admin {admin_id}: {e}")
+async def send_to_admins(text: str, parse_mode=ParseMode.MARKDOWN):
+    """Send message to all admins in parallel. Returns the failed admin IDs."""
+    failures = await fan_out(
+        ADMIN_IDS,
+        lambda admin_id: bot.send_message(admin_id, text, parse_mode=parse_mode),
+        timeout=ADMIN_SEND_TIMEOUT,
+    )
+    for admin_id, e in failures.items():
+        logger.error(f"Failed to send to admin {admin_id}: {e}")
+    return list(failures)
+
+async def next_request_id() -> int:
+    """Return the next request number, unique across restarts and processes."""
+    return await request_ids.next()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Schedule a coroutine without awaiting it, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def drain_background_tasks(timeout: float) -> None:
+    """Wait for queued background work (group posts waiting on rate limits) before shutting down."""
+    pending = [task for task in background_tasks if not task.done()]
+    if not pending:
+        return
+    logger.info(f"Waiting for {len(pending)} background tasks")
+    _, pending = await asyncio.wait(pending, timeout=timeout)
+    if pending:
+        logger.error(f"{len(pending)} background tasks still running after {timeout:.0f}s, cancelling them")
+        for task in pending:
+            task.cancel()
+        await asyncio.wait(pending)
+
+async def notify_group(chat_id: int, text: str, **kwargs) -> None:
+    """Post to an admin group from a background task.
+
+    Groups take 20 messages a minute; waiting for that inside a handler would
+    hold up every other chat sharing the update worker.
+    """
+    try:
+        await bot.send_message(chat_id, text, **kwargs)
+    except asyncio.CancelledError:
+        logger.error(f"Dropped post to group {chat_id} on shutdown: {text.splitlines()[0]}")
+        raise
+    except Exception as e:
+        logger.error(f"Failed to notify group {chat_id}: {e}")
 
 # Debug command for webhook info (admin only)
 @dp.message(Command("webhook"))
@@ -258,7 +562,7 @@ async def check_webhook(message: types.Message):
         logger.error(f"Error in check_webhook: {e}")
 
 # Back navigation handlers
-@dp.message(F.text == "رجوع")
+@text_router.button("رجوع", always=True)
 async def back_to_main(message: types.Message, state: FSMContext):
     await state.clear()
     await message.answer("تم العودة إلى القائمة الرئيسية. نحن هنا لمساعدتك دائماً! 💕", reply_markup=main_keyboard)
@@ -266,7 +570,6 @@ async def back_to_main(message: types.Message, state: FSMContext):
 # Start handler
 @dp.message(Command("start"))
 async def start_handler(message: types.Message):
-    users.add(message.from_user.id)
     await message.answer(
         "مرحباً بك في بوت شؤون الموارد البشرية لفريق أبناء الأرض! 🌟\n"
         "نحن مبسوطين بوجودك معنا، و رح نكون دائماً جنبك  برحلتك التطوعية. 💖\n"
@@ -275,39 +578,35 @@ async def start_handler(message: types.Message):
     )
 
 # Feedback handlers
-@dp.message(F.text == "اقتراحات")
+@text_router.button("اقتراحات")
 async def feedback_start(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await message.answer("شكراً لاهتمامك بتقديم اقتراح! اختر نوع الاقتراح: 💕", reply_markup=feedback_keyboard)
     await state.set_state(FeedbackStates.waiting_type)
     logger.info(f"Feedback state set for user {message.from_user.id}")
 
-@dp.message(F.text == "اقتراح تطوير البوت", StateFilter(FeedbackStates.waiting_type))
+@text_router.button("اقتراح تطوير البوت", state=FeedbackStates.waiting_type)
 async def feedback_bot_start(message: types.Message, state: FSMContext):
     logger.info(f"Feedback bot from {message.from_user.id}")
-    users.add(message.from_user.id)
     await message.answer("شكراً لاقتراحك لتطوير البوت! يرجى كتابة الاقتراح كاملاً: 💕", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_bot_suggestion)
 
 @dp.message(FeedbackStates.waiting_bot_suggestion)
 async def feedback_bot_message(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     user_name = message.from_user.first_name or "غير محدد"
     suggestion_text = message.text
-    await send_to_admins(
+    run_in_background(send_to_admins(
         f"**اقتراح تطوير البوت:**\n"
         f"**المرسل:** {user_name} (ID: {message.from_user.id})\n"
         f"**الاقتراح:** {suggestion_text}\n\n"
         f"**تاريخ:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    )
+    ))
     await message.answer("شكراً جزيلاً لاقتراحك! سنراجعه بعناية لتحسين تجربتك معنا. 🌟", reply_markup=main_keyboard)
     await state.clear()
 
 # --- التعديل هنا: استخدام "آخر" كتقييم سري ---
-@dp.message(F.text == "آخر", StateFilter(FeedbackStates.waiting_type))
+@text_router.button("آخر", state=FeedbackStates.waiting_type)
 async def feedback_secret_start(message: types.Message, state: FSMContext):
     logger.info(f"Secret feedback initiated by {message.from_user.id}")
-    users.add(message.from_user.id)
     
     await message.answer(
         "📝 **التقييم السري (آخر)**\n\n"
@@ -321,16 +620,15 @@ async def feedback_secret_start(message: types.Message, state: FSMContext):
 
 @dp.message(FeedbackStates.waiting_other_suggestion)
 async def feedback_secret_message(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     suggestion_text = message.text
     
     # إرسال الرسالة إلى الأدمنز بدون أي بيانات تعريفية
-    await send_to_admins(
+    run_in_background(send_to_admins(
         f"**📣 تقييم سري جديد (آخر) 📣**\n"
         f"**المرسل:** (مجهول الهوية - حفاظاً على الخصوصية)\n"
         f"**الرسالة:**\n{suggestion_text}\n\n"
         f"**تاريخ:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    )
+    ))
     
     # إرسال رسالة شكر للمستخدم
     await message.answer(
@@ -340,72 +638,62 @@ async def feedback_secret_message(message: types.Message, state: FSMContext):
     await state.clear()
 # --- نهاية التعديل ---
 
-@dp.message(F.text == "اقتراح مبادرة", StateFilter(FeedbackStates.waiting_type))
+@text_router.button("اقتراح مبادرة", state=FeedbackStates.waiting_type)
 async def feedback_initiative_start(message: types.Message, state: FSMContext):
     logger.info(f"Feedback initiative from {message.from_user.id}")
-    users.add(message.from_user.id)
     await message.answer("شكراً لاقتراح مبادرة! يرجى ملء الفورم التالي:\n\n# إسم المبادرة الرئيسي:", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_name)
 
 @dp.message(FeedbackStates.waiting_initiative_name)
 async def feedback_initiative_name(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(initiative_name=message.text)
     await message.answer("#مقدمة المبادرة:", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_intro)
 
 @dp.message(FeedbackStates.waiting_initiative_intro)
 async def feedback_initiative_intro(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(initiative_intro=message.text)
     await message.answer("# أهداف المبادرة:", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_goals)
 
 @dp.message(FeedbackStates.waiting_initiative_goals)
 async def feedback_initiative_goals(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(initiative_goals=message.text)
     await message.answer("#الفئة المستهدفة:", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_target)
 
 @dp.message(FeedbackStates.waiting_initiative_target)
 async def feedback_initiative_target(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(initiative_target=message.text)
     await message.answer("# خطة العمل:", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_plan)
 
 @dp.message(FeedbackStates.waiting_initiative_plan)
 async def feedback_initiative_plan(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(initiative_plan=message.text)
     await message.answer("# الموارد المطلوبة :", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_resources)
 
 @dp.message(FeedbackStates.waiting_initiative_resources)
 async def feedback_initiative_resources(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(initiative_resources=message.text)
     await message.answer("#الشركاء والداعمين :", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_partners)
 
 @dp.message(FeedbackStates.waiting_initiative_partners)
 async def feedback_initiative_partners(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(initiative_partners=message.text)
     await message.answer("# الجدول الزمني :", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_timeline)
 
 @dp.message(FeedbackStates.waiting_initiative_timeline)
 async def feedback_initiative_timeline(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(initiative_timeline=message.text)
     await message.answer("# قياس النجاح :", reply_markup=back_keyboard)
     await state.set_state(FeedbackStates.waiting_initiative_success)
 
 @dp.message(FeedbackStates.waiting_initiative_success)
 async def feedback_initiative_success(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     data = await state.get_data()
     await state.update_data(initiative_success=message.text)
     user_name = message.from_user.first_name or "غير محدد"
@@ -423,27 +711,24 @@ async def feedback_initiative_success(message: types.Message, state: FSMContext)
         f"**قياس النجاح:** {message.text}\n\n"
         f"**تاريخ:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
-    await send_to_admins(initiative_report)
+    run_in_background(send_to_admins(initiative_report))
     await message.answer("شكراً جزيلاً لاقتراحك! سنراجعه بعناية. 🌟", reply_markup=main_keyboard)
     await state.clear()
 
 # Excuse handlers
-@dp.message(F.text == "اعتذار")
+@text_router.button("اعتذار")
 async def excuse_start(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await message.answer("ما اسمك الكامل؟ نحن نقدر جهودك دائماً! 😊", reply_markup=back_keyboard)
     await state.set_state(ExcuseStates.waiting_name)
 
 @dp.message(ExcuseStates.waiting_name)
 async def excuse_name(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(name=message.text)
     await message.answer(f"مرحباً {message.text}، سعيدون بك معنا! 🌹\nعن شو الاعتذار؟", reply_markup=activity_keyboard)
     await state.set_state(ExcuseStates.waiting_activity_type)
 
 @dp.message(ExcuseStates.waiting_activity_type)
 async def excuse_activity_type(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     data = await state.get_data()
     activity_type = message.text
     if activity_type == "رجوع":
@@ -456,7 +741,6 @@ async def excuse_activity_type(message: types.Message, state: FSMContext):
 
 @dp.message(ExcuseStates.waiting_reason)
 async def excuse_reason(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     data = await state.get_data()
     await state.update_data(reason=message.text)
     await message.answer(
@@ -470,74 +754,89 @@ async def excuse_reason(message: types.Message, state: FSMContext):
     )
     await state.set_state(ExcuseStates.waiting_confirm)
 
-@dp.message(F.text == "تأكيد الطلب", StateFilter(ExcuseStates.waiting_confirm))
+@text_router.button("تأكيد الطلب", state=ExcuseStates.waiting_confirm)
 async def confirm_excuse(message: types.Message, state: FSMContext):
     logger.info(f"Confirm excuse from {message.from_user.id}")
-    global request_counter
-    users.add(message.from_user.id)
     data = await state.get_data()
     user_id = message.from_user.id
-    request_id = request_counter
-    request_counter += 1
+    request_id = await next_request_id()
+    volunteer_id = volunteer_roster.resolve(data['name'], confirm=True)
+    request_registry.create(request_id, user_id, 'excuse', {
+        'name': data['name'],
+        'volunteer_id': volunteer_id,
+        'activity_type': data.get('activity_type', 'غير محدد'),
+        'reason': data.get('reason', 'غير محدد'),
+    })
     activity_details = f"نوع النشاط: {data.get('activity_type', 'غير محدد')}\nالسبب: {data.get('reason', 'غير محدد')}"
     await message.answer(f"شكراً لك يا {data['name']}، طلبك #{request_id} وصلنا بسلام! سنعالجه بكل حب قريباً. 💕", reply_markup=main_keyboard)
+    if NOTIFICATION_DIGEST:
+        line = f"{data['name']} (متطوع {volunteer_id}) — {data.get('activity_type', 'غير محدد')}: {data.get('reason', 'غير محدد')}"
+        await request_digests.add(EXCUSE_GROUP_ID, digest_item(request_id, user_id, 'excuse', line))
+        await state.clear()
+        return
     admin_keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(text="قبول", callback_data=f"approve_excuse_{request_id}_{user_id}"),
             InlineKeyboardButton(text="رفض", callback_data=f"reject_excuse_{request_id}_{user_id}")
         ]
     ])
-    await bot.send_message(
+    run_in_background(notify_group(
         EXCUSE_GROUP_ID,
         f"**طلب اعتذار جديد #{request_id}**\n"
         f"**مقدم الطلب:** {data['name']}\n"
+        f"**رقم المتطوع:** {volunteer_id}\n"
         f"**رقم الطلب:** {request_id}\n"
         f"{activity_details}",
         reply_markup=admin_keyboard
-    )
+    ))
     await state.clear()
 
 # Leave handlers
-@dp.message(F.text == "إجازة")
+@text_router.button("إجازة")
 async def leave_start(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await message.answer("ما اسمك الكامل كمتطوع؟ نحن نقدر جهودك دائماً! 😊", reply_markup=back_keyboard)
     await state.set_state(LeaveStates.waiting_name)
 
 @dp.message(LeaveStates.waiting_name)
 async def leave_name(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(name=message.text)
     await message.answer(f"اهلييين {message.text}، سعيدون بك معنا! 🌹\nما سبب الإجازة؟", reply_markup=back_keyboard)
     await state.set_state(LeaveStates.waiting_reason)
 
 @dp.message(LeaveStates.waiting_reason)
 async def leave_reason(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(reason=message.text)
     await message.answer("ما مدة الإجازة (بالأيام)؟ نتمنى لك وقتاً جميلاً! 💕", reply_markup=back_keyboard)
     await state.set_state(LeaveStates.waiting_duration)
 
 @dp.message(LeaveStates.waiting_duration)
 async def leave_duration(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     await state.update_data(duration=message.text)
     await message.answer("ما تاريخ بدء الإجازة (YYYY-MM-DD)؟", reply_markup=back_keyboard)
     await state.set_state(LeaveStates.waiting_start_date)
 
 @dp.message(LeaveStates.waiting_start_date)
 async def leave_start_date(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
-    await state.update_data(start_date=message.text)
+    start_date = parse_date(message.text)
+    if start_date is None:
+        await message.answer("لم أفهم التاريخ، أدخله بالشكل YYYY-MM-DD (مثال: 2026-11-05):", reply_markup=back_keyboard)
+        return
+    await state.update_data(start_date=start_date.isoformat())
     await message.answer("ما تاريخ انتهاء الإجازة (YYYY-MM-DD)؟", reply_markup=back_keyboard)
     await state.set_state(LeaveStates.waiting_end_date)
 
 @dp.message(LeaveStates.waiting_end_date)
 async def leave_end_date(message: types.Message, state: FSMContext):
-    users.add(message.from_user.id)
     data = await state.get_data()
-    await state.update_data(end_date=message.text)
-    details = f"مدة: {data['duration']} أيام\nتاريخ البدء: {data['start_date']}\nتاريخ الانتهاء: {message.text}"
+    end_date = parse_date(message.text)
+    if end_date is None:
+        await message.answer("لم أفهم التاريخ، أدخله بالشكل YYYY-MM-DD (مثال: 2026-11-08):", reply_markup=back_keyboard)
+        return
+    if end_date.isoformat() < data['start_date']:
+        await message.answer(f"تاريخ الانتهاء يجب أن يكون بعد تاريخ البدء ({data['start_date']})، أدخله مجدداً:", reply_markup=back_keyboard)
+        return
+    await state.update_data(end_date=end_date.isoformat())
+    details = f"مدة: {data['duration']} أيام\nتاريخ البدء: {data['start_date']}\nتاريخ الانتهاء: {end_date.isoformat()}"
     await message.answer(
         f"شكراً لثقتك بنا، {data['name']}! 😊\n"
         f"تأكيد الطلب:\n"
@@ -549,34 +848,123 @@ async def leave_end_date(message: types.Message, state: FSMContext):
     )
     await state.set_state(LeaveStates.waiting_confirm)
 
-@dp.message(F.text == "تأكيد الطلب", StateFilter(LeaveStates.waiting_confirm))
+@text_router.button("تأكيد الطلب", state=LeaveStates.waiting_confirm)
 async def confirm_leave(message: types.Message, state: FSMContext):
     logger.info(f"Confirm leave from {message.from_user.id}")
-    global request_counter
-    users.add(message.from_user.id)
     data = await state.get_data()
     user_id = message.from_user.id
-    request_id = request_counter
-    request_counter += 1
+    request_id = await next_request_id()
+    volunteer_id = volunteer_roster.resolve(data['name'], confirm=True)
+    request_registry.create(request_id, user_id, 'leave', {
+        'name': data['name'],
+        'volunteer_id': volunteer_id,
+        'reason': data['reason'],
+        'duration': data['duration'],
+        'start_date': data['start_date'],
+        'end_date': data['end_date'],
+    })
     details = f"مدة: {data['duration']} أيام\nتاريخ البدء: {data['start_date']}\nتاريخ الانتهاء: {data['end_date']}"
     await message.answer(f"شكراً لك يا {data['name']}، طلبك #{request_id} وصلنا بسلام! سنعالجه بكل حب قريباً. 💕", reply_markup=main_keyboard)
+    if NOTIFICATION_DIGEST:
+        line = f"{data['name']} (متطوع {volunteer_id}) — {data['start_date']} → {data['end_date']}: {data['reason']}"
+        await request_digests.add(LEAVE_GROUP_ID, digest_item(request_id, user_id, 'leave', line))
+        await state.clear()
+        return
     admin_keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(text="قبول", callback_data=f"approve_leave_{request_id}_{user_id}"),
             InlineKeyboardButton(text="رفض", callback_data=f"reject_leave_{request_id}_{user_id}")
         ]
     ])
-    await bot.send_message(
+    run_in_background(notify_group(
         LEAVE_GROUP_ID,
         f"**طلب إجازة جديد #{request_id}**\n"
         f"**مقدم الطلب:** {data['name']}\n"
+        f"**رقم المتطوع:** {volunteer_id}\n"
         f"**رقم الطلب:** {request_id}\n"
         f"**سبب الإجازة:** {data['reason']}\n"
         f"**التفاصيل:** {details}",
         reply_markup=admin_keyboard
-    )
+    ))
     await state.clear()
 
+# Leave calendar helpers
+def leave_interval(record: dict):
+    """Parsed (start, end) of a leave request, or None for unparseable older requests."""
+    start = parse_date(record['payload'].get('start_date', ''))
+    end = parse_date(record['payload'].get('end_date', ''))
+    if start is None or end is None or end < start:
+        return None
+    return start, end
+
+def add_to_leave_calendar(record: dict) -> None:
+    interval = leave_interval(record)
+    if interval is None:
+        logger.warning(f"Leave request #{record['request_id']} has no valid dates, not added to the calendar")
+        return
+    leave_calendar.add(record['request_id'], record['payload'].get('volunteer_id'), record['payload']['name'], *interval)
+
+def staffing_warning(request_id: int):
+    """Warning text if approving this leave leaves fewer than MIN_STAFFING volunteers on some day."""
+    record = request_registry.get(request_id)
+    if not MIN_STAFFING or record is None:
+        return None
+    interval = leave_interval(record)
+    if interval is None:
+        return None
+    leave = {
+        'volunteer_id': record['payload'].get('volunteer_id'),
+        'name': record['payload']['name'],
+        'start': interval[0].isoformat(),
+        'end': interval[1].isoformat(),
+    }
+    absent, day = leave_calendar.peak_absent(*interval, extra=leave)
+    if TEAM_SIZE - absent >= MIN_STAFFING:
+        return None
+    return f"قبول هذه الإجازة يترك {TEAM_SIZE - absent} متطوعين فقط يوم {day.isoformat()} (الحد الأدنى {MIN_STAFFING})."
+
+def admin_name(user_id) -> str:
+    profile = user_registry.get(user_id) if user_id is not None else None
+    return profile[1] if profile and profile[1] else str(user_id)
+
+async def answer_if_decided(callback: types.CallbackQuery, request_id: int, status: str) -> bool:
+    """Answer a tap on an already decided request, without touching the group or the volunteer."""
+    record = request_registry.get(request_id)
+    if record is not None and record['status'] != STATUS_PENDING:
+        # Decided before decisions were logged; that decision stands
+        last = record['history'][-1]
+        await request_decisions.seed(request_id, record['status'], last['by'], last['at'])
+    decision = await request_decisions.check(request_id, status, callback.from_user.id)
+    if decision is None:
+        return False
+    await callback.answer(format_decided(decision, admin_name(decision['by'])), show_alert=True)
+    return True
+
+async def announce_decision(callback: types.CallbackQuery, request_id: int, user_id: int, status: str,
+                            user_text: str, note: str) -> None:
+    """Answer the tap, tell the volunteer and update the group message.
+
+    The tap is answered first, before anything that may wait on rate limits,
+    so the admin's spinner stops within Telegram's callback deadline. Runs
+    after the decision is claimed, so every step is attempted even if an
+    earlier one fails; otherwise a volunteer who blocked the bot would leave
+    the group message with live buttons that only answer "already decided".
+    """
+    try:
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Failed to answer the decision on request #{request_id}: {e}")
+    try:
+        await bot.send_message(user_id, user_text)
+    except Exception as e:
+        logger.error(f"Failed to tell user {user_id} about request #{request_id}: {e}")
+    chat_id, message_id = callback.message.chat.id, callback.message.message_id
+    try:
+        if not await request_digests.decide(chat_id, message_id, request_id, status):
+            await callback.message.edit_text(callback.message.text + f"\n\n{note}")
+    except Exception as e:
+        logger.error(f"Failed to update the group message for request #{request_id}: {e}")
+
 # Request approval/rejection handlers (keep inline for admin group)
 @dp.callback_query(F.data.startswith("approve_"))
 async def approve_request(callback: types.CallbackQuery):
@@ -588,9 +976,37 @@ async def approve_request(callback: types.CallbackQuery):
     request_type = parts[1]
     request_id = parts[2]
     user_id = int(parts[3])
-    await bot.send_message(user_id, f" ابشر! 🎉 تم قبول طلبك #{request_id} بكل فرحة. نحن فخورون بك! 💖")
-    await callback.message.edit_text(callback.message.text + "\n\n**تم القبول.**")
-    await callback.answer()
+    forced = len(parts) > 4 and parts[4] == "force"
+    if await answer_if_decided(callback, int(request_id), STATUS_APPROVED):
+        return
+    chat_id, message_id = callback.message.chat.id, callback.message.message_id
+    if request_type == "leave" and not forced:
+        warning = staffing_warning(int(request_id))
+        if warning and request_digests.get(chat_id, message_id) is not None:
+            await callback.answer(warning, show_alert=True)
+            await request_digests.warn(chat_id, message_id, int(request_id), warning)
+            return
+        if warning:
+            force_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [
+                    InlineKeyboardButton(text="قبول رغم ذلك", callback_data=f"approve_leave_{request_id}_{user_id}_force"),
+                    InlineKeyboardButton(text="رفض", callback_data=f"reject_leave_{request_id}_{user_id}")
+                ]
+            ])
+            await callback.answer(warning, show_alert=True)
+            await callback.message.edit_text(callback.message.text + f"\n\n⚠️ {warning}", reply_markup=force_keyboard)
+            return
+    decision, applied = await request_decisions.decide(int(request_id), STATUS_APPROVED, callback.from_user.id)
+    if not applied:
+        await callback.answer(format_decided(decision, admin_name(decision['by'])), show_alert=True)
+        return
+    record = request_registry.set_status(int(request_id), STATUS_APPROVED, by=callback.from_user.id)
+    if request_type == "leave" and record is not None:
+        add_to_leave_calendar(record)
+    await announce_decision(
+        callback, int(request_id), user_id, STATUS_APPROVED,
+        f" ابشر! 🎉 تم قبول طلبك #{request_id} بكل فرحة. نحن فخورون بك! 💖", "**تم القبول.**"
+    )
 
 @dp.callback_query(F.data.startswith("reject_"))
 async def reject_request(callback: types.CallbackQuery):
@@ -602,145 +1018,167 @@ async def reject_request(callback: types.CallbackQuery):
     request_type = parts[1]
     request_id = parts[2]
     user_id = int(parts[3])
-    await bot.send_message(user_id, f"نأسف لإخبارك بذلك، 😔 تم رفض طلبك #{request_id}. يرجى التواصل مع الإدارة للمزيد من التفاصيل. نحن هنا لدعمك!")
-    await callback.message.edit_text(callback.message.text + "\n\n**تم الرفض.**")
-    await callback.answer()
+    if await answer_if_decided(callback, int(request_id), STATUS_REJECTED):
+        return
+    decision, applied = await request_decisions.decide(int(request_id), STATUS_REJECTED, callback.from_user.id)
+    if not applied:
+        await callback.answer(format_decided(decision, admin_name(decision['by'])), show_alert=True)
+        return
+    request_registry.set_status(int(request_id), STATUS_REJECTED, by=callback.from_user.id)
+    if request_type == "leave":
+        leave_calendar.remove(int(request_id))
+    await announce_decision(
+        callback, int(request_id), user_id, STATUS_REJECTED,
+        f"نأسف لإخبارك بذلك، 😔 تم رفض طلبك #{request_id}. يرجى التواصل مع الإدارة للمزيد من التفاصيل. نحن هنا لدعمك!",
+        "**تم الرفض.**"
+    )
 
 # Track requests handler
-@dp.message(F.text == "تتبع طلباتي")
+@text_router.button("تتبع طلباتي")
 async def track_start(message: types.Message, state: FSMContext):
-    await message.answer(" ميزة التتبع لسا ما جهزت . حكي محمد الجرك مطور البوت و المسؤول اللطيف. 💕", reply_markup=back_keyboard)
+    my_requests = request_registry.for_user(message.from_user.id, limit=10)
+    if not my_requests:
+        await message.answer("ما عندك أي طلبات حتى الآن. نحن هنا متى احتجتنا! 💕", reply_markup=main_keyboard)
+        return
+    lines = "\n".join(format_request_line(record) for record in my_requests)
+    await message.answer(
+        f"طلباتك الأخيرة:\n{lines}\n\nأرسل رقم الطلب لعرض تفاصيله، أو اضغط رجوع. 😊",
+        reply_markup=back_keyboard
+    )
+    await state.set_state(TrackStates.waiting_request_id)
+
+@dp.message(TrackStates.waiting_request_id)
+async def track_request_details(message: types.Message, state: FSMContext):
+    try:
+        request_id = int((message.text or "").strip().lstrip('#'))
+    except ValueError:
+        await message.answer("يرجى إدخال رقم الطلب فقط (مثال: 12).")
+        return
+    record = request_registry.get(request_id)
+    if record is None or record['user_id'] != message.from_user.id:
+        await message.answer("لم نجد طلباً بهذا الرقم ضمن طلباتك. تأكد من الرقم وحاول مجدداً. 💕")
+        return
+    await message.answer(format_request_details(record), reply_markup=back_keyboard)
 
 # References handlers
-@dp.message(F.text == "مراجع الفريق")
+@text_router.button("مراجع الفريق")
 async def references_handler(message: types.Message):
     await message.answer("نحن فخورون بقيمنا في فريق أبناء الأرض! 🌟\nاختر المرجع:", reply_markup=refs_keyboard)
 
-@dp.message(F.text == "مدونة السلوك")
+@text_router.button("مدونة السلوك")
 async def code_of_conduct(message: types.Message):
     logger.info(f"Code of conduct from {message.from_user.id}")
-    # --- النص الجديد لمدونة السلوك ---
-    text = (
-        "**مدوّنة السلوك للعمل التطوعي**\n\n"
-        "تصدر هذه 'مدونة السلوك' كوثيقة ملزمة للإدارة والمنسقين والمتطوعين من أجل الحفاظ على بيئة عمل منظمة، محترمة، قائمة على الانضباط وروح الفريق.\n\n"
-        "**الالتزام بما يلي هو شرط أساسي للاستمرار ضمن الفريق.**\n\n"
-        "--- **مبادئ السلوك والالتزام** ---\n\n"
-        "**1. الجدية والانضباط**\n"
-        "المطلوب من كل عضو الالتزام بالجدية الكاملة في أداء المهام. أي استهتار أو تعامل غير مسؤول مع الأنشطة مرفوض رفضاً قاطعاً.\n\n"
-        "**2. الفصل بين الشخصي والعمل**\n"
-        "يُمنع إدخال الاهتمامات أو العلاقات الشخصية في العمل التطوعي، مساحة مهنية. أي محاولة لخلط الشخصي مع العمل تُعتبر إخلالاً مباشراً بالمسؤولية.\n\n"
-        "**3. سرية المعلومات**\n"
-        "جميع تفاصيل العمل والقرارات والخطط تُعتبر معلومات داخلية. يُمنع تداولها أو مناقشتها خارج الاجتماعات الرسمية أو القنوات المخصصة.\n\n"
-        "**4. مسؤولية المنسقين**\n"
-        "المنسقون مسؤولون عن متابعة التزام الجميع بهذه المدونة. التهاون أو التغاضي عن أي مخالفة يُعرض المنسق نفسه للمساءلة.\n\n"
-        "**5. منع الشللية والتكتلات**\n"
-        "يُمنع تكوين مجموعات فرعية أو شلل أو تكتلات لمصالح شخصية أو لأغراض ترفيهية. الفريق وحدة واحدة وأي سلوك يُهدد هذه الوحدة مرفوض.\n\n"
-        "**6. روح الفريق**\n"
-        "الاحترام المتبادل والتعاون أساس عملنا. نشر الطاقة السلبية، إثارة النزاعات أو إحباط الفريق غير مقبول. على الجميع دعم بعضهم البعض للحفاظ على بيئة عمل إيجابية ومنظمة.\n\n"
-        "**7. الحياد عن السياسة والدين**\n"
-        "النقاش أو الجدالات السياسية والدينية ممنوعة داخل أنشطة الفريق. الهدف الحفاظ على وحدة العمل بعيداً عن الانقسامات.\n\n"
-        "**8. المظهر والسلوك**\n"
-        "على كل عضو الالتزام بسلوك محترم ولائق. يُمنع استخدام ألفاظ غير مناسبة أو التصرفات التي تُقلل من صورة الفريق.\n\n"
-        "**9. الالتزام بالمواعيد**\n"
-        "احترام الوقت جزء أساسي من الانضباط. أي تأخير أو غياب دون عذر مقبول يُسجل كمخالفة.\n\n"
-        "**10. الالتزام بالمسؤوليات**\n"
-        "المهام الموكلة لكل عضو واجبة التنفيذ وفق المواعيد والجودة المطلوبة. التهرب أو إهمال الواجبات يُعرض صاحبه للمساءلة.\n\n"
-        "**11. المبادرة والجدية في العمل**\n"
-        "يُشجع كل عضو على المبادرة الإيجابية والاقتراح البناء ضمن القنوات الرسمية. الاستخفاف بالعمل أو الاكتفاء بدور شكلي غير مقبول.\n\n"
-        "**12. الاستمرارية مشروطة**\n"
-        "الالتزام بهذه المدونة شرط للبقاء ضمن الفريق. أي عضو يُكرر التجاوزات أو يرفض الالتزام يُعتبر خارج إطار الفريق.\n\n"
-        "--- **آلية المساءلة** ---\n\n"
-        "العقوبات تتدرج حسب طبيعة المخالفة:\n"
-        "- تنبيه شفهي.\n"
-        "- إنذار خطي.\n"
-        "- حرمان مؤقت من الأنشطة.\n"
-        "- إيقاف أو فصل نهائي في حال المخالفات الجسيمة أو التكرار.\n\n"
-        "**الختام**\n\n"
-        "هذه المدونة تُمثل تعهداً رسمياً. كل عضو يوافق على الالتزام بها بشكل كامل ويُدرك أن أي تجاوز سيُقابل بإجراءات واضحة وفورية."
-    )
-    # --- نهاية النص الجديد لمدونة السلوك ---
-    await message.answer(text, reply_markup=back_keyboard, parse_mode=ParseMode.MARKDOWN)
+    if REFERENCE_DOCS:
+        await static_assets.send(bot, message.chat.id, CODE_OF_CONDUCT_DOC, reply_markup=back_keyboard)
+        return
+    await message.answer(CODE_OF_CONDUCT_TEXT, reply_markup=back_keyboard, parse_mode=ParseMode.MARKDOWN)
 
-@dp.message(F.text == "بنود وقوانين الفريق")
+@text_router.button("بنود وقوانين الفريق")
 async def rules(message: types.Message):
     logger.info(f"Rules from {message.from_user.id}")
-    text = (
-        "**بنود وقوانين فريق أبناء الأرض:**\n\n"
-        "1. الالتزام بالأهداف الخيرية.\n"
-        "2. عدم مشاركة المعلومات الخاصة.\n"
-        "3. المشاركة الفعالة في الأنشطة.\n"
-        "4. الإبلاغ عن أي مشكلات فوراً.\n"
-        "5. عقوبات: تحذير، إيقاف، إنهاء العضوية حسب الخطأ.\n\n"
-        "للنسخة الكاملة، اطلب من الإدارة. نحن نبني عائلة قوية معاً! 🌹"
-    )
-    await message.answer(text, reply_markup=back_keyboard)
+    await message.answer(RULES_TEXT, reply_markup=back_keyboard)
 
 # Motivational and Dhikr handlers
-@dp.message(F.text == "أهدني عبارة")
+@text_router.button("أهدني عبارة")
 async def phrase_handler(message: types.Message):
     phrase = random.choice(motivational_phrases)
     await message.answer(f"{phrase} 💖", reply_markup=main_keyboard)
 
-@dp.message(F.text == "لا تنس ذكر الله")
+@text_router.button("لا تنس ذكر الله")
 async def dhikr_handler(message: types.Message):
-    dhikr = "\n".join(dhikr_phrases)
-    await message.answer(f"{dhikr} 🌟", reply_markup=main_keyboard)
+    await message.answer(DHIKR_TEXT, reply_markup=main_keyboard)
 
 # Inquiries handlers
-@dp.message(F.text == "استعلامات")
+@text_router.button("استعلامات")
 async def inquiries_handler(message: types.Message):
     await message.answer("نحن هنا لنجيب على استفساراتك بكل حب! 💕\nاختر نوع الاستعلام:", reply_markup=inquiries_keyboard)
 
-@dp.message(F.text == "استعلام عن اجتماع")
+@text_router.button("استعلام عن اجتماع")
 async def inquire_meeting(message: types.Message):
     logger.info(f"Inquire meeting from {message.from_user.id}")
     await message.answer("اختر الاجتماع الذي تهتم به: 😊", reply_markup=meeting_keyboard)
 
-@dp.message(F.text == "الاجتماع العام")
+def meeting_time_text(meeting_type: str) -> str:
+    """Next occurrence of a scheduled meeting, or the stored text for older entries."""
+    occurrence = meeting_reminders.next_occurrence(meeting_type)
+    if occurrence is not None:
+        return format_meeting_time(*occurrence)
+    return meeting_schedules.get(meeting_type, 'لسا ما تحدد')
+
+@text_router.button("الاجتماع العام")
 async def meeting_general(message: types.Message):
     logger.info(f"Meeting general from {message.from_user.id}")
-    date = meeting_schedules.get('الاجتماع العام', 'لسا ما تحدد')
+    date = meeting_time_text('الاجتماع العام')
     await message.answer(f"موعد الاجتماع العام: {date}\n\nنحن نتطلع للقائك هناك! 🌹", reply_markup=back_keyboard)
 
-@dp.message(F.text == "اجتماع فريق الدعم الاول")
+@text_router.button("اجتماع فريق الدعم الاول")
 async def meeting_support1(message: types.Message):
     logger.info(f"Meeting support1 from {message.from_user.id}")
-    date = meeting_schedules.get('اجتماع فريق الدعم الاول', 'لسا ما تحدد')
+    date = meeting_time_text('اجتماع فريق الدعم الاول')
     await message.answer(f"موعد اجتماع فريق الدعم الاول: {date}\n\nمعاً نبني الدعم الأقوى! 💪", reply_markup=back_keyboard)
 
-@dp.message(F.text == "اجتماع فريق الدعم الثاني")
+@text_router.button("اجتماع فريق الدعم الثاني")
 async def meeting_support2(message: types.Message):
     logger.info(f"Meeting support2 from {message.from_user.id}")
-    date = meeting_schedules.get('فريق الدعم الثاني', 'لسا ما تحدد')
+    date = meeting_time_text('فريق الدعم الثاني')
     await message.answer(f"موعد فريق الدعم الثاني: {date}\n\nدعمكم يلهمنا دائماً! 😊", reply_markup=back_keyboard)
 
-@dp.message(F.text == "اجتماع الفريق المركزي")
+@text_router.button("اجتماع الفريق المركزي")
 async def meeting_central(message: types.Message):
     logger.info(f"Meeting central from {message.from_user.id}")
-    date = meeting_schedules.get('الفريق المركزي', 'لسا ما تحدد')
+    date = meeting_time_text('الفريق المركزي')
     await message.answer(f"موعد الفريق المركزي: {date}\n\nمركزنا هو قلب الفريق! ❤️", reply_markup=back_keyboard)
 
 # Team photos handler
-@dp.message(F.text == "تحميل صور الفريق الاخيرة")
+def latest_photos(offset: int, limit: int = PHOTOS_PAGE_SIZE) -> list:
+    """Return up to `limit` (photo_key, photo_info) pairs, newest first, skipping the `offset` newest."""
+    return list(islice(reversed(team_photos.items()), offset, offset + limit))
+
+async def send_photos_page(chat_id: int, offset: int) -> None:
+    """Send one album of team photos and, if older ones exist, a 'more' button."""
+    page = latest_photos(offset)
+    total = len(team_photos)
+    media = [types.InputMediaPhoto(media=photo_info['file_id']) for _, photo_info in page]
+    media[0].caption = f"صور الفريق ({offset + 1}-{offset + len(page)} من {total}) 🌟"
+    if len(media) == 1:
+        await bot.send_photo(chat_id, media[0].media, caption=media[0].caption)
+    else:
+        await bot.send_media_group(chat_id, media)
+    next_offset = offset + len(page)
+    if next_offset < total:
+        more_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="المزيد من الصور ⬅️", callback_data=f"photos_page_{next_offset}")]
+        ])
+        await bot.send_message(chat_id, f"بقي {total - next_offset} صور أقدم.", reply_markup=more_keyboard)
+
+@text_router.button("تحميل صور الفريق الاخيرة")
 async def download_team_photos(message: types.Message):
     if not team_photos:
         await message.answer("لا توجد صور متاحة حالياً. شكراً لاهتمامك! 💕", reply_markup=main_keyboard)
         return
-    # Send the last 5 photos or all if less
-    num_photos = min(5, len(team_photos))
-    await message.answer(f"بدء تحميل آخر {num_photos} صور للفريق. قد يستغرق الأمر بعض الوقت...", reply_markup=main_keyboard)
-    for i in range(num_photos):
-        photo_info = team_photos[-1 - i]  # Reverse to get latest first
-        try:
-            await bot.send_photo(
-                message.chat.id,
-                photo_info['file_id'],
-                caption=f"صورة الفريق الأخيرة ({i+1}/{num_photos}) 🌟"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send photo {i+1}: {e}")
-            await message.answer(f"حدث خطأ أثناء إرسال الصورة رقم {i+1}.")
-    await message.answer("تم تحميل أحدث الصور! استمتع بذكرياتنا معاً. 💖", reply_markup=main_keyboard)
+    try:
+        await send_photos_page(message.chat.id, 0)
+    except Exception as e:
+        logger.error(f"Failed to send team photos: {e}")
+        await message.answer("حدث خطأ أثناء إرسال الصور.", reply_markup=main_keyboard)
+
+@dp.callback_query(F.data.startswith("photos_page_"))
+async def download_team_photos_page(callback: types.CallbackQuery):
+    try:
+        offset = int(callback.data.split("_")[2])
+    except ValueError:
+        await callback.answer()
+        return
+    if offset >= len(team_photos):
+        await callback.answer("لا توجد صور أقدم.")
+        return
+    await callback.answer()
+    try:
+        # The old button is replaced by the one sent after the next album
+        await callback.message.delete()
+        await send_photos_page(callback.message.chat.id, offset)
+    except Exception as e:
+        logger.error(f"Failed to send team photos page {offset}: {e}")
 
 # Admin panel handlers
 @dp.message(Command("admin"))
@@ -751,44 +1189,44 @@ async def admin_panel(message: types.Message, state: FSMContext):
     await message.answer("لوحة التحكم للأدمن: نحن فخورون بإدارتك الرائعة! 🌟", reply_markup=admin_keyboard)
 
 # Admin meeting schedule handlers
-@dp.message(F.text == "وضع موعد الاجتماع العام")
+@text_router.button("وضع موعد الاجتماع العام")
 async def admin_general(message: types.Message, state: FSMContext):
     logger.info(f"Admin general from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("رو من هان مانك آدمن ")
         return
     await state.update_data(meeting_type='الاجتماع العام')
-    await message.answer("أدخل موعد الاجتماع العام (YYYY-MM-DD HH:MM): شكراً لجهودك في تنظيمنا! 😊", reply_markup=back_keyboard)
+    await message.answer("أدخل موعد الاجتماع العام (YYYY-MM-DD HH:MM، وأضف «أسبوعي» للتكرار): شكراً لجهودك في تنظيمنا! 😊", reply_markup=back_keyboard)
     await state.set_state(AdminStates.waiting_meeting_date)
 
-@dp.message(F.text == "وضع موعد دعم أول")
+@text_router.button("وضع موعد دعم أول")
 async def admin_support1(message: types.Message, state: FSMContext):
     logger.info(f"Admin support1 from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("كاشفك ، مانك آدمن 😝")
         return
     await state.update_data(meeting_type='اجتماع فريق الدعم الاول')
-    await message.answer("أدخل موعد اجتماع فريق الدعم الاول (YYYY-MM-DD HH:MM):", reply_markup=back_keyboard)
+    await message.answer("أدخل موعد اجتماع فريق الدعم الاول (YYYY-MM-DD HH:MM، وأضف «أسبوعي» للتكرار):", reply_markup=back_keyboard)
     await state.set_state(AdminStates.waiting_meeting_date)
 
-@dp.message(F.text == "وضع موعد دعم ثاني")
+@text_router.button("وضع موعد دعم ثاني")
 async def admin_support2(message: types.Message, state: FSMContext):
     logger.info(f"Admin support2 from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("غير مصرح لك!")
         return
     await state.update_data(meeting_type='فريق الدعم الثاني')
-    await message.answer("أدخل موعد فريق الدعم الثاني (YYYY-MM-DD HH:MM):", reply_markup=back_keyboard)
+    await message.answer("أدخل موعد فريق الدعم الثاني (YYYY-MM-DD HH:MM، وأضف «أسبوعي» للتكرار):", reply_markup=back_keyboard)
     await state.set_state(AdminStates.waiting_meeting_date)
 
-@dp.message(F.text == "وضع موعد مركزي")
+@text_router.button("وضع موعد مركزي")
 async def admin_central(message: types.Message, state: FSMContext):
     logger.info(f"Admin central from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("غير مصرح لك!")
         return
     await state.update_data(meeting_type='الفريق المركزي')
-    await message.answer("أدخل موعد الفريق المركزي (YYYY-MM-DD HH:MM):", reply_markup=back_keyboard)
+    await message.answer("أدخل موعد الفريق المركزي (YYYY-MM-DD HH:MM، وأضف «أسبوعي» للتكرار):", reply_markup=back_keyboard)
     await state.set_state(AdminStates.waiting_meeting_date)
 
 @dp.message(AdminStates.waiting_meeting_date)
@@ -799,50 +1237,165 @@ async def admin_set_date(message: types.Message, state: FSMContext):
         return
     data = await state.get_data()
     meeting_type = data['meeting_type']
-    meeting_date = message.text
+    parsed = parse_meeting_time(message.text, TZ)
+    if parsed is None:
+        await message.answer(
+            "صيغة الموعد غير صحيحة، أدخله بالشكل YYYY-MM-DD HH:MM (مثال: 2026-11-05 18:30)، "
+            "وأضف كلمة «أسبوعي» إذا كان الاجتماع يتكرر كل أسبوع:",
+            reply_markup=back_keyboard
+        )
+        return
+    at, repeat_days = parsed
+    meeting_reminders.schedule(meeting_type, at, repeat_days)
+    meeting_date = meeting_time_text(meeting_type)
     meeting_schedules[meeting_type] = meeting_date
     await message.answer(f"تم حفظ موعد {meeting_type}: {meeting_date}\nشكراً لك، أنت تجعل فريقنا أقوى! 🌹", reply_markup=admin_keyboard)
     await state.clear()
 
 # Admin broadcast handlers
-@dp.message(F.text == "إرسال بث للجميع")
+@text_router.button("إرسال بث للجميع")
 async def admin_broadcast_start(message: types.Message, state: FSMContext):
     logger.info(f"Admin broadcast from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("غير مصرح لك!")
         return
-    await message.answer("أدخل الرسالة التي تريد إرسالها لجميع المستخدمين:", reply_markup=back_keyboard)
+    await message.answer("لمن تريد إرسال البث؟", reply_markup=broadcast_audience_keyboard)
+    await state.set_state(AdminStates.waiting_broadcast_audience)
+
+async def admin_broadcast_audience(message: types.Message, state: FSMContext):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("غير مصرح لك!")
+        await state.clear()
+        return
+    await state.update_data(broadcast_days=BROADCAST_AUDIENCES[message.text])
+    await message.answer("أدخل الرسالة التي تريد إرسالها:", reply_markup=back_keyboard)
     await state.set_state(AdminStates.waiting_broadcast_message)
 
+for audience_text in BROADCAST_AUDIENCES:
+    text_router.button(audience_text, state=AdminStates.waiting_broadcast_audience)(admin_broadcast_audience)
+
 @dp.message(AdminStates.waiting_broadcast_message)
 async def admin_broadcast_message(message: types.Message, state: FSMContext):
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("قعود عاقل و حاج تبعت")
         await state.clear()
         return
-    broadcast_msg = message.text
-    sent_count = 0
-    # Create a copy of the users set to iterate over safely
-    users_to_send = list(users)
-    await message.answer(f"جارٍ إرسال الرسالة إلى {len(users_to_send)} مستخدم... ⏳")
-    for user_id in users_to_send:
-        try:
-            await bot.send_message(user_id, broadcast_msg)
-            sent_count += 1
-            await asyncio.sleep(0.05)  # Delay to avoid rate limit
-        except Exception as e:
-            logger.error(f"Failed to send to {user_id}: {e}")
-    await message.answer(f"تم إرسال الرسالة إلى {sent_count} مستخدم. شكراً لك! 💖", reply_markup=admin_keyboard)
+    if message.text is not None:
+        content = {'text': message.text}
+    else:
+        # Photos, videos, documents... are copied from the admin's message
+        content = {'from_chat_id': message.chat.id, 'message_id': message.message_id}
+    days = (await state.get_data()).get('broadcast_days')
+    if days is None:
+        users_to_send = [user_id for user_id in users if user_id not in blocked_users]
+    else:
+        users_to_send = [
+            user_id for user_id in user_registry.active_since(days)
+            if user_id in users and user_id not in blocked_users
+        ]
+    progress = await message.answer(f"جارٍ إرسال الرسالة إلى {len(users_to_send)} مستخدم... ⏳")
+    job_id = await broadcast_ids.next()
+    broadcast_jobs.create(job_id, users_to_send, content, progress.chat.id, progress.message_id)
+    run_in_background(run_broadcast(job_id))
+    await message.answer("بدأ البث في الخلفية، ستتحدث رسالة التقدم أعلاه تلقائياً. شكراً لك! 💖", reply_markup=admin_keyboard)
     await state.clear()
 
+def broadcast_sender(content: dict):
+    if 'text' in content:
+        return lambda user_id: bot.send_message(user_id, content['text'])
+    return lambda user_id: bot.copy_message(user_id, content['from_chat_id'], content['message_id'])
+
+async def send_meeting_reminder(meeting_type: str, at: datetime, offset: timedelta) -> None:
+    """Remind every reachable user of a meeting through a (resumable) broadcast job."""
+    text = f"⏰ تذكير: {meeting_type} بعد {format_offset(offset)}\nالموعد: {format_meeting_time(at)}\n\nنتطلع لرؤيتك! 🌹"
+    recipients = [user_id for user_id in users if user_id not in blocked_users]
+    job_id = await broadcast_ids.next()
+    broadcast_jobs.create(job_id, recipients, {'text': text})
+    logger.info(f"Sending {meeting_type} reminder to {len(recipients)} users (job {job_id})")
+    run_in_background(run_broadcast(job_id))
+
+def mark_unreachable(user_id: int) -> None:
+    users.discard(user_id)
+    blocked_users.add(user_id)
+
+async def run_broadcast(job_id: int) -> None:
+    """Run (or resume) a persisted broadcast job, checkpointing after every recipient.
+
+    Does nothing while another worker holds the job's lease.
+    """
+    if job_id in running_broadcasts or not await broadcast_jobs.acquire(job_id):
+        return
+    job = broadcast_jobs.get(job_id)
+    if job_id in running_broadcasts:
+        return  # started meanwhile by another task of this worker
+    if job is None or job['status'] != JOB_RUNNING:
+        await broadcast_jobs.release(job_id)
+        return
+    if job['state']:
+        logger.info(f"Resuming broadcast job {job_id}")
+    engine = BroadcastEngine(
+        broadcast_jobs.recipients.get(job_id, []),
+        broadcast_sender(job['content']),
+        progress=None if job['progress_message_id'] is None else lambda text: bot.edit_message_text(
+            text, chat_id=job['progress_chat_id'], message_id=job['progress_message_id']
+        ),
+        concurrency=BROADCAST_CONCURRENCY,
+        rate=BROADCAST_RATE,
+        resume=job['state'],
+        on_checkpoint=lambda engine: broadcast_jobs.checkpoint(job_id, engine),
+        on_unreachable=mark_unreachable,
+    )
+    running_broadcasts[job_id] = (engine, asyncio.current_task())
+    keeper = asyncio.create_task(broadcast_jobs.keep_lease(job_id, engine))
+    try:
+        if await engine.run():
+            broadcast_jobs.finish(job_id, engine)
+    finally:
+        keeper.cancel()
+        running_broadcasts.pop(job_id, None)
+        await broadcast_jobs.release(job_id)
+
+async def resume_broadcasts() -> None:
+    """Pick up unfinished broadcast jobs whose worker stopped renewing their lease."""
+    while True:
+        for job_id in broadcast_jobs.unfinished():
+            if job_id not in running_broadcasts:
+                run_in_background(run_broadcast(job_id))
+        await asyncio.sleep(broadcast_jobs.lease_ttl / 2)
+
+async def stop_broadcasts(timeout: float = 10.0) -> None:
+    """Stop running broadcasts after their in-flight sends, so the checkpoint is exact.
+
+    Broadcasts still sending after `timeout` are cancelled and awaited, so
+    nothing checkpoints into the store after it closes; the cancelled sends
+    were never checkpointed and go out again when the job resumes.
+    """
+    if not running_broadcasts:
+        return
+    for engine, _task in running_broadcasts.values():
+        engine.stop()
+    _, pending = await asyncio.wait([task for _engine, task in running_broadcasts.values()], timeout=timeout)
+    if pending:
+        logger.error(f"{len(pending)} broadcasts still sending after {timeout:g}s, cancelling them")
+        for task in pending:
+            task.cancel()
+        await asyncio.wait(pending)
+
 # Admin send user message handlers
-@dp.message(F.text == "إرسال رسالة لمستخدم")
+@text_router.button("إرسال رسالة لمستخدم")
 async def admin_send_user_msg_start(message: types.Message, state: FSMContext):
     logger.info(f"Admin send user msg from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("غير مصرح لك!")
         return
-    await message.answer("أدخل ID التلغرام للمستخدم (رقم فقط):", reply_markup=back_keyboard)
+    recent = "\n".join(
+        f"{user_id} - {first_name or 'بدون اسم'} ({datetime.fromtimestamp(last_seen).strftime('%Y-%m-%d %H:%M')})"
+        for user_id, first_name, last_seen in user_registry.recent(10)
+    )
+    await message.answer(
+        "أدخل ID التلغرام للمستخدم (رقم فقط):" + (f"\n\nآخر المستخدمين نشاطاً:\n{recent}" if recent else ""),
+        reply_markup=back_keyboard
+    )
     await state.set_state(AdminStates.waiting_user_id)
 
 @dp.message(AdminStates.waiting_user_id)
@@ -877,7 +1430,7 @@ async def admin_send_user_message(message: types.Message, state: FSMContext):
     await state.clear()
 
 # Admin attendance handlers
-@dp.message(F.text == "تفقد")
+@text_router.button("تفقد")
 async def admin_attendance_start(message: types.Message, state: FSMContext):
     logger.info(f"Admin attendance from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
@@ -885,23 +1438,23 @@ async def admin_attendance_start(message: types.Message, state: FSMContext):
         return
     await message.answer("اختر نوع التفقد:", reply_markup=attendance_keyboard)
 
-@dp.message(F.text == "تفقد اجتماع")
+@text_router.button("تفقد اجتماع")
 async def attendance_meeting(message: types.Message, state: FSMContext):
     logger.info(f"Attendance meeting from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("غير مصرح لك!")
         return
-    await state.update_data(attendance_type="تفقد اجتماع")
+    await state.update_data(attendance_type="تفقد اجتماع", session_type=SESSION_MEETING)
     await message.answer("أدخل أسماء المتطوعين الحاضرين مفصولة بفاصلة (مثال: أحمد محمد, فاطمة علي):", reply_markup=back_keyboard)
     await state.set_state(AdminStates.waiting_attendance_names)
 
-@dp.message(F.text == "تفقد مبادرة")
+@text_router.button("تفقد مبادرة")
 async def attendance_initiative(message: types.Message, state: FSMContext):
     logger.info(f"Attendance initiative from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("غير مصرح لك!")
         return
-    await state.update_data(attendance_type="تفقد مبادرة")
+    await state.update_data(attendance_type="تفقد مبادرة", session_type=SESSION_INITIATIVE)
     await message.answer("أدخل أسماء المتطوعين الحاضرين مفصولة بفاصلة (مثال: أحمد محمد, فاطمة علي):", reply_markup=back_keyboard)
     await state.set_state(AdminStates.waiting_attendance_names)
 
@@ -913,9 +1466,17 @@ async def admin_attendance_names(message: types.Message, state: FSMContext):
         return
     data = await state.get_data()
     attendance_type = data['attendance_type']
-    names = message.text
-    names_list = [name.strip() for name in names.split(',')]
-    report = f"**تقرير {attendance_type}** - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}:\n\n**الحاضرون:**\n" + "\n".join(f"- {name}" for name in names_list)
+    names_list = parse_names(message.text)
+    if not names_list:
+        await message.answer("لم أجد أي اسم، أدخل الأسماء مفصولة بفاصلة:", reply_markup=back_keyboard)
+        return
+    session = attendance_registry.record(
+        data.get('session_type', SESSION_MEETING), names_list, by=message.from_user.id
+    )
+    report = (
+        f"**تقرير {attendance_type}** #{session['id']} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}:\n\n"
+        f"**الحاضرون ({len(session['names'])}):**\n" + "\n".join(f"- {name}" for name in session['names'])
+    )
     try:
         await bot.send_message(
             ATTENDANCE_GROUP_ID,
@@ -927,8 +1488,60 @@ async def admin_attendance_names(message: types.Message, state: FSMContext):
         await message.answer("حدث خطأ في إرسال التقرير إلى مجموعة الحضور.", reply_markup=admin_keyboard)
     await state.clear()
 
+def split_message(text: str, limit: int = 4000) -> list:
+    """Split a long report on line breaks into chunks Telegram accepts."""
+    chunks, current = [], ""
+    for line in text.split("\n"):
+        if current and len(current) + len(line) + 1 > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    chunks.append(current)
+    return chunks
+
+@text_router.button("تقويم الإجازات")
+async def admin_leave_calendar_start(message: types.Message, state: FSMContext):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("غير مصرح لك!")
+        return
+    await message.answer(
+        "أدخل تاريخاً (YYYY-MM-DD) أو فترة (من YYYY-MM-DD إلى YYYY-MM-DD):", reply_markup=back_keyboard
+    )
+    await state.set_state(AdminStates.waiting_calendar_range)
+
+@dp.message(AdminStates.waiting_calendar_range)
+async def admin_leave_calendar(message: types.Message, state: FSMContext):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("غير مصرح لك!")
+        await state.clear()
+        return
+    date_range = parse_range(message.text or "")
+    if date_range is None:
+        await message.answer("لم أفهم التاريخ، أدخله بالشكل YYYY-MM-DD:", reply_markup=back_keyboard)
+        return
+    for chunk in split_message(format_calendar(leave_calendar, *date_range)):
+        await message.answer(chunk, reply_markup=admin_keyboard)
+    await state.clear()
+
+@text_router.button("نسبة الحضور هذا الشهر")
+async def attendance_monthly_rates(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("غير مصرح لك!")
+        return
+    month = datetime.now().strftime('%Y-%m')
+    for chunk in split_message(format_monthly_rates(attendance_registry, month)):
+        await message.answer(chunk, reply_markup=attendance_keyboard)
+
+@text_router.button("الغائبون عن آخر 3 اجتماعات")
+async def attendance_missed_meetings(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("غير مصرح لك!")
+        return
+    for chunk in split_message(format_missed(attendance_registry, 3)):
+        await message.answer(chunk, reply_markup=attendance_keyboard)
+
 # Admin photo upload handlers
-@dp.message(F.text == "رفع صور الفريق")
+@text_router.button("رفع صور الفريق")
 async def admin_upload_photos_start(message: types.Message, state: FSMContext):
     logger.info(f"Admin upload photos from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
@@ -943,8 +1556,8 @@ async def admin_upload_photo(message: types.Message, state: FSMContext):
         await message.answer("غير مصرح لك!")
         return
 
-    file_id = message.photo[-1].file_id
-    team_photos.append({'file_id': file_id})
+    photo = message.photo[-1]
+    team_photos[photo.file_unique_id] = {'file_id': photo.file_id}
     await message.answer("تم رفع الصورة بنجاح! أرسل المزيد إذا أردت، أو اضغط /admin للعودة إلى لوحة الأدمن. 🌟")
 
 
@@ -956,8 +1569,42 @@ async def admin_upload_photo_invalid(message: types.Message, state: FSMContext):
 
 
 # Admin photo delete handlers
-@dp.message(F.text == "حذف صور الفريق")
-async def admin_delete_photos_start(message: types.Message):
+def photo_delete_keyboard(page: list, offset: int, selected: set) -> InlineKeyboardMarkup:
+    """Checklist keyboard for one page of photos in bulk-delete mode."""
+    toggles = [
+        InlineKeyboardButton(
+            text=f"{'✅' if photo_key in selected else '⬜'} {offset + i + 1}",
+            callback_data=f"photo_toggle:{photo_key}"
+        )
+        for i, (photo_key, _) in enumerate(page)
+    ]
+    rows = [toggles[i:i + 5] for i in range(0, len(toggles), 5)]
+    rows.append([InlineKeyboardButton(text=f"حذف المحدد ({len(selected)})", callback_data="photo_delete_selected")])
+    next_offset = offset + len(page)
+    if next_offset < len(team_photos):
+        rows.append([InlineKeyboardButton(text="صور أقدم ⬅️", callback_data=f"photo_delete_page:{next_offset}")])
+    rows.append([InlineKeyboardButton(text="إلغاء", callback_data="photo_delete_cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+async def send_photo_delete_page(chat_id: int, offset: int, selected: set) -> None:
+    """Show one page of photos as an album followed by a single checklist message."""
+    page = latest_photos(offset)
+    media = [
+        types.InputMediaPhoto(media=photo_info['file_id'], caption=f"#{offset + i + 1}")
+        for i, (_, photo_info) in enumerate(page)
+    ]
+    if len(media) == 1:
+        await bot.send_photo(chat_id, media[0].media, caption=media[0].caption)
+    else:
+        await bot.send_media_group(chat_id, media)
+    await bot.send_message(
+        chat_id,
+        f"اختر الصور التي تريد حذفها ({offset + 1}-{offset + len(page)} من {len(team_photos)}):",
+        reply_markup=photo_delete_keyboard(page, offset, selected)
+    )
+
+@text_router.button("حذف صور الفريق")
+async def admin_delete_photos_start(message: types.Message, state: FSMContext):
     logger.info(f"Admin delete photos from {message.from_user.id}")
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("غير مصرح لك!")
@@ -965,106 +1612,211 @@ async def admin_delete_photos_start(message: types.Message):
     if not team_photos:
         await message.answer("لا توجد صور للحذف حالياً. 💕", reply_markup=admin_keyboard)
         return
+    await state.update_data(photo_selection=[], photo_offset=0)
+    try:
+        await send_photo_delete_page(message.chat.id, 0, set())
+    except Exception as e:
+        logger.error(f"Error showing photos for deletion: {e}")
+        await message.answer("حدث خطأ في عرض الصور.", reply_markup=admin_keyboard)
 
-    # Send up to 5 photos with delete buttons (to avoid flooding)
-    num_photos_to_show = min(5, len(team_photos))
-    await message.answer(f"يتم عرض آخر {num_photos_to_show} صور. اختر الصورة التي تريد حذفها:")
-    
-    for i in range(1, num_photos_to_show + 1):
-        idx = len(team_photos) - i
-        photo_info = team_photos[idx]
-        
-        delete_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="حذف هذه الصورة", callback_data=f"delete_photo_{idx}")]
-        ])
-        
-        try:
-            await bot.send_photo(
-                message.chat.id,
-                photo_info['file_id'],
-                caption=f"صورة الفريق #{idx + 1} (للحذف)",
-                reply_markup=delete_keyboard
-            )
-        except Exception as e:
-            logger.error(f"Error showing photo for deletion: {e}")
-            await message.answer(f"حدث خطأ في عرض الصورة رقم {idx + 1}.")
-            
-    await message.answer("بعد الحذف، اضغط /admin للعودة إلى لوحة الأدمن.", reply_markup=admin_keyboard)
-
-
-@dp.callback_query(F.data.startswith("delete_photo_"))
-async def delete_photo(callback: types.CallbackQuery):
-    logger.info(f"Delete photo callback: {callback.data} from {callback.from_user.id}")
+@dp.callback_query(F.data.startswith("photo_toggle:"))
+async def toggle_photo_selection(callback: types.CallbackQuery, state: FSMContext):
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("غير مصرح لك!")
         return
+    photo_key = callback.data.removeprefix("photo_toggle:")
+    data = await state.get_data()
+    selected = set(data.get('photo_selection', []))
+    selected.symmetric_difference_update({photo_key})
+    await state.update_data(photo_selection=list(selected))
+    offset = data.get('photo_offset', 0)
     try:
-        idx_str = callback.data.split("_")[2]
-        idx = int(idx_str)
-        
-        if 0 <= idx < len(team_photos) and team_photos[idx].get('file_id'):
-            del team_photos[idx]
-            
-            await callback.message.edit_caption(
-                caption=callback.message.caption + "\n\n**تم الحذف بنجاح! 💖**",
-                reply_markup=None # Remove the delete button
-            )
-        else:
-            await callback.answer("الصورة غير موجودة أو تم حذفها مسبقاً.")
+        await callback.message.edit_reply_markup(
+            reply_markup=photo_delete_keyboard(latest_photos(offset), offset, selected)
+        )
     except Exception as e:
-        logger.error(f"Error deleting photo: {e}")
-        await callback.answer("حدث خطأ في الحذف.")
-    
-    await callback.answer("تم حذف الصورة.")
+        logger.error(f"Error updating photo checklist: {e}")
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("photo_delete_page:"))
+async def photo_delete_next_page(callback: types.CallbackQuery, state: FSMContext):
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("غير مصرح لك!")
+        return
+    offset = int(callback.data.removeprefix("photo_delete_page:"))
+    data = await state.get_data()
+    selected = set(data.get('photo_selection', []))
+    await state.update_data(photo_offset=offset)
+    await callback.answer()
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await send_photo_delete_page(callback.message.chat.id, offset, selected)
+    except Exception as e:
+        logger.error(f"Error showing photos for deletion: {e}")
+
+@dp.callback_query(F.data == "photo_delete_selected")
+async def delete_selected_photos(callback: types.CallbackQuery, state: FSMContext):
+    logger.info(f"Bulk photo delete from {callback.from_user.id}")
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("غير مصرح لك!")
+        return
+    data = await state.get_data()
+    selected = data.get('photo_selection', [])
+    if not selected:
+        await callback.answer("لم تختر أي صورة.")
+        return
+    deleted = 0
+    for photo_key in selected:
+        if team_photos.pop(photo_key, None) is not None:
+            deleted += 1
+    await state.update_data(photo_selection=[], photo_offset=0)
+    await callback.message.edit_text(f"تم حذف {deleted} صور بنجاح! 💖", reply_markup=None)
+    await callback.answer("تم الحذف.")
+
+@dp.callback_query(F.data == "photo_delete_cancel")
+async def cancel_photo_delete(callback: types.CallbackQuery, state: FSMContext):
+    await state.update_data(photo_selection=[], photo_offset=0)
+    await callback.message.edit_text("تم إلغاء الحذف.", reply_markup=None)
+    await callback.answer()
 
 # Startup function
+def webhook_fingerprint(url: str, secret: str, allowed_updates: list) -> str:
+    """Hash of the webhook settings; Telegram never returns the secret, so we remember it ourselves."""
+    raw = f"{url}|{secret}|{','.join(sorted(allowed_updates))}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def ensure_webhook(bot: Bot, url: str, secret: str) -> None:
+    """Register the webhook unless Telegram already has exactly these settings."""
+    allowed_updates = dp.resolve_used_update_types()
+    fingerprint = webhook_fingerprint(url, secret, allowed_updates)
+    try:
+        if FAST_START:
+            info = await bot.get_webhook_info()
+            if (
+                info.url == url
+                and set(info.allowed_updates or []) == set(allowed_updates)
+                and bot_settings.get('webhook_fingerprint') == fingerprint
+            ):
+                logger.info(f"Webhook already set to {url}, skipping set_webhook")
+                return
+        await bot.set_webhook(url=url, secret_token=secret, allowed_updates=allowed_updates)
+        bot_settings['webhook_fingerprint'] = fingerprint
+        logger.info(f"Webhook set successfully to: {url}")
+        if not FAST_START:
+            info = await bot.get_webhook_info()
+            logger.info(f"Webhook Info: {info}")
+    except Exception as e:
+        logger.error(f"Failed to set webhook: {e}")
+    finally:
+        startup_timeline.mark('webhook setup')
+
+def record_startup(timeline: StartupTimeline) -> None:
+    """Log the startup timeline and keep the last 50 for comparing releases."""
+    logger.info(f"Startup timeline: {timeline.summary()}")
+    startup_history.append(timeline.as_dict())
+    if len(startup_history) > 50:
+        del startup_history[0]
+
 async def on_startup(bot: Bot) -> None:
     # Use environment variables for webhook setup
     webhook_url = f"https://{os.getenv('RENDER_EXTERNAL_HOSTNAME', 'your-app.onrender.com')}/webhook"
     webhook_secret = os.getenv('WEBHOOK_SECRET', 'default_secret')
     
+    db.start()
+
     if not TOKEN:
         logger.error("BOT_TOKEN is not set. Bot will not set webhook.")
         return
+    request_digests.start()
+    # Every worker resumes jobs left by a stopped or crashed one, not only the primary
+    global broadcast_watcher
+    broadcast_watcher = asyncio.create_task(resume_broadcasts())
+    if not PRIMARY_WORKER:
+        logger.info(f"Worker {WORKER_INDEX} of {WORKERS} started")
+        return
 
-    try:
-        await bot.set_webhook(url=webhook_url, secret_token=webhook_secret, allowed_updates=dp.resolve_used_update_types())
-        info = await bot.get_webhook_info()
-        logger.info(f"Webhook set successfully to: {webhook_url}")
-        logger.info(f"Webhook Info: {info}")
-    except Exception as e:
-        logger.error(f"Failed to set webhook: {e}")
-        
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, "**البوت أعيد تشغيله بنجاح!** 🤖")
-        except Exception as e:
-            logger.error(f"Failed to send startup message to admin {admin_id}: {e}")
+    meeting_reminders.start()
 
-# Main function
-def main() -> None:
-    if not TOKEN:
-        logger.error("BOT_TOKEN environment variable not set. Exiting.")
-        return
-    
+    if FAST_START:
+        # Telegram keeps delivering to an existing webhook, so the app can start serving right away
+        run_in_background(ensure_webhook(bot, webhook_url, webhook_secret))
+        run_in_background(send_to_admins("**البوت أعيد تشغيله بنجاح!** 🤖", parse_mode=ParseMode.HTML))
+    else:
+        await ensure_webhook(bot, webhook_url, webhook_secret)
+        await send_to_admins("**البوت أعيد تشغيله بنجاح!** 🤖", parse_mode=ParseMode.HTML)
+
+# Shutdown function
+async def on_shutdown(bot: Bot) -> None:
+    await meeting_reminders.close()
+    await request_digests.close()
+    if broadcast_watcher is not None:
+        broadcast_watcher.cancel()
+    await stop_broadcasts()
+    await drain_background_tasks(SHUTDOWN_DRAIN_TIMEOUT)
+    await db.close()
+    logger.info("Bot state flushed to the database.")
+
+startup_timeline.mark('dispatcher build')
+
+# Application factory (also used by the load-test harness)
+def build_app() -> web.Application:
     dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     webhook_secret = os.getenv('WEBHOOK_SECRET', 'default_secret')
     webhook_path = "/webhook"
     
-    app = web.Application()
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-        secret_token=webhook_secret,
-    )
+    app = web.Application(middlewares=[startup_timeline.first_request_middleware(webhook_path, on_first=record_startup)])
+    if UPDATE_WORKERS > 0:
+        webhook_requests_handler = QueuedRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            workers=UPDATE_WORKERS,
+            max_queue=UPDATE_QUEUE_MAX,
+            secret_token=webhook_secret,
+        )
+
+        async def queue_stats(request: web.Request) -> web.Response:
+            return web.json_response(webhook_requests_handler.stats())
+
+        app.router.add_get("/stats/queue", queue_stats)
+        metrics.registry.gauge(
+            "bot_update_queue_depth", "Updates waiting for a worker.",
+            callback=lambda: {(): webhook_requests_handler.depth}
+        )
+        metrics.registry.gauge(
+            "bot_update_queue_rejected", "Updates refused because the queue was full.",
+            callback=lambda: {(): webhook_requests_handler.rejected}
+        )
+    else:
+        webhook_requests_handler = SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=webhook_secret,
+        )
     webhook_requests_handler.register(app, path=webhook_path)
+    app.router.add_get("/metrics", metrics.registry.handle)
     setup_application(app, dp, bot=bot)
+    return app
+
+# Main function
+def main() -> None:
+    if not TOKEN:
+        logger.error("BOT_TOKEN environment variable not set. Exiting.")
+        return
     
+    if SHARED_STATE and 'WORKER_INDEX' not in os.environ:
+        logger.info(f"Starting {WORKERS} worker processes")
+        # Only the supervisor process needs it
+        from workers import WorkerSupervisor
+        WorkerSupervisor(WORKERS).run()
+        return
+
+    app = build_app()
     port = int(os.getenv('PORT', 8080)) # Default to 8080 if PORT is not set
     host = '0.0.0.0'
     
     logger.info(f"Starting web application on {host}:{port}")
-    web.run_app(app, host=host, port=port)
+    web.run_app(app, host=host, port=port, reuse_port=SHARED_STATE)
 
 if __name__ == "__main__":
     if not TOKEN:
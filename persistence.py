@@ -0,0 +1,514 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.5  # seconds
+CHANGES_KEEP = 10000  # change log rows kept for other processes to catch up
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sets (
+    name TEXT NOT NULL,
+    member TEXT NOT NULL,
+    PRIMARY KEY (name, member)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS kv (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lists (
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    next INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS claims (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin INTEGER NOT NULL,
+    tbl TEXT NOT NULL,
+    name TEXT NOT NULL,
+    key TEXT
+);
+"""
+
+_DELETED = object()
+
+
+class PersistentSet(set):
+    """A set that remembers which members changed since the last flush."""
+
+    def __init__(self, store: "Store", name: str, members: Iterable = ()):
+        super().__init__(members)
+        # Only the changed members are noted; whether they are in or out is read at flush time
+        self._dirty: Set = set()
+        self._name = name
+
+    def add(self, member) -> None:
+        if member not in self:
+            set.add(self, member)
+            self._dirty.add(member)
+
+    def update(self, *others) -> None:
+        for other in others:
+            for member in other:
+                self.add(member)
+
+    def discard(self, member) -> None:
+        if member in self:
+            set.discard(self, member)
+            self._dirty.add(member)
+
+    def remove(self, member) -> None:
+        if member not in self:
+            raise KeyError(member)
+        self.discard(member)
+
+
+class PersistentDict(dict):
+    """A dict that remembers which keys changed since the last flush."""
+
+    def __init__(self, store: "Store", name: str, items: Optional[Dict] = None):
+        super().__init__(items or {})
+        # Only the changed keys are noted; their values are read at flush time
+        self._dirty: Set = set()
+        self._name = name
+
+    # Hot path: the unbound dict method is bound as a default, which skips an attribute lookup per write
+    def __setitem__(self, key, value, _set=dict.__setitem__) -> None:
+        _set(self, key, value)
+        self._dirty.add(key)
+
+    def __delitem__(self, key) -> None:
+        dict.__delitem__(self, key)
+        self._dirty.add(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            value = dict.pop(self, key)
+            self._dirty.add(key)
+            return value
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+class PersistentList(list):
+    """A small list that is rewritten as a whole when it changes."""
+
+    def __init__(self, store: "Store", name: str, items: Iterable = ()):
+        super().__init__(items)
+        self._pending = store._pending
+        self._name = name
+
+    def _changed(self) -> None:
+        self._pending[('lists', self._name, None)] = None
+
+    def append(self, value) -> None:
+        list.append(self, value)
+        self._changed()
+
+    def extend(self, values) -> None:
+        list.extend(self, values)
+        self._changed()
+
+    def insert(self, index, value) -> None:
+        list.insert(self, index, value)
+        self._changed()
+
+    def pop(self, index=-1):
+        value = list.pop(self, index)
+        self._changed()
+        return value
+
+    def remove(self, value) -> None:
+        list.remove(self, value)
+        self._changed()
+
+    def clear(self) -> None:
+        list.clear(self)
+        self._changed()
+
+    def __setitem__(self, index, value) -> None:
+        list.__setitem__(self, index, value)
+        self._changed()
+
+    def __delitem__(self, index) -> None:
+        list.__delitem__(self, index)
+        self._changed()
+
+
+class Store:
+    """SQLite (WAL) backed state with write-behind batching.
+
+    Collections live in memory and note which keys changed; a background
+    task writes those keys' current values in one transaction every
+    `flush_interval` seconds and once more on shutdown, so a key written
+    many times in one window costs one row. Rows written through
+    write_row() and changed lists wait in a pending buffer.
+
+    With `shared=True` several processes can use the same database: every
+    flush also appends the changed keys to a change log, and refresh()
+    applies rows written by other processes to the loaded collections in
+    place (the flush loop calls it too).
+    """
+
+    def __init__(self, path: str, flush_interval: float = DEFAULT_FLUSH_INTERVAL, shared: bool = False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.shared = shared
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._pending: Dict[tuple, Any] = {}
+        self._lists: Dict[str, PersistentList] = {}
+        self._collections: Dict[tuple, Any] = {}
+        self._listeners: Dict[str, List[Callable[[], None]]] = {}
+        self._row_watchers: Dict[str, Callable[[Any, Any], None]] = {}
+        self._origin = os.getpid()
+        # Read the change log position before the data, so nothing is missed in between
+        self._seen = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        self._snapshot = self._load()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def _load(self) -> Dict[tuple, Any]:
+        """Read every table once at startup."""
+        snapshot: Dict[tuple, Any] = {}
+        with self._db_lock:
+            for name, member in self._conn.execute("SELECT name, member FROM sets"):
+                snapshot.setdefault(('sets', name), []).append(json.loads(member))
+            for name, key, value in self._conn.execute("SELECT name, key, value FROM kv"):
+                snapshot.setdefault(('kv', name), {})[json.loads(key)] = json.loads(value)
+            for name, value in self._conn.execute("SELECT name, value FROM lists ORDER BY name, position"):
+                snapshot.setdefault(('lists', name), []).append(json.loads(value))
+        return snapshot
+
+    def load_set(self, name: str) -> PersistentSet:
+        result = self._collections[('sets', name)] = PersistentSet(self, name, self._snapshot.pop(('sets', name), ()))
+        return result
+
+    def load_dict(self, name: str, default: Optional[Dict] = None) -> PersistentDict:
+        items = self._snapshot.pop(('kv', name), None)
+        if items is None:
+            result = PersistentDict(self, name)
+            result.update(default or {})
+        else:
+            result = PersistentDict(self, name, items)
+        self._collections[('kv', name)] = result
+        return result
+
+    def load_rows(self, name: str) -> Dict:
+        """Return the stored key/value rows of `name` without wrapping them.
+
+        Used by callers that keep their own compact in-memory layout and
+        report changes through write_row().
+        """
+        return self._snapshot.pop(('kv', name), {})
+
+    def watch_rows(self, name: str, callback: Callable[[Any, Any], None]) -> None:
+        """Have refresh() pass rows of `name` changed by other processes to `callback(key, value)`.
+
+        The counterpart of load_rows() for shared databases; value is None for deleted rows.
+        """
+        self._row_watchers[name] = callback
+
+    def write_row(self, name: str, key, value) -> None:
+        self._pending[('kv', name, key)] = value
+
+    def delete_row(self, name: str, key) -> None:
+        self._pending[('kv', name, key)] = _DELETED
+
+    def load_list(self, name: str) -> PersistentList:
+        result = PersistentList(self, name, self._snapshot.pop(('lists', name), ()))
+        self._lists[name] = self._collections[('lists', name)] = result
+        return result
+
+    def on_change(self, name: str, callback: Callable[[], None]) -> None:
+        """Call `callback` after refresh() applied another process's changes to `name`."""
+        self._listeners.setdefault(name, []).append(callback)
+
+    def lease(self, name: str, count: int, start: int = 1) -> int:
+        """Reserve `count` consecutive values of a durable sequence and return the first.
+
+        Unlike everything else this is written immediately, in an IMMEDIATE
+        transaction, so processes sharing the database never get
+        overlapping blocks. Blocking: call it from a thread.
+        """
+        with self._db_lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                row = cur.execute("SELECT next FROM sequences WHERE name = ?", (name,)).fetchone()
+                first = max(row[0], start) if row else start
+                cur.execute("INSERT OR REPLACE INTO sequences (name, next) VALUES (?, ?)", (name, first + count))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return first
+
+    def claim(self, name: str, key, value) -> Any:
+        """Store `value` under `key` unless a value is already there; return the stored one.
+
+        Written immediately, so the first caller wins also across processes.
+        Blocking: call it from a thread.
+        """
+        with self._db_lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute(
+                    "INSERT OR IGNORE INTO claims (name, key, value) VALUES (?, ?, ?)",
+                    (name, json.dumps(key), json.dumps(value, ensure_ascii=False)),
+                )
+                row = cur.execute("SELECT value FROM claims WHERE name = ? AND key = ?", (name, json.dumps(key))).fetchone()
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return json.loads(row[0])
+
+    def claimed(self, name: str, key) -> Any:
+        """The value claimed under `key`, or None. Blocking: call it from a thread."""
+        with self._db_lock:
+            row = self._conn.execute("SELECT value FROM claims WHERE name = ? AND key = ?", (name, json.dumps(key))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def hold(self, name: str, key, owner: str, ttl: float) -> bool:
+        """Take or renew `owner`'s lease on `key` for `ttl` seconds; False while someone else holds it.
+
+        A lease whose holder stopped renewing it expires, so work owned by a
+        crashed process can be picked up. Written immediately. Blocking:
+        call it from a thread.
+        """
+        now = time.time()
+        with self._db_lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                row = cur.execute("SELECT owner, expires FROM leases WHERE name = ? AND key = ?", (name, json.dumps(key))).fetchone()
+                held = row is None or row[0] == owner or row[1] < now
+                if held:
+                    cur.execute(
+                        "INSERT OR REPLACE INTO leases (name, key, owner, expires) VALUES (?, ?, ?, ?)",
+                        (name, json.dumps(key), owner, now + ttl),
+                    )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return held
+
+    def release(self, name: str, key, owner: str) -> None:
+        """Give up `owner`'s lease on `key`, if it still holds it. Blocking: call it from a thread."""
+        with self._db_lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND key = ? AND owner = ?", (name, json.dumps(key), owner))
+
+    def _tracked(self) -> Iterable:
+        return (collection for (table, _name), collection in self._collections.items() if table != 'lists')
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending) + sum(len(collection._dirty) for collection in self._tracked())
+
+    def _write(self, batch: Dict[tuple, Any], lists: Dict[str, list]) -> None:
+        with self._db_lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                for (table, name, key), value in batch.items():
+                    if table == 'sets':
+                        if value is _DELETED:
+                            cur.execute("DELETE FROM sets WHERE name = ? AND member = ?", (name, json.dumps(key)))
+                        else:
+                            cur.execute("INSERT OR IGNORE INTO sets (name, member) VALUES (?, ?)", (name, json.dumps(key)))
+                    elif table == 'kv':
+                        if value is _DELETED:
+                            cur.execute("DELETE FROM kv WHERE name = ? AND key = ?", (name, json.dumps(key)))
+                        else:
+                            cur.execute(
+                                "INSERT OR REPLACE INTO kv (name, key, value) VALUES (?, ?, ?)",
+                                (name, json.dumps(key), json.dumps(value, ensure_ascii=False)),
+                            )
+                for name, items in lists.items():
+                    cur.execute("DELETE FROM lists WHERE name = ?", (name,))
+                    cur.executemany(
+                        "INSERT INTO lists (name, position, value) VALUES (?, ?, ?)",
+                        [(name, i, json.dumps(v, ensure_ascii=False)) for i, v in enumerate(items)],
+                    )
+                if self.shared:
+                    self._log_changes(cur, batch, lists)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    def _log_changes(self, cur: sqlite3.Cursor, batch: Dict[tuple, Any], lists: Dict[str, list]) -> None:
+        rows = [(self._origin, table, name, json.dumps(key)) for (table, name, key) in batch]
+        rows += [(self._origin, 'lists', name, None) for name in lists]
+        cur.executemany("INSERT INTO changes (origin, tbl, name, key) VALUES (?, ?, ?, ?)", rows)
+        last = cur.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+        if last % 1000 < len(rows):
+            cur.execute("DELETE FROM changes WHERE seq <= ?", (last - CHANGES_KEEP,))
+
+    def _read_changes(self) -> List[tuple]:
+        """Current values of the rows other processes changed since the last refresh."""
+        with self._db_lock:
+            changed = self._conn.execute(
+                "SELECT seq, tbl, name, key FROM changes WHERE seq > ? AND origin != ? ORDER BY seq",
+                (self._seen, self._origin),
+            ).fetchall()
+            last = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            rows = []
+            for table, name, key in dict.fromkeys((table, name, key) for _seq, table, name, key in changed):
+                if table == 'sets':
+                    found = self._conn.execute(
+                        "SELECT 1 FROM sets WHERE name = ? AND member = ?", (name, key)
+                    ).fetchone()
+                    rows.append((table, name, json.loads(key), found is not None))
+                elif table == 'kv':
+                    found = self._conn.execute(
+                        "SELECT value FROM kv WHERE name = ? AND key = ?", (name, key)
+                    ).fetchone()
+                    rows.append((table, name, json.loads(key), json.loads(found[0]) if found else _DELETED))
+                else:
+                    values = self._conn.execute(
+                        "SELECT value FROM lists WHERE name = ? ORDER BY position", (name,)
+                    ).fetchall()
+                    rows.append((table, name, None, [json.loads(value) for (value,) in values]))
+        self._seen = max(self._seen, last)
+        return rows
+
+    async def refresh(self) -> Set[str]:
+        """Apply changes flushed by other processes; returns the names that changed.
+
+        Keys with local changes that are not flushed yet keep the local value.
+        """
+        if not self.shared:
+            return set()
+        changed = set()
+        for table, name, key, value in await asyncio.to_thread(self._read_changes):
+            collection = self._collections.get((table, name))
+            if (table, name, key) in self._pending or (table != 'lists' and collection is not None and key in collection._dirty):
+                continue
+            if collection is None:
+                watcher = self._row_watchers.get(name) if table == 'kv' else None
+                if watcher is not None:
+                    watcher(key, None if value is _DELETED else value)
+                    changed.add(name)
+                continue
+            if table == 'sets':
+                (set.add if value else set.discard)(collection, key)
+            elif table == 'kv':
+                if value is _DELETED:
+                    dict.pop(collection, key, None)
+                else:
+                    dict.__setitem__(collection, key, value)
+            else:
+                list.__setitem__(collection, slice(None), value)
+            changed.add(name)
+        for name in changed:
+            for callback in self._listeners.get(name, ()):
+                callback()
+        return changed
+
+    def _take_batch(self):
+        # Collections hold a reference to the pending dict, so empty it in place
+        batch = dict(self._pending)
+        self._pending.clear()
+        for (table, name), collection in self._collections.items():
+            if table == 'lists' or not collection._dirty:
+                continue
+            if table == 'sets':
+                for member in collection._dirty:
+                    batch[('sets', name, member)] = True if member in collection else _DELETED
+            else:
+                for key in collection._dirty:
+                    batch[('kv', name, key)] = dict.get(collection, key, _DELETED)
+            collection._dirty.clear()
+        lists = {}
+        for (table, name, _key) in [k for k in batch if k[0] == 'lists']:
+            del batch[(table, name, None)]
+            lists[name] = list(self._lists[name])
+        return batch, lists
+
+    async def flush(self) -> None:
+        # Serialized, so when flush() returns no earlier write is still in flight
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, lists = self._take_batch()
+            try:
+                await asyncio.to_thread(self._write, batch, lists)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} changes to {self.path}: {e}")
+                # Put the batch back so it is retried; newer changes win
+                for key, value in batch.items():
+                    collection = self._collections.get(key[:2])
+                    if collection is not None:
+                        collection._dirty.add(key[2])
+                    else:
+                        self._pending.setdefault(key, value)
+                for name in lists:
+                    self._pending.setdefault(('lists', name, None), None)
+
+    def flush_sync(self) -> None:
+        if self.pending:
+            self._write(*self._take_batch())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if self.shared:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logger.error(f"Failed to read changes from {self.path}: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        with self._db_lock:
+            self._conn.close()
@@ -0,0 +1,196 @@
+import re
+import time
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta, tzinfo
+from typing import Awaitable, Callable, Dict, List, MutableMapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OFFSETS = (timedelta(hours=24), timedelta(hours=1))
+MAX_SLEEP = 60.0  # re-check the clock at least this often
+WEEKLY_WORDS = ('أسبوعي', 'اسبوعي', 'weekly')
+
+_ARABIC_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+_DATETIME = re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\s+(\d{1,2})[:.](\d{2})")
+
+
+def to_ascii_digits(text: str) -> str:
+    """Replace Arabic-Indic and Persian digits with ASCII ones."""
+    return text.translate(_ARABIC_DIGITS)
+
+
+def parse_meeting_time(text: str, tz: tzinfo) -> Optional[Tuple[datetime, int]]:
+    """Parse "YYYY-MM-DD HH:MM" (Arabic digits and "أسبوعي" allowed) into (aware datetime, repeat days)."""
+    text = to_ascii_digits(text)
+    match = _DATETIME.search(text)
+    if match is None:
+        return None
+    try:
+        at = datetime(*(int(part) for part in match.groups()), tzinfo=tz)
+    except ValueError:
+        return None
+    repeat_days = 7 if any(word in text.lower() for word in WEEKLY_WORDS) else 0
+    return at, repeat_days
+
+
+def format_meeting_time(at: datetime, repeat_days: int = 0) -> str:
+    text = at.strftime('%Y-%m-%d %H:%M')
+    return f"{text} (أسبوعياً)" if repeat_days == 7 else text
+
+
+def format_offset(offset: timedelta) -> str:
+    hours = int(offset.total_seconds() // 3600)
+    if hours >= 24 and hours % 24 == 0:
+        days = hours // 24
+        return "يوم" if days == 1 else f"{days} أيام"
+    if hours >= 1:
+        return "ساعة" if hours == 1 else f"{hours} ساعات"
+    return f"{int(offset.total_seconds() // 60)} دقيقة"
+
+
+class ReminderScheduler:
+    """Meeting reminders driven by one task and a min-heap of upcoming events.
+
+    `records` maps a meeting key -> {'at': ISO datetime, 'repeat_days',
+    'sent': offsets already reminded for this occurrence} (normally a
+    PersistentDict), so the schedule survives restarts. Each occurrence pushes
+    one heap entry per reminder offset plus one to roll recurring meetings
+    over, so scheduling costs O(log n) per event. Entries for a rescheduled
+    meeting are left in the heap and ignored when they surface.
+
+    `send(key, at, offset)` delivers one reminder. Times are read back in
+    `tz` (the stored ISO string only keeps the UTC offset), so a weekly
+    meeting keeps its local time across daylight saving changes.
+    """
+
+    def __init__(
+        self,
+        records: MutableMapping[str, Dict],
+        send: Callable[[str, datetime, timedelta], Awaitable[object]],
+        offsets: Sequence[timedelta] = DEFAULT_OFFSETS,
+        tz: Optional[tzinfo] = None,
+    ):
+        self.records = records
+        self.send = send
+        self.tz = tz
+        self.offsets = sorted(offsets, reverse=True)
+        self._offset_seconds = [int(offset.total_seconds()) for offset in self.offsets]
+        self.sent = 0
+        self._heap: List[Tuple[float, int, str, str, Optional[int]]] = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _time(self, iso: str) -> datetime:
+        at = datetime.fromisoformat(iso)
+        return at.astimezone(self.tz) if self.tz is not None else at
+
+    def _push(self, fire_at: float, key: str, occurrence: str, offset: Optional[int]) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (fire_at, self._seq, key, occurrence, offset))
+
+    def _push_occurrence(self, key: str, record: Dict) -> None:
+        at = self._time(record['at'])
+        for seconds in self._offset_seconds:
+            if seconds not in record['sent']:
+                self._push(at.timestamp() - seconds, key, record['at'], seconds)
+        if record['repeat_days']:
+            self._push(at.timestamp(), key, record['at'], None)
+
+    def _roll_over(self, key: str, record: Dict, now: float) -> Dict:
+        """Move a recurring meeting whose time has passed to its next occurrence."""
+        at = self._time(record['at'])
+        step = timedelta(days=record['repeat_days'])
+        while at.timestamp() <= now:
+            at += step  # wall-clock arithmetic in the zone, the UTC offset follows DST
+        record = {**record, 'at': at.isoformat(), 'sent': []}
+        self.records[key] = record
+        return record
+
+    def schedule(self, key: str, at: datetime, repeat_days: int = 0) -> None:
+        record = {'at': at.isoformat(), 'repeat_days': repeat_days, 'sent': []}
+        if repeat_days and at.timestamp() <= time.time():
+            record = self._roll_over(key, record, time.time())
+        self.records[key] = record
+        self._push_occurrence(key, record)
+        self._wakeup.set()
+
+    def cancel(self, key: str) -> None:
+        self.records.pop(key, None)
+
+    def next_occurrence(self, key: str) -> Optional[Tuple[datetime, int]]:
+        record = self.records.get(key)
+        if record is None:
+            return None
+        return self._time(record['at']), record['repeat_days']
+
+    async def _handle(self, key: str, occurrence: str, offset: Optional[int]) -> None:
+        record = self.records.get(key)
+        if record is None or record['at'] != occurrence:
+            return  # cancelled or rescheduled since this entry was pushed
+        now = time.time()
+        if offset is None:
+            self._push_occurrence(key, self._roll_over(key, record, now))
+            return
+        if offset in record['sent']:
+            return
+        at = self._time(occurrence)
+        if at.timestamp() <= now:
+            return  # the meeting already started; a late reminder is useless
+        self.records[key] = {**record, 'sent': record['sent'] + [offset]}
+        # After downtime several reminders can be due at once; only the one
+        # closest to the meeting is sent
+        if any(seconds < offset and at.timestamp() - seconds <= now for seconds in self._offset_seconds):
+            return
+        try:
+            await self.send(key, at, timedelta(seconds=offset))
+            self.sent += 1
+        except Exception as e:
+            logger.error(f"Failed to send reminder for {key}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = MAX_SLEEP
+            if self._heap:
+                delay = self._heap[0][0] - time.time()
+                if delay <= 0:
+                    _, _, key, occurrence, offset = heapq.heappop(self._heap)
+                    await self._handle(key, occurrence, offset)
+                    continue
+                timeout = min(delay, MAX_SLEEP)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _load(self) -> None:
+        now = time.time()
+        for key, record in list(self.records.items()):
+            if record['repeat_days'] and self._time(record['at']).timestamp() <= now:
+                record = self._roll_over(key, record, now)
+            self._push_occurrence(key, record)
+
+    def reload(self) -> None:
+        """Pick up meetings scheduled by another process; entries already queued are skipped when they surface."""
+        if self._task is not None:
+            self._load()
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Load the persisted schedule (catching up on missed reminders) and start the task."""
+        if self._task is not None:
+            return
+        self._load()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,111 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, MutableMapping, Optional
+
+STATUS_PENDING = 'pending'
+STATUS_APPROVED = 'approved'
+STATUS_REJECTED = 'rejected'
+
+STATUS_LABELS = {
+    STATUS_PENDING: 'قيد المراجعة ⏳',
+    STATUS_APPROVED: 'مقبول ✅',
+    STATUS_REJECTED: 'مرفوض ❌',
+}
+
+TYPE_LABELS = {
+    'excuse': 'اعتذار',
+    'leave': 'إجازة',
+}
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class RequestRegistry:
+    """Excuse and leave requests keyed by request_id, indexed by user_id.
+
+    `records` is any mapping of request_id -> record dict (normally a
+    PersistentDict so records survive restarts). The per-user index is
+    rebuilt from it the first time it is needed.
+    """
+
+    def __init__(self, records: MutableMapping[int, Dict]):
+        self._records = records
+        self._user_index: Optional[Dict[int, List[int]]] = None
+
+    @property
+    def _by_user(self) -> Dict[int, List[int]]:
+        # Built on first use so a cold start does not pay for it
+        if self._user_index is None:
+            self._user_index = defaultdict(list)
+            for request_id in sorted(self._records):
+                self._user_index[self._records[request_id]['user_id']].append(request_id)
+        return self._user_index
+
+    def reload(self) -> None:
+        """Forget the index after the records were changed by another process."""
+        self._user_index = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def create(self, request_id: int, user_id: int, request_type: str, payload: Dict) -> Dict:
+        created = _now()
+        record = {
+            'request_id': request_id,
+            'user_id': user_id,
+            'type': request_type,
+            'payload': payload,
+            'status': STATUS_PENDING,
+            'created_at': created,
+            'updated_at': created,
+            'history': [{'status': STATUS_PENDING, 'at': created, 'by': user_id}],
+        }
+        # Build the index before writing, or a first build would already include this record
+        index = self._by_user
+        self._records[request_id] = record
+        index[user_id].append(request_id)
+        return record
+
+    def get(self, request_id: int) -> Optional[Dict]:
+        return self._records.get(request_id)
+
+    def for_user(self, user_id: int, limit: Optional[int] = None) -> List[Dict]:
+        """Return the user's requests, newest first."""
+        ids = self._by_user.get(user_id, [])
+        if limit is not None:
+            ids = ids[-limit:]
+        return [self._records[request_id] for request_id in reversed(ids)]
+
+    def set_status(self, request_id: int, status: str, by: Optional[int] = None) -> Optional[Dict]:
+        record = self._records.get(request_id)
+        if record is None:
+            return None
+        now = _now()
+        record = dict(record, status=status, updated_at=now)
+        record['history'] = record['history'] + [{'status': status, 'at': now, 'by': by}]
+        # Reassign so persistent mappings notice the change
+        self._records[request_id] = record
+        return record
+
+
+def format_request_line(record: Dict) -> str:
+    type_label = TYPE_LABELS.get(record['type'], record['type'])
+    return f"#{record['request_id']} - {type_label} - {STATUS_LABELS.get(record['status'], record['status'])}"
+
+
+def format_request_details(record: Dict) -> str:
+    payload = record['payload']
+    lines = [
+        f"طلب #{record['request_id']} ({TYPE_LABELS.get(record['type'], record['type'])})",
+        f"الحالة: {STATUS_LABELS.get(record['status'], record['status'])}",
+        f"تاريخ التقديم: {record['created_at']}",
+        f"آخر تحديث: {record['updated_at']}",
+    ]
+    if record['type'] == 'excuse':
+        lines.append(f"نوع النشاط: {payload.get('activity_type', 'غير محدد')}")
+    elif record['type'] == 'leave':
+        lines.append(f"من {payload.get('start_date', 'غير محدد')} إلى {payload.get('end_date', 'غير محدد')}")
+    lines.append(f"السبب: {payload.get('reason', 'غير محدد')}")
+    return "\n".join(lines)
@@ -0,0 +1,109 @@
+import os
+import fcntl
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from persistence import Store
+from fsm_storage import SQLiteStorage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = 256
+POLL_MIN = 0.002  # seconds between attempts on a lock held by another process, doubling
+POLL_MAX = 0.05
+
+
+class KeyLocks:
+    """Per-key locks that also hold across processes on the same host.
+
+    Keys are striped over `buckets` lock files in `directory`. A bucket is
+    held with an asyncio lock (other tasks of this process) plus an
+    exclusive flock on its file (other processes); unrelated keys rarely
+    share a bucket, and when they do they just wait their turn.
+    """
+
+    def __init__(self, directory: str, buckets: int = DEFAULT_BUCKETS):
+        self.directory = directory
+        self.buckets = max(1, buckets)
+        os.makedirs(directory, exist_ok=True)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._files: Dict[int, int] = {}
+        self.waits = 0
+
+    def _fd(self, bucket: int) -> int:
+        fd = self._files.get(bucket)
+        if fd is None:
+            fd = self._files[bucket] = os.open(os.path.join(self.directory, f"{bucket}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        return fd
+
+    @asynccontextmanager
+    async def hold(self, key: int) -> AsyncIterator[None]:
+        bucket = hash(key) % self.buckets
+        lock = self._locks.setdefault(bucket, asyncio.Lock())
+        async with lock:
+            fd = self._fd(bucket)
+            delay = POLL_MIN
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # Another process handles this key right now. Poll instead of
+                    # blocking a thread: the holder may need the default executor
+                    # for its flush before it can let go.
+                    if delay == POLL_MIN:
+                        self.waits += 1
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, POLL_MAX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        for fd in self._files.values():
+            os.close(fd)
+        self._files.clear()
+
+
+class SharedStateMiddleware(BaseMiddleware):
+    """Serializes each chat's updates across worker processes sharing one database.
+
+    While the chat's lock is held the store first applies what other
+    workers flushed, then the handler runs, and the store and FSM storage
+    are flushed before the lock is released, so the next worker to handle
+    this chat starts from this update's result.
+    """
+
+    def __init__(self, locks: KeyLocks, store: Store, storage: Optional[SQLiteStorage] = None):
+        self.locks = locks
+        self.store = store
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get('event_chat')
+        user = data.get('event_from_user')
+        key = chat.id if chat is not None else user.id if user is not None else None
+        if key is None:
+            return await handler(event, data)
+        async with self.locks.hold(key):
+            await self.store.refresh()
+            try:
+                return await handler(event, data)
+            finally:
+                flushes: List[Awaitable[None]] = [self.store.flush()]
+                if self.storage is not None:
+                    flushes.append(self.storage.flush())
+                for result in await asyncio.gather(*flushes, return_exceptions=True):
+                    if isinstance(result, Exception):
+                        logger.error(f"Failed to flush state for {key}: {result}")
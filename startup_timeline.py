@@ -0,0 +1,65 @@
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimeline:
+    """Milestones of one process start, measured from when it was created.
+
+    Create it as early as possible (first lines of main.py) and call mark()
+    as each phase completes.
+    """
+
+    def __init__(self, release: Optional[str] = None):
+        self.release = release
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, name: str) -> None:
+        if any(existing == name for existing, _ in self.marks):
+            return
+        elapsed = time.perf_counter() - self.started
+        self.marks.append((name, elapsed))
+        logger.info(f"Startup: {name} at {elapsed * 1000:.0f} ms")
+
+    def as_dict(self) -> Dict:
+        return {
+            'release': self.release,
+            'started_at': self.started_at,
+            'marks': {name: round(elapsed * 1000, 1) for name, elapsed in self.marks},
+        }
+
+    def summary(self) -> str:
+        steps = []
+        previous = 0.0
+        for name, elapsed in self.marks:
+            steps.append(f"{name} +{(elapsed - previous) * 1000:.0f}ms")
+            previous = elapsed
+        return f"release {self.release or 'unknown'}: " + ", ".join(steps)
+
+    def first_request_middleware(self, path: str, on_first=None):
+        """aiohttp middleware that marks 'first request served' once, on the first update handled at `path`.
+
+        Health checks and other routes do not count, nor do requests the
+        webhook handler refused.
+        """
+        # Imported here so creating the timeline stays cheap
+        from aiohttp import web
+
+        served = False
+
+        @web.middleware
+        async def middleware(request, handler):
+            nonlocal served
+            response = await handler(request)
+            if not served and request.path == path and response.status < 400:
+                served = True
+                self.mark('first request served')
+                if on_first is not None:
+                    on_first(self)
+            return response
+
+        return middleware
@@ -0,0 +1,66 @@
+import re
+import hashlib
+import logging
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
+
+logger = logging.getLogger(__name__)
+
+_MARKDOWN_BOLD = re.compile(r"\*\*(.+?)\*\*")
+
+
+def markdown_to_plain(text: str) -> str:
+    """Strip the bold markers used in the bot's Markdown texts."""
+    return _MARKDOWN_BOLD.sub(r"\1", text)
+
+
+class StaticDocument:
+    """Long reference text rendered once into an uploadable file."""
+
+    def __init__(self, key: str, filename: str, text: str, caption: str = ""):
+        self.key = key
+        self.filename = filename
+        self.caption = caption
+        self.data = markdown_to_plain(text).encode('utf-8')
+        self.digest = hashlib.sha256(self.data).hexdigest()[:16]
+
+
+class StaticAssetCache:
+    """Uploads each document once and resends it by the file_id Telegram returns.
+
+    `records` is a persistent dict (key -> {'file_id', 'digest'}); a changed
+    document gets a new digest and is uploaded again on its next use.
+    """
+
+    def __init__(self, records: Dict[str, dict]):
+        self.records = records
+        self.uploads = 0
+        self.hits = 0
+
+    def file_id(self, document: StaticDocument) -> Optional[str]:
+        record = self.records.get(document.key)
+        if record and record.get('digest') == document.digest:
+            return record['file_id']
+        return None
+
+    async def send(self, bot: Bot, chat_id: int, document: StaticDocument, **kwargs) -> Message:
+        file_id = self.file_id(document)
+        if file_id is not None:
+            try:
+                message = await bot.send_document(chat_id, file_id, caption=document.caption, **kwargs)
+                self.hits += 1
+                return message
+            except TelegramBadRequest as e:
+                # File ids are per bot; a new token or an expired file needs a fresh upload
+                logger.warning(f"Cached file for {document.key} rejected ({e}), uploading again")
+                self.records.pop(document.key, None)
+        upload = BufferedInputFile(document.data, filename=document.filename)
+        message = await bot.send_document(chat_id, upload, caption=document.caption, **kwargs)
+        self.uploads += 1
+        if message.document is not None:
+            self.records[document.key] = {'file_id': message.document.file_id, 'digest': document.digest}
+            logger.info(f"Uploaded {document.key} ({len(document.data)} bytes), file_id cached")
+        return message
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from persistence import Store  # noqa: E402
+
+
+@pytest.fixture
+def shared_stores(tmp_path):
+    """Two shared stores on one database, standing in for two worker processes."""
+    first = Store(str(tmp_path / "bot.db"), shared=True)
+    second = Store(str(tmp_path / "bot.db"), shared=True)
+    second._origin = first._origin + 1
+    return first, second
@@ -0,0 +1,57 @@
+import time
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.methods import EditMessageText, SendMessage
+
+from api_middleware import ApiCallMiddleware
+
+
+async def make_request(bot, method):
+    return True
+
+
+def test_edits_do_not_queue_behind_group_posts():
+    async def run():
+        middleware = ApiCallMiddleware()
+        for _ in range(3):  # use up the group's burst
+            await middleware(make_request, None, SendMessage(chat_id=-100, text="x"))
+        started = time.perf_counter()
+        await middleware(make_request, None, EditMessageText(chat_id=-100, message_id=1, text="y"))
+        assert time.perf_counter() - started < 0.5
+        post = asyncio.create_task(middleware(make_request, None, SendMessage(chat_id=-100, text="z")))
+        await asyncio.sleep(0.5)
+        assert not post.done()  # new posts still wait for the group's rate
+        post.cancel()
+
+    asyncio.run(run())
+
+
+def failing(error, times):
+    calls = []
+
+    async def make(bot, method):
+        calls.append(method.__api_method__)
+        if len(calls) <= times:
+            raise error(method=method, message="boom")
+        return True
+
+    return make, calls
+
+
+def test_network_errors_are_retried_only_for_idempotent_methods():
+    async def run():
+        middleware = ApiCallMiddleware(base_delay=0.001)
+        make, calls = failing(TelegramNetworkError, 1)
+        with pytest.raises(TelegramNetworkError):
+            await middleware(make, None, SendMessage(chat_id=1, text="x"))
+        assert calls == ['sendMessage']
+        make, calls = failing(TelegramNetworkError, 1)
+        assert await middleware(make, None, EditMessageText(chat_id=1, message_id=1, text="y"))
+        assert calls == ['editMessageText'] * 2
+        make, calls = failing(TelegramServerError, 1)
+        assert await middleware(make, None, SendMessage(chat_id=2, text="x"))
+        assert calls == ['sendMessage'] * 2
+
+    asyncio.run(run())
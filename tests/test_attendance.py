@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from attendance import SESSION_MEETING, AttendanceRegistry, format_missed
+from volunteer_roster import VolunteerRoster
+
+
+def test_missed_last_includes_confirmed_members_who_never_attended():
+    roster = VolunteerRoster({})
+    for name in ("أحمد", "سارة", "ليلى"):
+        roster.add(name)
+    registry = AttendanceRegistry({}, key=roster.resolve, label=roster.name, everyone=roster.members)
+    registry.record(SESSION_MEETING, ["أحمد", "سارة"], when=datetime(2026, 3, 1))
+    registry.record(SESSION_MEETING, ["احمد"], when=datetime(2026, 3, 8))
+    assert registry.missed_last(3) == []  # not enough sessions yet
+    assert sorted(roster.name(v) for v in registry.missed_last(1)) == ["سارة", "ليلى"]
+    assert sorted(roster.name(v) for v in registry.missed_last(2)) == ["ليلى"]
+    assert "ليلى" in format_missed(registry, 2)
+
+
+def test_one_off_names_are_not_members():
+    roster = VolunteerRoster({})
+    roster.add("أحمد")
+    registry = AttendanceRegistry({}, key=roster.resolve, label=roster.name, everyone=roster.members)
+    registry.record(SESSION_MEETING, ["أحمد", "ضيف زائر"], when=datetime(2026, 3, 1))
+    registry.record(SESSION_MEETING, ["أحمد", "خالد"], when=datetime(2026, 3, 8))
+    registry.record(SESSION_MEETING, ["أحمد", "خالد"], when=datetime(2026, 3, 15))
+    names = lambda volunteers: sorted(roster.name(v) for v in volunteers)
+    # The guest was auto-registered by the attendance list but never confirmed
+    assert names(registry.missed_last(2)) == []
+    assert names(v for v, _, _ in registry.monthly_rates('2026-03')) == ["أحمد", "خالد"]
+    # Filing a request under their own name makes them a member
+    roster.resolve("ضيف زائر", confirm=True)
+    assert names(registry.missed_last(2)) == ["ضيف زائر"]
+    assert [row[1:] for row in registry.monthly_rates('2026-03')] == [(3, 3), (2, 3), (1, 3)]
+
+
+def test_without_a_roster_reports_cover_everyone_seen():
+    registry = AttendanceRegistry({})
+    registry.record(SESSION_MEETING, ["a", "b"])
+    registry.record(SESSION_MEETING, ["a"])
+    assert [registry.display_name(v) for v in registry.missed_last(1)] == ["b"]
+    assert len(registry.monthly_rates(datetime.now().strftime('%Y-%m'))) == 2
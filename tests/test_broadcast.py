@@ -0,0 +1,62 @@
+import asyncio
+
+from broadcast import BroadcastEngine, BroadcastJobs
+from persistence import Store
+
+
+def test_only_one_process_runs_a_job_until_its_lease_expires(tmp_path):
+    async def run():
+        path = str(tmp_path / "bot.db")
+        first = BroadcastJobs({}, {}, store=Store(path, shared=True), lease_ttl=60)
+        second = BroadcastJobs({}, {}, store=Store(path, shared=True), lease_ttl=60)
+        assert await first.acquire(1)
+        assert not await second.acquire(1)
+        await first.release(1)
+        assert await second.acquire(1)
+        second.lease_ttl = first.lease_ttl = 0.03
+        assert await second.acquire(1)
+        # The holder stops renewing (it crashed): the job can be taken over,
+        # and the old holder's keeper notices and stops its engine
+        engine = BroadcastEngine([], lambda chat_id: asyncio.sleep(0))
+        await asyncio.sleep(0.05)
+        assert await first.acquire(1)
+        first.lease_ttl = 60
+        await asyncio.wait_for(second.keep_lease(1, engine), 1)
+        assert engine.stopped
+
+    asyncio.run(run())
+
+
+def test_without_a_store_jobs_always_run_here():
+    async def run():
+        jobs = BroadcastJobs({}, {})
+        jobs.create(1, [10, 20], {'text': 'x'})
+        assert await jobs.acquire(1) and jobs.unfinished() == [1]
+
+    asyncio.run(run())
+
+
+def test_a_send_cancelled_in_flight_is_not_checkpointed():
+    async def run():
+        checkpoints = []
+        hung = asyncio.Event()
+
+        async def send(chat_id):
+            if chat_id == 30:
+                hung.set()
+                await asyncio.sleep(60)
+
+        engine = BroadcastEngine(
+            [10, 20, 30], send, concurrency=1, rate=1000,
+            on_checkpoint=lambda engine: checkpoints.append(engine.state()),
+        )
+        task = asyncio.create_task(engine.run())
+        await hung.wait()
+        engine.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert engine.sent == 2 and len(checkpoints) == 2
+        resumed = BroadcastEngine([10, 20, 30], send, resume=checkpoints[-1])
+        assert resumed.cursor == 2 and resumed._take() == 2
+
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+import asyncio
+
+from decisions import DecisionLog, OUTCOME_APPLIED, OUTCOME_CONFLICT, OUTCOME_DUPLICATE
+from persistence import Store
+from requests_registry import STATUS_APPROVED, STATUS_REJECTED
+
+
+def make_log(path, **kwargs):
+    return DecisionLog(Store(str(path)), {}, **kwargs)
+
+
+def test_first_decision_wins(tmp_path):
+    async def run():
+        log = make_log(tmp_path / "bot.db")
+        decision, applied = await log.decide(1, STATUS_APPROVED, by=10)
+        assert applied and decision['status'] == STATUS_APPROVED and decision['by'] == 10
+        again, applied = await log.decide(1, STATUS_APPROVED, by=10)
+        assert not applied and again == decision
+        other, applied = await log.decide(1, STATUS_REJECTED, by=20)
+        assert not applied and other['status'] == STATUS_APPROVED
+        assert [a['outcome'] for a in log.audit[1]] == [OUTCOME_APPLIED, OUTCOME_DUPLICATE, OUTCOME_CONFLICT]
+        # Only the first call touched the database
+        assert log.claims == 1 and log.hits == 2
+
+    asyncio.run(run())
+
+
+def test_concurrent_decisions_have_one_winner(tmp_path):
+    async def run():
+        log = make_log(tmp_path / "bot.db")
+        results = await asyncio.gather(
+            log.decide(1, STATUS_APPROVED, by=10),
+            log.decide(1, STATUS_REJECTED, by=20),
+            log.decide(1, STATUS_APPROVED, by=30),
+        )
+        assert sum(applied for _, applied in results) == 1
+        assert len({decision['token'] for decision, _ in results}) == 1
+
+    asyncio.run(run())
+
+
+def test_decisions_are_shared_through_the_store(tmp_path):
+    async def run():
+        path = tmp_path / "bot.db"
+        first, second = make_log(path), make_log(path)
+        _, applied = await first.decide(1, STATUS_REJECTED, by=10)
+        assert applied
+        decision, applied = await second.decide(1, STATUS_APPROVED, by=20)
+        assert not applied and decision['by'] == 10
+        assert (await second.check(1, STATUS_APPROVED, by=20))['status'] == STATUS_REJECTED
+
+    asyncio.run(run())
+
+
+def test_expired_cache_falls_back_to_the_store(tmp_path):
+    async def run():
+        log = make_log(tmp_path / "bot.db", ttl=0)
+        await log.decide(1, STATUS_APPROVED, by=10)
+        _, applied = await log.decide(1, STATUS_REJECTED, by=20)
+        assert not applied and log.claims == 2
+
+    asyncio.run(run())
+
+
+def test_seed_records_an_earlier_decision(tmp_path):
+    async def run():
+        log = make_log(tmp_path / "bot.db")
+        assert await log.check(1, STATUS_APPROVED, by=10) is None
+        await log.seed(1, STATUS_REJECTED, by=5, at='2026-01-01 10:00:00')
+        decision, applied = await log.decide(1, STATUS_APPROVED, by=10)
+        assert not applied and decision['by'] == 5
+
+    asyncio.run(run())
+
+
+def test_claim_keeps_the_first_value(shared_stores):
+    a, b = shared_stores
+    assert a.claimed('c', 1) is None
+    assert a.claim('c', 1, {'by': 'a'}) == {'by': 'a'}
+    assert b.claim('c', 1, {'by': 'b'}) == {'by': 'a'}
+    assert b.claimed('c', 1) == {'by': 'a'}
@@ -0,0 +1,41 @@
+import asyncio
+
+from id_allocator import BlockIdAllocator
+from persistence import Store
+
+
+def test_ids_are_unique_across_allocators_and_restarts(tmp_path):
+    async def run():
+        path = str(tmp_path / "bot.db")
+        first = BlockIdAllocator(Store(path), 'request_id', block_size=3)
+        second = BlockIdAllocator(Store(path), 'request_id', block_size=3)
+        ids = [await first.next(), await second.next(), await first.next(), await first.next(), await first.next()]
+        assert ids == [1, 4, 2, 3, 7]
+        # A restart skips what was left of the leased blocks
+        restarted = BlockIdAllocator(Store(path), 'request_id', block_size=3)
+        assert await restarted.next() == 10
+
+    asyncio.run(run())
+
+
+def test_concurrent_callers_get_distinct_ids(tmp_path):
+    async def run():
+        allocator = BlockIdAllocator(Store(str(tmp_path / "bot.db")), 'request_id', block_size=4)
+        ids = await asyncio.gather(*(allocator.next() for _ in range(20)))
+        assert sorted(ids) == list(range(1, 21))
+
+    asyncio.run(run())
+
+
+def test_start_seeds_the_sequence(tmp_path):
+    store = Store(str(tmp_path / "bot.db"))
+    allocator = BlockIdAllocator(store, 'volunteer_id', block_size=2, start=42)
+    assert [allocator.next_nowait() for _ in range(3)] == [42, 43, 44]
+
+
+def test_lease_hands_out_disjoint_blocks(shared_stores):
+    a, b = shared_stores
+    assert a.lease('seq', 10) == 1
+    assert b.lease('seq', 10) == 11
+    assert a.lease('seq', 5, start=100) == 100
+    assert b.lease('seq', 1) == 105
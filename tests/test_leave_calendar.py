@@ -0,0 +1,62 @@
+import random
+from datetime import date, timedelta
+
+from leave_calendar import LeaveCalendar, parse_date, parse_range
+
+
+def test_parse_dates():
+    assert parse_date("٢٠٢٦-١١-٠٥") == date(2026, 11, 5)
+    assert parse_date("2026/2/30") is None
+    assert parse_range("من 2026-11-08 إلى 2026-11-01") == (date(2026, 11, 1), date(2026, 11, 8))
+    assert parse_range("غداً") is None
+
+
+def test_overlapping_matches_a_linear_scan():
+    rng = random.Random(7)
+    calendar = LeaveCalendar({})
+    base = date(2026, 1, 1)
+    intervals = {}
+    for request_id in range(1, 300):
+        start = base + timedelta(days=rng.randrange(365))
+        end = start + timedelta(days=rng.randrange(20))
+        calendar.add(request_id, request_id, f"v{request_id}", start, end)
+        intervals[request_id] = (start, end)
+    for request_id in rng.sample(sorted(intervals), 50):
+        calendar.remove(request_id)
+        del intervals[request_id]
+    for _ in range(200):
+        start = base + timedelta(days=rng.randrange(380))
+        end = start + timedelta(days=rng.randrange(10))
+        found = {record['request_id'] for record in calendar.overlapping(start, end)}
+        expected = {rid for rid, (s, e) in intervals.items() if s <= end and e >= start}
+        assert found == expected
+
+
+def test_reload_rebuilds_from_records():
+    records = {}
+    calendar = LeaveCalendar(records)
+    calendar.add(1, 1, "a", date(2026, 3, 1), date(2026, 3, 5))
+    records[2] = {'request_id': 2, 'volunteer_id': 2, 'name': "b", 'start': '2026-03-04', 'end': '2026-03-06'}
+    calendar.reload()
+    assert [r['request_id'] for r in calendar.overlapping(date(2026, 3, 4))] == [1, 2]
+
+
+def test_peak_absent():
+    calendar = LeaveCalendar({})
+    calendar.add(1, 1, "a", date(2026, 3, 1), date(2026, 3, 5))
+    calendar.add(2, 2, "b", date(2026, 3, 4), date(2026, 3, 10))
+    assert calendar.peak_absent(date(2026, 3, 1), date(2026, 3, 31)) == (2, date(2026, 3, 4))
+    extra = {'volunteer_id': 3, 'name': "c", 'start': '2026-03-05', 'end': '2026-03-05'}
+    assert calendar.peak_absent(date(2026, 3, 1), date(2026, 3, 31), extra=extra) == (3, date(2026, 3, 5))
+
+
+def test_peak_absent_counts_each_volunteer_once():
+    calendar = LeaveCalendar({})
+    calendar.add(1, 1, "a", date(2026, 3, 1), date(2026, 3, 5))
+    calendar.add(2, 1, "a", date(2026, 3, 3), date(2026, 3, 8))
+    calendar.add(3, None, "سارة", date(2026, 3, 4), date(2026, 3, 4))
+    calendar.add(4, None, "ساره", date(2026, 3, 4), date(2026, 3, 6))
+    assert calendar.peak_absent(date(2026, 3, 1), date(2026, 3, 31)) == (2, date(2026, 3, 4))
+    # A second request of someone already away adds nobody
+    extra = {'volunteer_id': 1, 'name': "a", 'start': '2026-03-04', 'end': '2026-03-04'}
+    assert calendar.peak_absent(date(2026, 3, 1), date(2026, 3, 31), extra=extra) == (2, date(2026, 3, 4))
@@ -0,0 +1,91 @@
+import asyncio
+
+from persistence import Store
+
+
+def test_refresh_applies_other_process_changes(shared_stores):
+    async def run():
+        a, b = shared_stores
+        users_a, users_b = a.load_set('users'), b.load_set('users')
+        dict_a, dict_b = a.load_dict('d'), b.load_dict('d')
+        list_a, list_b = a.load_list('l'), b.load_list('l')
+        calls = []
+        b.on_change('d', lambda: calls.append('d'))
+
+        users_a.add(5)
+        dict_a[1] = {'x': 1}
+        list_a.append('item')
+        await a.flush()
+        assert await b.refresh() == {'users', 'd', 'l'}
+        assert users_b == {5} and dict_b == {1: {'x': 1}} and list_b == ['item']
+        assert calls == ['d']
+        # Applied in place, so nothing is written back
+        assert b.pending == 0
+
+        users_a.discard(5)
+        del dict_a[1]
+        await a.flush()
+        await b.refresh()
+        assert users_b == set() and dict_b == {}
+
+        # Own changes are not echoed back
+        assert await a.refresh() == set()
+        await a.close()
+        await b.close()
+
+    asyncio.run(run())
+
+
+def test_refresh_keeps_unflushed_local_changes(shared_stores):
+    async def run():
+        a, b = shared_stores
+        dict_a, dict_b = a.load_dict('d'), b.load_dict('d')
+        dict_a['k'] = 'theirs'
+        await a.flush()
+        dict_b['k'] = 'mine'
+        await b.refresh()
+        assert dict_b['k'] == 'mine'
+        await a.close()
+        await b.close()
+
+    asyncio.run(run())
+
+
+def test_refresh_passes_raw_rows_to_watchers(shared_stores):
+    async def run():
+        a, b = shared_stores
+        a.load_rows('rows')
+        b.load_rows('rows')
+        seen = {}
+        b.watch_rows('rows', seen.__setitem__)
+        a.write_row('rows', 7, [1, 2])
+        await a.flush()
+        assert await b.refresh() == {'rows'}
+        assert seen == {7: [1, 2]}
+        await a.close()
+        await b.close()
+
+    asyncio.run(run())
+
+
+def test_unshared_store_does_not_refresh(tmp_path):
+    async def run():
+        store = Store(str(tmp_path / "bot.db"))
+        store.load_set('users').add(1)
+        await store.flush()
+        assert await store.refresh() == set()
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_hold_gives_a_key_to_one_owner_until_it_expires(shared_stores):
+    a, b = shared_stores
+    assert a.hold('jobs', 1, 'a', ttl=60)
+    assert a.hold('jobs', 1, 'a', ttl=60)  # renewal
+    assert not b.hold('jobs', 1, 'b', ttl=60)
+    a.release('jobs', 1, 'b')  # not the holder: no effect
+    assert not b.hold('jobs', 1, 'b', ttl=60)
+    a.release('jobs', 1, 'a')
+    assert b.hold('jobs', 1, 'b', ttl=0)
+    assert a.hold('jobs', 1, 'a', ttl=60)  # b's lease expired
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from reminders import ReminderScheduler, parse_meeting_time
+
+BERLIN = ZoneInfo('Europe/Berlin')
+
+
+async def send(key, at, offset):
+    pass
+
+
+def test_parse_meeting_time():
+    at, repeat_days = parse_meeting_time("٢٠٢٦-٠٣-٢٢ ١٨:٣٠ أسبوعي", BERLIN)
+    assert at == datetime(2026, 3, 22, 18, 30, tzinfo=BERLIN) and repeat_days == 7
+    assert parse_meeting_time("2026-02-30 18:30", BERLIN) is None
+
+
+def test_weekly_meeting_keeps_local_time_across_dst():
+    records = {}
+    scheduler = ReminderScheduler(records, send, tz=BERLIN)
+    at = datetime(2026, 3, 22, 18, 30, tzinfo=BERLIN)  # clocks go forward on 2026-03-29
+    records['weekly'] = {'at': at.isoformat(), 'repeat_days': 7, 'sent': []}
+    record = scheduler._roll_over('weekly', records['weekly'], at.timestamp())
+    next_at, repeat_days = scheduler.next_occurrence('weekly')
+    assert next_at == datetime(2026, 3, 29, 18, 30, tzinfo=BERLIN)
+    assert (next_at.hour, next_at.minute) == (18, 30)
+    assert next_at.timestamp() - at.timestamp() == timedelta(days=7).total_seconds() - 3600
+    assert record['sent'] == [] and repeat_days == 7
@@ -0,0 +1,28 @@
+from requests_registry import STATUS_APPROVED, RequestRegistry
+
+
+def test_first_request_is_indexed_once():
+    registry = RequestRegistry({})
+    registry.create(1, 42, 'excuse', {})
+    assert [record['request_id'] for record in registry.for_user(42)] == [1]
+
+
+def test_for_user_lists_newest_first_after_reload():
+    records = {}
+    registry = RequestRegistry(records)
+    registry.create(1, 42, 'excuse', {})
+    registry.create(2, 7, 'leave', {})
+    registry.reload()
+    registry.create(3, 42, 'leave', {})
+    assert [record['request_id'] for record in registry.for_user(42)] == [3, 1]
+    assert [record['request_id'] for record in registry.for_user(42, limit=1)] == [3]
+    assert registry.for_user(99) == []
+
+
+def test_set_status_appends_history():
+    registry = RequestRegistry({})
+    registry.create(1, 42, 'excuse', {})
+    record = registry.set_status(1, STATUS_APPROVED, by=5)
+    assert record['status'] == STATUS_APPROVED
+    assert [entry['status'] for entry in record['history']] == ['pending', STATUS_APPROVED]
+    assert registry.set_status(2, STATUS_APPROVED) is None
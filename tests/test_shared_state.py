@@ -0,0 +1,123 @@
+import asyncio
+
+from attendance import SESSION_MEETING, AttendanceRegistry
+from broadcast import BroadcastEngine, BroadcastJobs
+from id_allocator import BlockIdAllocator
+from requests_registry import STATUS_APPROVED, RequestRegistry
+from shared_state import KeyLocks
+from user_registry import UserRegistry
+from volunteer_roster import VolunteerRoster
+
+
+class Worker:
+    """The shared-state wiring of main.py on one store."""
+
+    def __init__(self, store):
+        self.store = store
+        self.requests = RequestRegistry(store.load_dict('requests'))
+        store.on_change('requests', self.requests.reload)
+        volunteers = store.load_dict('volunteers')
+        self.roster = VolunteerRoster(volunteers, allocate=BlockIdAllocator(store, 'volunteer_id', block_size=5).next_nowait)
+        store.on_change('volunteers', self.roster.reload)
+        self.attendance = AttendanceRegistry(
+            store.load_dict('attendance_sessions'), key=self.roster.resolve,
+            allocate=BlockIdAllocator(store, 'attendance_session_id', block_size=1).next_nowait,
+        )
+        store.on_change('attendance_sessions', self.attendance.reload)
+        self.users = UserRegistry(store)
+        self.jobs = BroadcastJobs(store.load_dict('broadcast_jobs'), store.load_dict('broadcast_recipients'), store=store)
+
+
+def test_request_index_follows_other_workers(shared_stores):
+    async def run():
+        a, b = (Worker(store) for store in shared_stores)
+        a.requests.create(1, 42, 'excuse', {})
+        assert [r['request_id'] for r in b.requests.for_user(42)] == []
+        await a.store.flush()
+        await b.store.refresh()
+        b.requests.create(2, 42, 'leave', {})
+        assert [r['request_id'] for r in b.requests.for_user(42)] == [2, 1]
+        await b.store.flush()
+        await a.store.refresh()
+        a.requests.set_status(2, STATUS_APPROVED, by=5)
+        assert [r['request_id'] for r in a.requests.for_user(42)] == [2, 1]
+        assert a.requests.get(2)['status'] == STATUS_APPROVED
+
+    asyncio.run(run())
+
+
+def test_ids_do_not_collide_across_workers(shared_stores):
+    async def run():
+        a, b = (Worker(store) for store in shared_stores)
+        ahmad = a.roster.add("أحمد")
+        sara = b.roster.add("سارة")
+        assert ahmad != sara
+        first = a.attendance.record(SESSION_MEETING, ["أحمد"])
+        second = b.attendance.record(SESSION_MEETING, ["سارة"])
+        assert first['id'] != second['id']
+        await a.store.flush()
+        await b.store.flush()
+        await a.store.refresh()
+        assert a.roster.resolve("ساره") == sara
+        assert [s['id'] for s in a.attendance.sessions_of(sara)] == [second['id']]
+
+    asyncio.run(run())
+
+
+def test_user_rows_reach_other_workers(shared_stores):
+    async def run():
+        a, b = (Worker(store) for store in shared_stores)
+        a.users.touch(42, "Sara", now=1000.0)
+        await a.store.flush()
+        await b.store.refresh()
+        assert 42 in b.users and b.users.get(42)[1] == "Sara"
+
+    asyncio.run(run())
+
+
+def test_broadcast_progress_is_resumed_by_another_worker(shared_stores):
+    async def run():
+        a, b = (Worker(store) for store in shared_stores)
+        a.jobs.create(1, [10, 20, 30], {'text': 'x'})
+        assert await a.jobs.acquire(1)
+        engine = BroadcastEngine([10, 20, 30], lambda chat_id: asyncio.sleep(0))
+        engine.cursor, engine.sent = 2, 2
+        a.jobs.checkpoint(1, engine)
+        await a.store.flush()
+        await b.store.refresh()
+        assert b.jobs.unfinished() == [1]
+        assert b.jobs.get(1)['state']['cursor'] == 2
+        assert not await b.jobs.acquire(1)
+        await a.jobs.release(1)  # worker a stopped
+        assert await b.jobs.acquire(1)
+        sent = []
+
+        async def send(chat_id):
+            sent.append(chat_id)
+
+        resumed = BroadcastEngine(b.jobs.recipients[1], send, resume=b.jobs.get(1)['state'])
+        assert await resumed.run()
+        assert sent == [30]
+
+    asyncio.run(run())
+
+
+def test_key_locks_hold_across_processes(tmp_path):
+    async def run():
+        # Two KeyLocks open the lock files separately, like two processes would
+        first, second = KeyLocks(str(tmp_path)), KeyLocks(str(tmp_path))
+        order = []
+
+        async def hold(locks, name):
+            async with locks.hold(7):
+                order.append(f"{name} in")
+                await asyncio.sleep(0.05)
+                order.append(f"{name} out")
+
+        await asyncio.gather(hold(first, "a"), hold(second, "b"))
+        assert order in (["a in", "a out", "b in", "b out"], ["b in", "b out", "a in", "a out"])
+        assert first.waits + second.waits == 1
+        first.close()
+        second.close()
+
+    asyncio.run(run())
@@ -0,0 +1,44 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from startup_timeline import StartupTimeline
+
+
+def test_first_request_is_the_first_webhook_update():
+    async def run():
+        timeline = StartupTimeline()
+        firsts = []
+        app = web.Application(middlewares=[timeline.first_request_middleware('/webhook', on_first=firsts.append)])
+
+        async def ok(request):
+            return web.Response(text="ok")
+
+        app.router.add_get('/health', ok)
+        app.router.add_post('/webhook', ok)
+        async with TestClient(TestServer(app)) as client:
+            await client.get('/health')
+            assert timeline.marks == []
+            await client.post('/webhook')
+            await client.post('/webhook')
+        assert [name for name, _ in timeline.marks] == ['first request served']
+        assert firsts == [timeline]
+
+    asyncio.run(run())
+
+
+def test_refused_webhook_requests_do_not_count():
+    async def run():
+        timeline = StartupTimeline()
+        app = web.Application(middlewares=[timeline.first_request_middleware('/webhook')])
+
+        async def refused(request):
+            return web.Response(status=401)
+
+        app.router.add_post('/webhook', refused)
+        async with TestClient(TestServer(app)) as client:
+            await client.post('/webhook')
+        assert timeline.marks == []
+
+    asyncio.run(run())
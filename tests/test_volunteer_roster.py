@@ -0,0 +1,41 @@
+from volunteer_roster import VolunteerRoster, normalize_arabic
+
+
+def test_normalize_folds_spelling_variants():
+    assert normalize_arabic("أحمدُ  عبد الله") == normalize_arabic("احمد عبدالله")
+    assert normalize_arabic("فاطمة") == normalize_arabic("فاطمه")
+    assert normalize_arabic("مـحـمـد") == "محمد"
+
+
+def test_resolve_matches_spellings_and_keeps_names_apart():
+    roster = VolunteerRoster({})
+    ahmad = roster.resolve("أحمد عبد الله")
+    assert roster.resolve("احمد عبدالله") == ahmad
+    assert roster.resolve("احمد عبد اللة") == ahmad
+    assert roster.resolve("محمود خالد") != roster.resolve("محمد خالد")
+    assert roster.name(ahmad) == "أحمد عبد الله"
+
+
+def test_search_ranks_best_match_first():
+    roster = VolunteerRoster({})
+    sara = roster.add("سارة أحمد")
+    roster.add("سامر أحمد")
+    assert roster.search("ساره احمد")[0] == (sara, 1.0)
+
+
+
+def test_reload_picks_up_new_records():
+    records = {}
+    roster = VolunteerRoster(records)
+    records[7] = {'id': 7, 'name': "ليلى", 'aliases': [normalize_arabic("ليلى")]}
+    roster.reload()
+    assert roster.resolve("ليلي") == 7
+
+
+def test_names_typed_by_others_stay_unconfirmed():
+    roster = VolunteerRoster({})
+    sara = roster.add("سارة")
+    guest = roster.resolve("ضيف")
+    assert roster.members() == [sara]
+    assert roster.resolve("ضيف", confirm=True) == guest
+    assert roster.members() == [sara, guest]
@@ -0,0 +1,82 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.fsm.state import State
+from aiogram.types import Message
+
+ANY_STATE = object()
+
+
+class TextCommandRouter(BaseMiddleware):
+    """Dispatch keyboard button presses with a single dict lookup.
+
+    Register it as an outer middleware on `dp.message`. Buttons are looked
+    up by (FSM state, text) first and then by text alone; anything that
+    does not match falls through to the regular handlers. In free-text
+    states (where the user is typing a name, reason, ...) only buttons
+    registered with `always=True` are routed, so the form handler keeps
+    receiving the text.
+
+    `observer`, if given, is called with (handler name, seconds, failed)
+    after every routed handler, since these bypass inner middlewares.
+    """
+
+    def __init__(self, observer: Optional[Callable[[str, float, bool], None]] = None) -> None:
+        self.observer = observer
+        self._routes: Dict[Tuple[Any, str], Tuple[CallableObject, bool]] = {}
+        self._free_text_states: Set[Optional[str]] = set()
+
+    def button(self, text: str, state: Optional[State] = None, always: bool = False):
+        """Decorator registering a handler for one button text."""
+        key = (ANY_STATE if state is None else state.state, text)
+
+        def decorator(callback: Callable[..., Awaitable[Any]]):
+            if key in self._routes:
+                raise ValueError(f"Button {text!r} is already routed for this state")
+            self._routes[key] = (CallableObject(callback), always)
+            return callback
+
+        return decorator
+
+    def free_text(self, *states: State) -> None:
+        """Mark states whose catch-all handler should receive menu texts too."""
+        self._free_text_states.update(state.state for state in states)
+
+    def resolve(self, raw_state: Optional[str], text: str) -> Optional[CallableObject]:
+        route = self._routes.get((raw_state, text))
+        if route is None:
+            route = self._routes.get((ANY_STATE, text))
+            if route is not None and not route[1] and raw_state in self._free_text_states:
+                return None
+        return route[0] if route is not None else None
+
+    def handlers(self) -> List[CallableObject]:
+        """Every routed handler (a handler behind several buttons appears once per button)."""
+        return [route[0] for route in self._routes.values()]
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.text is not None:
+            target = self.resolve(data.get('raw_state'), event.text)
+            if target is not None:
+                if self.observer is None:
+                    return await target.call(event, **data)
+                start = time.perf_counter()
+                failed = False
+                try:
+                    return await target.call(event, **data)
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    self.observer(target.callback.__name__, time.perf_counter() - start, failed)
+        return await handler(event, data)
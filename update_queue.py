@@ -0,0 +1,124 @@
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_QUEUE = 1000
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """Best-effort chat (or user) id of a raw update, used for sharding."""
+    for key, value in update.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        sender = value.get('from') or value.get('user')
+        if sender:
+            return sender['id']
+    return 0
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Webhook handler that acknowledges at once and processes updates in workers.
+
+    Updates are sharded by chat id over `workers` queues, each consumed by
+    one worker task: updates from the same chat are handled in arrival
+    order while different chats run in parallel. When `max_queue` updates
+    are waiting the webhook answers 503 so Telegram retries later.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        workers: int = DEFAULT_WORKERS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        secret_token: Optional[str] = None,
+        **data: Any,
+    ) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.depth = 0
+        self.max_depth = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.wait_time_total = 0.0
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        app.on_startup.append(self._start_workers)
+        super().register(app, path=path, **kwargs)
+
+    async def _start_workers(self, app: web.Application) -> None:
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+        logger.info(f"Started {self.workers} update workers (max queue {self.max_queue})")
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            bot, update, received_at = await queue.get()
+            self.depth -= 1
+            self.wait_time_total += time.monotonic() - received_at
+            try:
+                result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=bot, result=result)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Failed to process update {update.get('update_id')}: {e}")
+            finally:
+                self.processed += 1
+                queue.task_done()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Update queue full ({self.depth}), asking Telegram to retry")
+            return web.Response(status=503, text="Queue full")
+        update = await request.json(loads=bot.session.json_loads)
+        shard = update_chat_id(update) % self.workers
+        self._queues[shard].put_nowait((bot, update, time.monotonic()))
+        self.depth += 1
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def stats(self) -> Dict[str, Any]:
+        done = self.processed or 1
+        return {
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'shard_depths': [queue.qsize() for queue in self._queues],
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self.wait_time_total / done * 1000, 2),
+        }
+
+    async def close(self) -> None:
+        """Drain what is already queued (briefly), then stop the workers."""
+        if self._queues:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout=10)
+            except asyncio.TimeoutError:
+                logger.warning(f"Stopping update workers with {self.depth} updates still queued")
+        for task in self._tasks:
+            task.cancel()
+        await super().close()
@@ -0,0 +1,138 @@
+import time
+import heapq
+from array import array
+from typing import Any, Awaitable, Callable, Dict, List, MutableSet, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Chat, TelegramObject, User
+
+from persistence import Store
+
+DAY = 86400
+
+
+class UserRegistry:
+    """Compact table of user_id -> last_seen / first_name / language.
+
+    Rows live in parallel arrays addressed through an id -> row index, so
+    touching a known user is a dict lookup and an array store. Changes are
+    written through the store's batched flush; last_seen is only persisted
+    when it moved by more than `persist_interval` seconds. Rows written by
+    other processes sharing the database are applied through the store's
+    refresh.
+    """
+
+    def __init__(self, store: Store, name: str = 'user_profiles', persist_interval: float = 300):
+        self._store = store
+        self._name = name
+        self.persist_interval = persist_interval
+        self._index: Dict[int, int] = {}
+        self._ids = array('q')
+        self._last_seen = array('d')
+        self._persisted = array('d')
+        self._first_names: List[str] = []
+        self._languages: List[str] = []
+        for user_id, (last_seen, first_name, language) in store.load_rows(name).items():
+            self._append(user_id, last_seen, first_name, language)
+        store.watch_rows(name, self._apply_row)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._index
+
+    def _append(self, user_id: int, last_seen: float, first_name: str, language: str) -> int:
+        row = len(self._ids)
+        self._index[user_id] = row
+        self._ids.append(user_id)
+        self._last_seen.append(last_seen)
+        self._persisted.append(last_seen)
+        self._first_names.append(first_name)
+        self._languages.append(language)
+        return row
+
+    def _apply_row(self, user_id: int, value: Optional[list]) -> None:
+        if value is None:
+            return  # rows are never deleted
+        last_seen, first_name, language = value
+        row = self._index.get(user_id)
+        if row is None:
+            self._append(user_id, last_seen, first_name, language)
+            return
+        # Keep whichever sighting is newer; the row is already persisted as of last_seen
+        if last_seen >= self._last_seen[row]:
+            self._last_seen[row] = self._persisted[row] = last_seen
+            self._first_names[row] = first_name
+            self._languages[row] = language
+
+    def _persist(self, row: int) -> None:
+        self._persisted[row] = self._last_seen[row]
+        self._store.write_row(
+            self._name, self._ids[row],
+            [self._last_seen[row], self._first_names[row], self._languages[row]],
+        )
+
+    def touch(self, user_id: int, first_name: str = "", language: str = "", now: Optional[float] = None) -> bool:
+        """Record activity for a user. Returns True for users seen for the first time."""
+        now = time.time() if now is None else now
+        row = self._index.get(user_id)
+        if row is None:
+            self._persist(self._append(user_id, now, first_name, language))
+            return True
+        self._last_seen[row] = now
+        if self._first_names[row] != first_name or self._languages[row] != language:
+            self._first_names[row] = first_name
+            self._languages[row] = language
+            self._persist(row)
+        elif now - self._persisted[row] >= self.persist_interval:
+            self._persist(row)
+        return False
+
+    def get(self, user_id: int) -> Optional[Tuple[float, str, str]]:
+        row = self._index.get(user_id)
+        if row is None:
+            return None
+        return self._last_seen[row], self._first_names[row], self._languages[row]
+
+    def active_since(self, days: float, now: Optional[float] = None) -> List[int]:
+        """IDs of users seen within the last `days` days."""
+        cutoff = (time.time() if now is None else now) - days * DAY
+        return [user_id for user_id, seen in zip(self._ids, self._last_seen) if seen >= cutoff]
+
+    def recent(self, limit: int = 10) -> List[Tuple[int, str, float]]:
+        """The `limit` most recently active users as (user_id, first_name, last_seen)."""
+        rows = heapq.nlargest(limit, range(len(self._ids)), key=self._last_seen.__getitem__)
+        return [(self._ids[row], self._first_names[row], self._last_seen[row]) for row in rows]
+
+
+class UserRegistryMiddleware(BaseMiddleware):
+    """Outer update middleware that registers every user once per update."""
+
+    def __init__(
+        self,
+        registry: UserRegistry,
+        audience: Optional[MutableSet[int]] = None,
+        tombstones: Optional[MutableSet[int]] = None,
+    ):
+        self.registry = registry
+        self.audience = audience
+        self.tombstones = tombstones
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: Optional[User] = data.get('event_from_user')
+        if user is not None and not user.is_bot:
+            self.registry.touch(user.id, user.first_name or "", user.language_code or "")
+            chat: Optional[Chat] = data.get('event_chat')
+            # Only private chats can receive broadcasts
+            if self.audience is not None and (chat is None or chat.type == 'private'):
+                self.audience.add(user.id)
+                # A user who blocked the bot and came back is reachable again
+                if self.tombstones is not None and user.id in self.tombstones:
+                    self.tombstones.discard(user.id)
+        return await handler(event, data)
@@ -0,0 +1,171 @@
+import re
+import math
+from collections import defaultdict
+from typing import Callable, Dict, List, MutableMapping, Optional, Set, Tuple
+
+# Harakat, tanween, shadda, sukun, superscript alef and the Quranic marks
+_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    '\u0640': None,  # tatweel
+})
+_NON_WORD = re.compile(r"[^\w\s]")
+_ABD = re.compile(r"\bعبد\s+")
+
+# Dice scores: typos of one name score ~0.9, different names that share most
+# letters (حسن/حسين, محمد/محمود) ~0.84
+DEFAULT_THRESHOLD = 0.88
+MIN_SCORE = 0.6
+
+
+def normalize_arabic(text: str) -> str:
+    """Fold the spelling variants people type for the same Arabic name."""
+    text = _DIACRITICS.sub("", text).translate(_LETTERS)
+    text = _NON_WORD.sub(" ", text.lower())
+    # "عبد الله" and "عبدالله" are the same name
+    return _ABD.sub("عبد", " ".join(text.split()))
+
+
+def trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class VolunteerRoster:
+    """Volunteers keyed by a stable id, searchable by normalized name.
+
+    `records` maps volunteer_id -> {'id', 'name', 'aliases', 'confirmed'}
+    (normally a PersistentDict). Names registered only because someone typed
+    them (an attendance list, possibly a guest or a typo) stay unconfirmed
+    until the volunteer identifies themselves; members() lists the confirmed
+    ones. In memory the roster keeps an exact lookup by
+    normalized spelling and a trigram -> aliases index; fuzzy search
+    scores candidates by the Dice coefficient of their trigram sets.
+    New volunteers get their id from `allocate` (e.g. a leased sequence
+    shared by several processes) or else the next number after the
+    largest known id.
+    """
+
+    def __init__(
+        self,
+        records: MutableMapping[int, Dict],
+        threshold: float = DEFAULT_THRESHOLD,
+        allocate: Optional[Callable[[], int]] = None,
+    ):
+        self._records = records
+        self.threshold = threshold
+        self.allocate = allocate
+        self.reload()
+
+    def reload(self) -> None:
+        """Drop the name indexes; they are rebuilt from the records on next use."""
+        self._built = False
+
+    def _build(self) -> None:
+        # Built on first lookup so a cold start does not pay for it
+        if self._built:
+            return
+        self._built = True
+        self._exact: Dict[str, int] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._index: Dict[str, Set[str]] = defaultdict(set)
+        self._owner: Dict[str, int] = {}
+        self._last_id = 0
+        for volunteer_id in sorted(self._records):
+            record = self._records[volunteer_id]
+            self._last_id = max(self._last_id, volunteer_id)
+            for alias in record['aliases']:
+                self._add_alias(volunteer_id, alias)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _add_alias(self, volunteer_id: int, alias: str) -> None:
+        self._exact[alias] = volunteer_id
+        self._owner[alias] = volunteer_id
+        grams = self._grams[alias] = trigrams(alias)
+        for gram in grams:
+            self._index[gram].add(alias)
+
+    def members(self) -> List[int]:
+        """Confirmed volunteers."""
+        return [volunteer_id for volunteer_id, record in self._records.items() if record.get('confirmed')]
+
+    def confirm(self, volunteer_id: int) -> None:
+        record = self._records.get(volunteer_id)
+        if record is not None and not record.get('confirmed'):
+            self._records[volunteer_id] = {**record, 'confirmed': True}
+
+    def get(self, volunteer_id: int) -> Optional[Dict]:
+        return self._records.get(volunteer_id)
+
+    def name(self, volunteer_id: int) -> str:
+        record = self._records.get(volunteer_id)
+        return record['name'] if record else str(volunteer_id)
+
+    def search(self, name: str, limit: int = 5, min_score: float = MIN_SCORE) -> List[Tuple[int, float]]:
+        """Best matching volunteers for a typed name as (volunteer_id, score), best first."""
+        query = normalize_arabic(name)
+        if not query:
+            return []
+        self._build()
+        exact = self._exact.get(query)
+        if exact is not None:
+            return [(exact, 1.0)]
+        grams = trigrams(query)
+        # A candidate scoring >= min_score shares at least `needed` trigrams with
+        # the query, so it must contain one of the query's rarest
+        # len(grams) - needed + 1 trigrams; common ones are never scanned.
+        needed = math.ceil(min_score * len(grams) / (2 - min_score))
+        rarest = sorted(grams, key=lambda gram: len(self._index.get(gram, ())))[:len(grams) - needed + 1]
+        candidates: Set[str] = set()
+        for gram in rarest:
+            candidates.update(self._index.get(gram, ()))
+        best: Dict[int, float] = {}
+        for alias in candidates:
+            other = self._grams[alias]
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            volunteer_id = self._owner[alias]
+            if score >= min_score and score > best.get(volunteer_id, 0.0):
+                best[volunteer_id] = score
+        return sorted(best.items(), key=lambda item: -item[1])[:limit]
+
+    def add(self, name: str, confirmed: bool = True) -> int:
+        """Register a new volunteer under the typed name and return its id."""
+        self._build()
+        volunteer_id = self.allocate() if self.allocate is not None else self._last_id + 1
+        self._last_id = max(self._last_id, volunteer_id)
+        alias = normalize_arabic(name)
+        self._records[volunteer_id] = {
+            'id': volunteer_id,
+            'name': " ".join(name.split()),
+            'aliases': [alias],
+            'confirmed': confirmed,
+        }
+        self._add_alias(volunteer_id, alias)
+        return volunteer_id
+
+    def resolve(self, name: str, confirm: bool = False) -> Optional[int]:
+        """Map a typed name to a volunteer id, registering unknown names as new volunteers.
+
+        A close enough spelling of a known volunteer is remembered as an
+        alias, so the next identical spelling is an exact hit. `confirm`
+        marks the volunteer as confirmed (they typed their own name).
+        """
+        alias = normalize_arabic(name)
+        if not alias:
+            return None
+        matches = self.search(name, limit=1, min_score=self.threshold)
+        if matches and matches[0][1] >= self.threshold:
+            volunteer_id = matches[0][0]
+            if alias not in self._exact:
+                record = self._records[volunteer_id]
+                self._records[volunteer_id] = {**record, 'aliases': record['aliases'] + [alias]}
+                self._add_alias(volunteer_id, alias)
+            if confirm:
+                self.confirm(volunteer_id)
+            return volunteer_id
+        return self.add(name, confirmed=confirm)
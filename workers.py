@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import signal
+import logging
+import subprocess
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY = 1.0  # seconds before restarting a crashed worker, doubled up to MAX_RESTART_DELAY
+MAX_RESTART_DELAY = 30.0
+STOP_TIMEOUT = 15.0  # seconds workers get to shut down cleanly
+
+
+class WorkerSupervisor:
+    """Runs `count` copies of the bot, each a separate process on the same port.
+
+    Every worker binds the port with SO_REUSEPORT, so the kernel spreads
+    incoming webhook connections over them. Workers learn their index from
+    the WORKER_INDEX environment variable; a worker that exits unexpectedly
+    is restarted with backoff, and SIGTERM/SIGINT are passed on to all of
+    them.
+    """
+
+    def __init__(self, count: int, argv: Optional[List[str]] = None):
+        self.count = count
+        self.argv = argv or [sys.executable, *sys.argv]
+        self._procs: Dict[int, subprocess.Popen] = {}
+        self._delays: Dict[int, float] = {}
+        self._stopping = False
+
+    def _spawn(self, index: int) -> None:
+        env = {**os.environ, 'WORKER_INDEX': str(index), 'WORKERS': str(self.count)}
+        self._procs[index] = subprocess.Popen(self.argv, env=env)
+        logger.info(f"Started worker {index} (pid {self._procs[index].pid})")
+
+    def _stop(self, signum, frame) -> None:
+        self._stopping = True
+        for proc in self._procs.values():
+            if proc.poll() is None:
+                proc.send_signal(signum)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for index in range(self.count):
+            self._spawn(index)
+        while not self._stopping:
+            time.sleep(0.5)
+            for index, proc in list(self._procs.items()):
+                code = proc.poll()
+                if code is None or self._stopping:
+                    continue
+                delay = self._delays.get(index, RESTART_DELAY)
+                logger.error(f"Worker {index} exited with code {code}, restarting in {delay:.0f}s")
+                time.sleep(delay)
+                self._delays[index] = min(delay * 2, MAX_RESTART_DELAY)
+                self._spawn(index)
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for index, proc in self._procs.items():
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker {index} did not stop in time, killing it")
+                proc.kill()